@@ -1,5 +1,5 @@
 # --- IMPORTS (ALL AT THE TOP) ---
-from flask import Flask, render_template, request, jsonify, send_from_directory, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_from_directory, session, redirect, url_for, g
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -7,6 +7,7 @@ import os
 from dotenv import load_dotenv
 import google.generativeai as genai
 import json
+import random
 import re
 from werkzeug.utils import secure_filename
 from PIL import Image, ImageEnhance, ImageFilter, ImageOps
@@ -23,7 +24,9 @@ from models.discount_calculator import SmartDiscountCalculator
 from models.location_service import LocationService
 from models.bundle_calculator import BundleCalculator
 from models.product_tracker import ProductTracker
+from models.job_queue import JobQueue, QueueFullError
 from models.birefnet_bg_removal import run_birefnet
+from models.request_timing import TIMING_LOG, add_spans, record_timing, span, start_recording, stop_recording
 
 load_dotenv() # Load environment variables from .env file
 
@@ -55,9 +58,55 @@ if os.environ.get('GOOGLE_API_KEY'):
 else:
     print("⚠️ Warning: GOOGLE_API_KEY not found. Some AI features may not work.")
 
+# 4. REQUEST TIMING
+# Server-Timing header on API and Photogenix responses (SERVER_TIMING=0 turns it off);
+# TIMING_LOG names a JSON-lines file for per-request timing records
+app.config['SERVER_TIMING'] = os.environ.get('SERVER_TIMING', '1').lower() not in ('0', 'false', 'no', 'off')
+app.config['TIMING_LOG'] = TIMING_LOG
+TIMED_PATHS = ('/api/', '/process/', '/jobs')
+
+@app.before_request
+def start_request_timing():
+    if (app.config['SERVER_TIMING'] or app.config['TIMING_LOG']) and request.path.startswith(TIMED_PATHS):
+        g.timing = start_recording()
+
+@app.after_request
+def add_server_timing(response):
+    """Server-Timing header and optional timing log record of a timed request"""
+    timing = g.get('timing')
+    if timing is None:
+        return response
+    recorder = timing[0]
+    if app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = recorder.header()
+    if app.config['TIMING_LOG']:
+        record_timing({'method': request.method, 'path': request.path, 'status': response.status_code,
+                       'total_ms': round(recorder.elapsed_ms(), 1), 'spans': recorder.rounded()},
+                      app.config['TIMING_LOG'])
+    return response
+
+@app.teardown_request
+def stop_request_timing(exc):
+    timing = g.pop('timing', None)
+    if timing is not None:
+        stop_recording(timing[1])
+
 # Initialize models
 health_analyzer = ProductHealthAnalyzer()
 discount_calculator = SmartDiscountCalculator()
+# 'local' answers with the local discount model and leaves Gemini's reasoning and sales
+# strategies for that discount to a background job (polled at /api/discount-reasoning/<id>);
+# 'gemini' waits for Gemini to choose the discount itself
+app.config['DISCOUNT_MODE'] = os.environ.get('DISCOUNT_MODE', 'local')
+# Share of local-mode analyses that also queue a job asking Gemini for its own discount from
+# the product's full details (cache bypassed); it is only logged, to calibrate the local model
+app.config['DISCOUNT_CALIBRATION_RATE'] = float(os.environ.get('DISCOUNT_CALIBRATION_RATE', 0.25))
+discount_reasoning_queue = JobQueue(
+    workers=int(os.environ.get('DISCOUNT_REASONING_WORKERS', 2)),
+    max_pending=64,
+    mode='thread',
+    retention_seconds=600,
+)
 festival_engine = FestivalPromotionEngine()
 location_service = LocationService()
 bundle_calculator = BundleCalculator()
@@ -153,6 +202,51 @@ def health_stats():
     }
     return jsonify(stats)
 
+def submit_discount_calibration(product_data, health_score, festival_result):
+    """Queue Gemini's own discount for a product, from its full details; logged, never shown"""
+    try:
+        # use_cache=False: shared answers are chosen from signature-level inputs only
+        discount_reasoning_queue.submit(
+            discount_calculator.calculate_discount, product_data, health_score, festival_result, False,
+            operation='discount_calibration')
+    except QueueFullError as e:
+        print(f"⚠️ Discount calibration skipped: {e}")
+
+def submit_discount_reasoning(product_data, health_score, festival_result, recommended_discount):
+    """Queue Gemini's reasoning for the discount shown; returns the fields telling the client where to fetch it"""
+    try:
+        job_id = discount_reasoning_queue.submit(
+            discount_calculator.explain_discount, product_data, health_score, festival_result, recommended_discount,
+            operation='discount_reasoning')
+    except QueueFullError as e:
+        print(f"⚠️ Discount reasoning not queued: {e}")
+        return {'reasoning_status': 'unavailable'}
+    # Its own job, queued after the reasoning, so the reasoning never waits for it
+    if random.random() < app.config['DISCOUNT_CALIBRATION_RATE']:
+        submit_discount_calibration(product_data, health_score, festival_result)
+    return {'reasoning_status': 'pending', 'reasoning_id': job_id,
+            'reasoning_url': url_for('discount_reasoning', job_id=job_id)}
+
+@app.route('/api/discount-reasoning/<job_id>')
+def discount_reasoning(job_id):
+    """Gemini's reasoning and sales strategies for an analysis; ?wait=N blocks up to N seconds (max 10)"""
+    wait = min(max(request.args.get('wait', 0, type=float), 0.0), 10.0)
+    job = discount_reasoning_queue.wait(job_id, wait)
+    if job is None:
+        return jsonify({'error': 'Reasoning not found or expired'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'status': 'failed', 'error': job['error']})
+    if job['status'] != 'done':
+        return jsonify({'status': job['status']})
+    result = job['result']
+    return jsonify({
+        'status': 'done',
+        'reasoning': result['reasoning'],
+        'sales_strategies': result['sales_strategies'],
+        # The discount the reasoning argues for: the analysis' recommended_discount
+        'recommended_discount': result['recommended_discount'],
+    })
+
 @app.route('/api/analyze-product', methods=['POST'])
 def analyze_product():
     """Analyze a single product's health and get recommendations"""
@@ -175,7 +269,8 @@ def analyze_product():
         
         try:
             # Analyze product health
-            health_score = health_analyzer.analyze_health(product_data)
+            with span('health'):
+                health_score = health_analyzer.analyze_health(product_data)
         except Exception as e:
             print(f"Health analysis error: {e}")
             # Fallback health score calculation
@@ -191,34 +286,45 @@ def analyze_product():
         
         try:
             # Get location data
-            location_data = location_service.get_location_info(product_data['location'])
+            with span('location'):
+                location_data = location_service.get_location_info(product_data['location'])
         except Exception as e:
             print(f"Location service error: {e}")
             location_data = {'name': product_data['location'], 'region': 'India'}
         
         try:
             # Get festival recommendations
-            festival_result = festival_engine.get_festival_recommendations(
-                product_data, location_data
-            )
+            with span('festival'):
+                festival_result = festival_engine.get_festival_recommendations(
+                    product_data, location_data
+                )
         except Exception as e:
             print(f"Festival engine error: {e}")
             festival_result = {'upcoming_festivals': [], 'recommended_festivals': []}
         
         try:
             # Get product-specific festival opportunities
-            product_opportunities = festival_engine.get_product_festival_opportunities(
-                product_data['name'], product_data['location']
-            )
+            with span('festival_opportunities'):
+                product_opportunities = festival_engine.get_product_festival_opportunities(
+                    product_data['name'], product_data['location']
+                )
         except Exception as e:
             print(f"Product festival opportunities error: {e}")
             product_opportunities = {'opportunities': [], 'total_opportunities': 0}
         
         try:
             # Get discount recommendations
-            discount_result = discount_calculator.calculate_discount(
-                product_data, health_score, festival_result
-            )
+            with span('discount'):
+                if app.config['DISCOUNT_MODE'] == 'local':
+                    discount_result = discount_calculator.quick_discount(
+                        product_data, health_score, festival_result
+                    )
+                    discount_result.update(submit_discount_reasoning(
+                        product_data, health_score, festival_result, discount_result['recommended_discount']))
+                else:
+                    discount_result = discount_calculator.calculate_discount(
+                        product_data, health_score, festival_result
+                    )
         except Exception as e:
             print(f"Discount calculator error: {e}")
             # Fallback discount calculation
@@ -251,20 +357,22 @@ def analyze_product():
             else:
                 festival_name = None
                 
-            bundle_result = bundle_calculator.calculate_bundle_recommendations(
-                product_data,
-                location=product_data['location'],
-                festival=festival_name
-            )
+            with span('bundle'):
+                bundle_result = bundle_calculator.calculate_bundle_recommendations(
+                    product_data,
+                    location=product_data['location'],
+                    festival=festival_name
+                )
         except Exception as e:
             print(f"Bundle calculator error: {e}")
             bundle_result = {'bundles': [], 'total_bundles': 0}
         
         try:
             # Calculate rescue score
-            rescue_score = health_analyzer.calculate_rescue_score(
-                product_data, festival_result, discount_result
-            )
+            with span('rescue'):
+                rescue_score = health_analyzer.calculate_rescue_score(
+                    product_data, festival_result, discount_result
+                )
         except Exception as e:
             print(f"Rescue score error: {e}")
             rescue_score = health_score * 100
@@ -693,12 +801,28 @@ def download_file(filename):
 
 
 # -------------------------------------Photogenix--------------------------------------
-from flask import Flask, render_template, request, send_from_directory, jsonify
+from flask import Flask, render_template, request, send_from_directory, jsonify, Response, stream_with_context
 import os
+import threading
 from werkzeug.utils import secure_filename
 from PIL import Image, ImageEnhance, ImageFilter, ImageOps
 import io
-from models.birefnet_bg_removal import remove_background_birefnet, run_birefnet
+from models.birefnet_bg_removal import remove_background_birefnet, run_birefnet, MASK_MODES, QUALITY_TIERS
+from models.mask_cache import get_mask_cache
+from models.batch_processor import BatchProcessor, parse_operations
+from models.background_library import get_background_library
+from models.job_queue import JobQueue, QueueFullError
+from models.photogenix_jobs import OPERATIONS, RECIPE_STEPS, init_worker, model_status, run_stored_operation
+from models.asset_store import AssetStore
+from models.onnx_session import quantized_model_available, session_settings
+from models.llm_gateway import LLMError, get_llm_gateway
+from models.creative_cache import CREATIVE_MAX_SIDE, get_creative_cache, image_signature, model_image
+from models.photogenix_ops import CROP_FOCUSES, PLATFORM_SIZES
+from models.output_encoder import output_options
+from models.segmentation_cascade import SEGMENTATION_MODES
+from models.upload_guard import (
+    MAX_IMAGE_PIXELS, SpooledUploadRequest, UploadRejected, asset_path, open_image, read_asset, read_image_upload,
+)
 import numpy as np
 import cv2
 import google.generativeai as genai
@@ -710,10 +834,70 @@ load_dotenv()
 
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['PROCESSED_FOLDER'] = 'processed'
+app.config['MASK_CACHE_FOLDER'] = os.environ.get('MASK_CACHE_DIR', '/tmp/mask_cache' if os.environ.get('RENDER') else 'mask_cache')
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['PROCESSED_FOLDER'], exist_ok=True)
 
+# Uploads are decoded from memory (spooled to a temp file past UPLOAD_SPOOL_MB);
+# originals are only written to UPLOAD_FOLDER when PERSIST_UPLOADS is set
+app.request_class = SpooledUploadRequest
+app.config['PERSIST_UPLOADS'] = os.environ.get('PERSIST_UPLOADS', '').lower() in ('1', 'true', 'yes')
+app.config['MAX_IMAGE_PIXELS'] = MAX_IMAGE_PIXELS
+if os.environ.get('MAX_UPLOAD_MB'):
+    app.config['MAX_CONTENT_LENGTH'] = int(float(os.environ['MAX_UPLOAD_MB']) * 1024 * 1024)
+
+# Default BiRefNet mask mode; requests can override it with a mask_mode form field
+app.config['MASK_MODE'] = os.environ.get('BIREFNET_MASK_MODE', 'full')
+# 'high' runs the fp32 BiRefNet model, 'fast' its INT8 copy (benchmarks/quantize_birefnet.py)
+app.config['QUALITY_TIER'] = os.environ.get('BIREFNET_QUALITY_TIER', 'high')
+# 'cascade' tries the cheap threshold mask first and only escalates unsure images to BiRefNet
+app.config['SEGMENTATION_MODE'] = os.environ.get('SEGMENTATION_MODE', 'birefnet')
+
+# Shared BiRefNet mask cache (memory LRU + compressed masks on disk)
+mask_cache = get_mask_cache(app.config['MASK_CACHE_FOLDER'])
+
+# Background catalogue: decoded and colour-indexed once, rebuilt when the folder changes
+background_library = get_background_library()
+
+# Catalog batch pipeline: batched BiRefNet calls, decode/encode on a thread pool
+app.config['BATCH_MAX_IMAGES'] = int(os.environ.get('BATCH_MAX_IMAGES', 500))
+# Processed outputs live under a hash of input + parameters and are never overwritten
+asset_store = AssetStore(app.config['PROCESSED_FOLDER'])
+# Asset key -> job id of identical requests still being processed; request threads share it
+pending_assets = {}
+pending_assets_lock = threading.Lock()
+
+batch_processor = BatchProcessor(
+    app.config['PROCESSED_FOLDER'],
+    batch_size=int(os.environ.get('BATCH_SIZE', 4)),
+    workers=int(os.environ.get('BATCH_WORKERS', 4)),
+    asset_store=asset_store,
+)
+
+# Single-image jobs run on a bounded process pool; each worker keeps a warm BiRefNet session
+app.config['JOB_INLINE_WAIT'] = float(os.environ.get('JOB_INLINE_WAIT', 5))
+job_queue = JobQueue(
+    workers=int(os.environ.get('JOB_WORKERS', 1)),
+    max_pending=int(os.environ.get('JOB_MAX_PENDING', 32)),
+    mode=os.environ.get('JOB_EXECUTOR', 'process'),
+    initializer=init_worker,
+    initargs=('birefnet-general', app.config['MASK_CACHE_FOLDER']),
+)
+# Warm-up jobs submitted at startup; their results are the per-worker model status
+model_warmup_jobs = []
+
+def warm_up_models():
+    """
+    Load and warm the BiRefNet session on every job worker in the background,
+    so the first seller after a restart gets steady-state latency. Called once
+    per server process (gunicorn post_worker_init or the development server).
+    """
+    if os.environ.get('MODEL_WARMUP', '1').lower() in ('0', 'false', 'no', 'off'):
+        return
+    for _ in range(job_queue.workers):
+        model_warmup_jobs.append(job_queue.submit(model_status, 'birefnet-general', operation='warmup'))
+
 # Configure Google Generative AI if API key is available
 if os.environ.get('GOOGLE_API_KEY'):
     genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
@@ -736,218 +920,386 @@ def upload():
         saved_files.append(filename)
     return jsonify({'uploaded': saved_files})
 
-@app.route('/process/background_removal', methods=['POST'])
-def background_removal_real():
+def asset_roots():
+    """URL prefix -> folder of the images a request can name in its asset field instead of uploading"""
+    return {
+        '/processed': app.config['PROCESSED_FOLDER'],
+        '/static/img': os.path.join(app.static_folder, 'img'),
+        '/uploads': app.config['UPLOAD_FOLDER'],
+    }
+
+def asset_ref(ref):
+    """Asset field value as a URL path; a bare '<key>/<name>' (as in processed_filenames) is a processed asset"""
+    ref = ref.strip()
+    return ref if ref.startswith('/') or '://' in ref else f'/processed/{ref}'
+
+def requested_image():
+    """
+    (filename, bytes) of the image file in the request, or of the image the
+    asset field names: a processed result, a /static/img sample or an /upload
+    file, read on the server so the client does not send it again. None when
+    the request has neither.
+
+    Raises:
+        UploadRejected: If the image or reference is unusable (AssetNotFound: 404)
+    """
     file = request.files.get('image')
-    if not file:
+    if file:
+        filename = secure_filename(file.filename) or 'image.png'
+        with span('upload'):
+            data = read_image_upload(file, app.config['MAX_IMAGE_PIXELS'])
+        if app.config['PERSIST_UPLOADS']:
+            with open(os.path.join(app.config['UPLOAD_FOLDER'], filename), 'wb') as f:
+                f.write(data)
+        return filename, data
+    if request.form.get('asset'):
+        with span('asset_read'):
+            return read_asset(asset_ref(request.form['asset']), asset_roots(), app.config['MAX_IMAGE_PIXELS'])
+    return None
+
+def submit_photogenix_job(operation, filename, data, params):
+    """
+    Queue a Photogenix operation on an image from requested_image().
+
+    Returns (job_id, None), or (None, stored result) when the same image was
+    already processed with the same parameters; an identical request still
+    in flight is joined instead of queued twice.
+    """
+    with span('asset_lookup'):
+        key = asset_store.make_key(data, operation, params)
+        stored = asset_store.lookup(key)
+    if stored is not None:
+        return None, stored
+    # One lock over lookup, purge and insert, so identical concurrent requests queue one job
+    with pending_assets_lock:
+        pending = job_queue.get(pending_assets.get(key, ''))
+        if pending is not None and pending['status'] in ('queued', 'running'):
+            return pending['job_id'], None
+
+        for stale_key in [k for k, job_id in pending_assets.items()
+                          if (job_queue.get(job_id) or {}).get('status') not in ('queued', 'running')]:
+            pending_assets.pop(stale_key, None)
+        job_id = job_queue.submit(run_stored_operation, operation, data, filename, params,
+                                  app.config['PROCESSED_FOLDER'], key, operation=operation, asset_key=key)
+        pending_assets[key] = job_id
+    return job_id, None
+
+def result_payload(result):
+    """processed_url(s) and per-output encoding stats of a finished result"""
+    payload = {
+        'processed_url': f"/processed/{result['processed_filename']}",
+        'processed_urls': [f'/processed/{name}' for name in result['processed_filenames']],
+        # Encoded size and encode time of each output
+        'encodings': [
+            {key: encoding[key] for key in ('format', 'mimetype', 'bytes', 'encode_ms')}
+            for encoding in result['encodings']
+        ],
+    }
+    if 'platforms' in result:
+        # One output per platform, in request order
+        payload['platform_urls'] = dict(zip(result['platforms'], payload['processed_urls']))
+    if 'segmentation' in result:
+        # Which cascade tier produced the mask, and how confident the threshold tier was
+        payload['segmentation'] = {key: result['segmentation'][key]
+                                   for key in ('tier', 'confidence') if key in result['segmentation']}
+    return payload
+
+def stored_payload(stored):
+    """Response for a request answered straight from the asset store"""
+    return dict(result_payload(stored), status='done', cached=True, asset_key=stored['key'])
+
+def job_payload(job):
+    """Public view of a job record"""
+    payload = {key: job[key] for key in ('job_id', 'operation', 'status', 'submitted_at',
+                                         'wait_time', 'run_time', 'error', 'asset_key')}
+    payload['status_url'] = f"/jobs/{job['job_id']}"
+    if job['status'] == 'done':
+        payload.update(result_payload(job['result']))
+    return payload
+
+def requested_mask_mode():
+    """mask_mode form field ('full' or 'guided'), defaulting to BIREFNET_MASK_MODE"""
+    mask_mode = request.form.get('mask_mode', app.config['MASK_MODE']).lower()
+    if mask_mode not in MASK_MODES:
+        raise ValueError(f"Unknown mask_mode '{mask_mode}'. Supported: {', '.join(MASK_MODES)}")
+    return mask_mode
+
+def requested_precision():
+    """quality_tier form field ('high' or 'fast') as the BiRefNet weights to run"""
+    tier = request.form.get('quality_tier', app.config['QUALITY_TIER']).lower()
+    if tier not in QUALITY_TIERS:
+        raise ValueError(f"Unknown quality_tier '{tier}'. Supported: {', '.join(QUALITY_TIERS)}")
+    precision = QUALITY_TIERS[tier]
+    if precision != 'fp32' and not quantized_model_available('birefnet-general'):
+        raise ValueError(f"quality_tier '{tier}' is not available: no {precision} model is installed")
+    return precision
+
+def requested_segmentation():
+    """segmentation form field ('birefnet' or 'cascade'), defaulting to SEGMENTATION_MODE"""
+    segmentation = request.form.get('segmentation', app.config['SEGMENTATION_MODE']).lower()
+    if segmentation not in SEGMENTATION_MODES:
+        raise ValueError(f"Unknown segmentation '{segmentation}'. Supported: {', '.join(SEGMENTATION_MODES)}")
+    return segmentation
+
+def requested_output_options():
+    """format, quality and png_compression form fields plus the Accept header"""
+    return output_options(
+        request.form.get('format'),
+        request.form.get('quality'),
+        request.form.get('png_compression'),
+        request.headers.get('Accept', ''),
+    )
+
+def requested_platforms():
+    """platforms (comma-separated) or platform form field, validated against PLATFORM_SIZES"""
+    raw_platforms = request.form.get('platforms') or request.form.get('platform', 'meesho')
+    platforms = [p.strip() for p in raw_platforms.lower().split(',') if p.strip()] or ['meesho']
+    unknown = [p for p in platforms if p not in PLATFORM_SIZES]
+    if unknown:
+        raise ValueError(f"Unknown platform(s): {', '.join(unknown)}. Supported: {', '.join(PLATFORM_SIZES)}")
+    # Duplicates would only overwrite the same output
+    return list(dict.fromkeys(platforms))
+
+def requested_crop_focus():
+    """crop_focus form field ('product' or 'center'), defaulting to the product"""
+    crop_focus = request.form.get('crop_focus', 'product').lower()
+    if crop_focus not in CROP_FOCUSES:
+        raise ValueError(f"Unknown crop_focus '{crop_focus}'. Supported: {', '.join(CROP_FOCUSES)}")
+    return crop_focus
+
+def recipe_params():
+    """steps, platforms, crop_focus, background and preset form fields of a recipe request"""
+    steps = parse_operations(request.form.get('steps', ''), allowed=RECIPE_STEPS)
+    if steps.count('crop') > 1:
+        # Each crop forks one output per platform; a second would overwrite the first's outputs
+        raise ValueError("A recipe can have only one 'crop' step")
+    return {
+        'steps': steps,
+        'platforms': requested_platforms(),
+        'crop_focus': requested_crop_focus(),
+        'background': request.form.get('background', 'white.jpg'),
+        'preset': request.form.get('preset', 'clean_studio'),
+    }
+
+def run_photogenix_job(operation, params=None):
+    """
+    Thin synchronous wrapper: queue the job, wait up to JOB_INLINE_WAIT seconds,
+    then answer with the processed_url or a 202 pointing at the job status.
+    """
+    if not request.files.get('image') and not request.form.get('asset'):
         return jsonify({'error': 'No image uploaded'}), 400
-    filename = secure_filename(file.filename)
-    input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(input_path)
-    # Open image
-    img = Image.open(input_path).convert('RGBA')
-    # Run BiRefNet to get mask
-    mask = run_birefnet(img)
-    # Ensure mask is single channel, same size as img
-    mask = mask.resize(img.size, Image.BILINEAR).convert('L')
-    # Apply mask as alpha channel
-    img.putalpha(mask)
-    processed_filename = 'bgremoved_' + filename
-    processed_path = os.path.join(app.config['PROCESSED_FOLDER'], processed_filename)
-    img.save(processed_path, 'PNG')
-    return jsonify({'processed_url': f'/processed/{processed_filename}'})
+    try:
+        params = dict(params or {}, mask_mode=requested_mask_mode(), output=requested_output_options(),
+                      segmentation=requested_segmentation())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        job_id, stored = submit_photogenix_job(operation, *requested_image(), params)
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    if stored is not None:
+        return jsonify(stored_payload(stored))
+    inline_wait = 0 if request.args.get('async') else app.config['JOB_INLINE_WAIT']
+    job = job_queue.wait(job_id, inline_wait)
+    if job['status'] == 'done':
+        # Queue wait and the worker's own stages go into this response's Server-Timing
+        add_spans(dict({'queue': job['wait_time'] * 1000}, **job['result'].get('timings', {})))
+        return jsonify(job_payload(job))
+    if job['status'] == 'failed':
+        return jsonify(dict(job_payload(job), error=job['error'])), 500
+    return jsonify(job_payload(job)), 202
+
+@app.route('/process/background_removal', methods=['POST'])
+def background_removal_real():
+    try:
+        precision = requested_precision()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return run_photogenix_job('background_removal', {'precision': precision})
 
 @app.route('/process/enhance', methods=['POST'])
 def enhance():
-    file = request.files.get('image')
-    if not file:
-        return jsonify({'error': 'No image uploaded'}), 400
-    filename = secure_filename(file.filename)
-    input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(input_path)
-    # Open image and convert to RGB for enhancement
-    img = Image.open(input_path).convert('RGB')
-    # Stronger enhancement: much higher brightness, contrast, color, and sharpness
-    img = ImageEnhance.Brightness(img).enhance(1.25)
-    img = ImageEnhance.Contrast(img).enhance(1.35)
-    img = ImageEnhance.Color(img).enhance(1.35)
-    img = ImageEnhance.Sharpness(img).enhance(2.0)
-    # Save processed image as PNG
-    processed_filename = 'enhanced_' + filename.rsplit('.', 1)[0] + '.png'
-    processed_path = os.path.join(app.config['PROCESSED_FOLDER'], processed_filename)
-    img.save(processed_path, 'PNG')
-    return jsonify({'processed_url': f'/processed/{processed_filename}'})
+    return run_photogenix_job('enhance')
 
 @app.route('/process/replace_background', methods=['POST'])
 def replace_background():
-    file = request.files.get('image')
-    bg_name = request.form.get('background', 'white.jpg')
-    if not file:
-        return jsonify({'error': 'No image uploaded'}), 400
-    filename = secure_filename(file.filename)
-    input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(input_path)
-    img = Image.open(input_path).convert('RGBA')
-    # Run BiRefNet to get mask
-    mask = run_birefnet(img)
-    mask = mask.resize(img.size, Image.BILINEAR).convert('L')
-    # Load selected background
-    bg_path = os.path.join('static', 'backgrounds', bg_name)
-    if not os.path.exists(bg_path):
-        bg_path = os.path.join('static', 'backgrounds', 'white.jpg')
-    bg = Image.open(bg_path).convert('RGB').resize(img.size)
-    # Composite product onto background
-    product_rgba = img.copy()
-    product_rgba.putalpha(mask)
-    composite = Image.alpha_composite(bg.convert('RGBA'), product_rgba)
-    # Add drop shadow (OpenCV)
-    arr = np.array(composite)
-    shadow = cv2.GaussianBlur(arr[:,:,3], (21,21), 10)
-    arr[:,:,3] = np.maximum(arr[:,:,3], shadow)
-    composite = Image.fromarray(arr)
-    # Enhance color/tone
-    composite = ImageEnhance.Brightness(composite).enhance(1.08)
-    composite = ImageEnhance.Contrast(composite).enhance(1.12)
-    composite = ImageEnhance.Color(composite).enhance(1.15)
-    processed_filename = 'bgreplace_' + filename.rsplit('.', 1)[0] + '.png'
-    processed_path = os.path.join(app.config['PROCESSED_FOLDER'], processed_filename)
-    composite.save(processed_path, 'PNG')
-    return jsonify({'processed_url': f'/processed/{processed_filename}'})
+    return run_photogenix_job('replace_background', {
+        'background': request.form.get('background', 'white.jpg'),
+    })
 
 @app.route('/process/crop_resize', methods=['POST'])
 def crop_resize():
-    file = request.files.get('image')
-    platform = request.form.get('platform', 'meesho').lower()
-    if not file:
-        return jsonify({'error': 'No image uploaded'}), 400
-    filename = secure_filename(file.filename)
-    input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(input_path)
-    img = Image.open(input_path).convert('RGB')
-    # Define platform sizes
-    sizes = {
-        'meesho': (1024, 1365),
-        'meesho4x4': (1000, 1000),
-        'amazon': (1000, 1000),
-        'instagram': (1080, 1080),
-        'shopify': (2048, 2048),
-        'flipkart': (2000, 2000),
-    }
-    size = sizes.get(platform, sizes['meesho'])
-    # Center crop to aspect ratio, then resize
-    w, h = img.size
-    target_w, target_h = size
-    target_ratio = target_w / target_h
-    img_ratio = w / h
-    if img_ratio > target_ratio:
-        # Image is wider than target: crop width
-        new_w = int(h * target_ratio)
-        left = (w - new_w) // 2
-        top = 0
-        right = left + new_w
-        bottom = h
-    else:
-        # Image is taller than target: crop height
-        new_h = int(w / target_ratio)
-        left = 0
-        top = (h - new_h) // 2
-        right = w
-        bottom = top + new_h
-    img_cropped = img.crop((left, top, right, bottom)).resize(size, Image.LANCZOS)
-    processed_filename = f'cropped_{platform}_' + filename.rsplit('.', 1)[0] + '.png'
-    processed_path = os.path.join(app.config['PROCESSED_FOLDER'], processed_filename)
-    img_cropped.save(processed_path, 'PNG')
-    return jsonify({'processed_url': f'/processed/{processed_filename}'})
+    """Crop and resize one upload for every platform in platforms, centred on the product by default"""
+    try:
+        params = {'platforms': requested_platforms(), 'crop_focus': requested_crop_focus()}
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return run_photogenix_job('crop_resize', params)
+
+@app.route('/process/recipe', methods=['POST'])
+def recipe():
+    """Run an ordered list of steps on one upload, decoding once and encoding only the final outputs"""
+    try:
+        params = recipe_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return run_photogenix_job('recipe', params)
 
 @app.route('/process/batch', methods=['POST'])
 def batch_process():
-    # Stub: Replace with real batch processing logic
-    return jsonify({'status': 'Batch processing stub'})
+    """Run an operation list over many images (uploaded, or named in assets), streaming one NDJSON line per image"""
+    files = [f for f in request.files.getlist('images') if f and f.filename]
+    try:
+        asset_paths = [asset_path(asset_ref(ref), asset_roots()) for ref in request.form.getlist('assets') if ref.strip()]
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), e.status_code
+    if not files and not asset_paths:
+        return jsonify({'error': 'No images uploaded'}), 400
+    if len(files) + len(asset_paths) > app.config['BATCH_MAX_IMAGES']:
+        return jsonify({'error': f"At most {app.config['BATCH_MAX_IMAGES']} images per batch"}), 400
+    try:
+        operations = parse_operations(request.form.get('operations', 'remove'))
+        mask_mode = requested_mask_mode()
+        output = requested_output_options()
+        segmentation = requested_segmentation()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    background = request.form.get('background', 'white.jpg')
+    platform = request.form.get('platform', 'meesho').lower()
 
-import numpy as np
-from PIL import Image
-import os
+    # Detach the upload streams: Flask closes request.files when the view
+    # returns, but the streamed response keeps reading them afterwards.
+    uploads = []
+    for f in files:
+        uploads.append((secure_filename(f.filename), f.stream))
+        f.stream = io.BytesIO()
 
-def get_dominant_color(img):
-    img = img.convert('RGB').resize((64, 64))
-    arr = np.array(img)
-    arr = arr.reshape((-1, 3))
-    arr = arr[(arr < 250).any(axis=1)]  # Ignore near-white
-    if len(arr) == 0:
-        return (255, 255, 255)
-    color = tuple(np.mean(arr, axis=0).astype(int))
-    return color
-
-def pick_best_background(product_img, backgrounds_dir='static/backgrounds/'):
-    dominant = get_dominant_color(product_img)
-    best_bg = None
-    best_score = -1
-    for bg_name in os.listdir(backgrounds_dir):
-        if not (bg_name.endswith('.jpg') or bg_name.endswith('.png') or bg_name.endswith('.jpeg')):
-            continue
-        bg_path = os.path.join(backgrounds_dir, bg_name)
-        bg_img = Image.open(bg_path).resize(product_img.size)
-        bg_color = get_dominant_color(bg_img)
-        score = np.linalg.norm(np.array(dominant) - np.array(bg_color))
-        if score > best_score:
-            best_score = score
-            best_bg = bg_path
-    return best_bg
+    def read_uploads():
+        # Uploads are read lazily so only the decode window is held in memory; assets are
+        # only opened here, and upload streams left over by an aborted response are closed
+        try:
+            for filename, stream in uploads:
+                with stream:
+                    yield filename, stream.read()
+            for path in asset_paths:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                yield os.path.basename(path), data
+        finally:
+            for _, stream in uploads:
+                stream.close()
+
+    def generate():
+        items = read_uploads()
+        for result in batch_processor.process(items, operations, background=background,
+                                              platform=platform, mask_mode=mask_mode, output=output,
+                                              segmentation=segmentation):
+            processed_filename = result.pop('processed_filename', None)
+            if processed_filename:
+                result['processed_url'] = f'/processed/{processed_filename}'
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/process/make_professional', methods=['POST'])
 def make_professional():
-    file = request.files.get('image')
-    bg_choice = request.form.get('background', 'white.jpg')
-    preset = request.form.get('preset', 'clean_studio')
-    if not file:
+    return run_photogenix_job('make_professional', {
+        'preset': request.form.get('preset', 'clean_studio'),
+    })
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue any Photogenix operation and return its job id immediately"""
+    operation = request.form.get('operation', '')
+    if operation not in OPERATIONS:
+        return jsonify({'error': f"Unknown operation '{operation}'. Supported: {', '.join(OPERATIONS)}"}), 400
+    if not request.files.get('image') and not request.form.get('asset'):
         return jsonify({'error': 'No image uploaded'}), 400
-    filename = secure_filename(file.filename)
-    input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(input_path)
-    # Open image
-    img = Image.open(input_path).convert('RGBA')
-    # Run BiRefNet to get mask
-    mask = run_birefnet(img)
-    mask = mask.resize(img.size, Image.BILINEAR).convert('L')
-    # Load background
-    bg_path = pick_best_background(img)
-    if not os.path.exists(bg_path):
-        bg_path = os.path.join('static', 'backgrounds', 'white.jpg')
-    bg = Image.open(bg_path).convert('RGB').resize(img.size)
-    # Composite product onto background
-    product_rgba = img.copy()
-    product_rgba.putalpha(mask)
-    composite = Image.alpha_composite(bg.convert('RGBA'), product_rgba)
-    # Add drop shadow (OpenCV)
-    arr = np.array(composite)
-    shadow = cv2.GaussianBlur(arr[:,:,3], (21,21), 10)
-    arr[:,:,3] = np.maximum(arr[:,:,3], shadow)
-    composite = Image.fromarray(arr)
-    # Enhance color/tone
-    composite = ImageEnhance.Brightness(composite).enhance(1.08)
-    composite = ImageEnhance.Contrast(composite).enhance(1.12)
-    composite = ImageEnhance.Color(composite).enhance(1.15)
-    # Style presets
-    if preset == 'luxury_matte':
-        composite = ImageOps.colorize(composite.convert('L'), black='#222', white='#faf8ff')
-    elif preset == 'minimalist_white':
-        composite = ImageEnhance.Brightness(composite).enhance(1.15)
-        composite = ImageEnhance.Color(composite).enhance(1.05)
-    # Save processed image
-    processed_filename = 'professional_' + filename.rsplit('.', 1)[0] + '.png'
-    processed_path = os.path.join(app.config['PROCESSED_FOLDER'], processed_filename)
-    composite.save(processed_path, 'PNG')
-    return jsonify({'processed_url': f'/processed/{processed_filename}'})
+    params = {key: request.form[key] for key in ('background', 'preset') if key in request.form}
+    try:
+        params['mask_mode'] = requested_mask_mode()
+        params['segmentation'] = requested_segmentation()
+        params['output'] = requested_output_options()
+        if operation == 'crop_resize':
+            # Same platforms and focus as /process/crop_resize
+            params.update(platforms=requested_platforms(), crop_focus=requested_crop_focus())
+        if operation == 'recipe':
+            params.update(recipe_params())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        job_id, stored = submit_photogenix_job(operation, *requested_image(), params)
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    if stored is not None:
+        return jsonify(stored_payload(stored))
+    return jsonify(job_payload(job_queue.get(job_id))), 202
+
+@app.route('/jobs/stats')
+def job_stats():
+    """Queue depth, throughput counters and wait/run time percentiles"""
+    return jsonify(job_queue.stats())
+
+@app.route('/models/status')
+def models_status():
+    """ONNX Runtime settings, model load time and warm-up time of each job worker"""
+    workers = []
+    for job_id in model_warmup_jobs:
+        job = job_queue.get(job_id)
+        if job is None:
+            continue
+        entry = {'status': job['status'], 'error': job['error']}
+        if job['status'] == 'done':
+            entry.update({key: value for key, value in job['result'].items() if key != 'started_at'})
+        workers.append(entry)
+    return jsonify({
+        'settings': session_settings(),
+        'warmup_enabled': bool(model_warmup_jobs),
+        'workers': workers,
+    })
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status of a queued job; includes processed_url once done"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job_payload(job))
+
+# Every Gemini call goes through one gateway: per-call deadline, bounded concurrency,
+# shared in-flight calls for identical prompts and a circuit breaker
+llm_gateway = get_llm_gateway()
+
+# Gemini answers keyed by photo signature (layout hash and quadrant colours) and prompt version, with TTL and LRU eviction
+creative_cache = get_creative_cache()
+# Bump when the creative content prompt changes, so earlier answers are not served for it
+CREATIVE_PROMPT_VERSION = 1
 
 @app.route('/process/creative_content', methods=['POST'])
 def creative_content():
-    file = request.files.get('image')
-    if not file:
-        return jsonify({'error': 'No image uploaded'}), 400
+    try:
+        upload = requested_image()
+        if upload is None:
+            return jsonify({'error': 'No image uploaded'}), 400
+        with span('decode'):
+            image = open_image(upload[1], app.config['MAX_IMAGE_PIXELS'])
+            # Nothing below needs full resolution; JPEGs decode straight at a reduced scale
+            image.draft('RGB', (CREATIVE_MAX_SIDE, CREATIVE_MAX_SIDE))
+            image = image.convert('RGB')
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+    with span('cache_lookup'):
+        signature = image_signature(image)
+        cached = creative_cache.get(signature, CREATIVE_PROMPT_VERSION)
+    if cached is not None:
+        return jsonify(dict(cached, cached=True))
 
     try:
-        image = Image.open(file.stream).convert('RGB')
-        model = genai.GenerativeModel("gemini-1.5-flash")
         prompt = (
             "Given this product image, respond ONLY with a valid JSON object with the following fields: "
             "title, description, bullets (a list of 3 bullet points), tags (a list), and caption. "
@@ -963,8 +1315,11 @@ def creative_content():
         
         # Add timeout and error handling for Google AI API call
         try:
-            response = model.generate_content([prompt, image])
-            text = response.text.strip()
+            with span('prepare'):
+                image_data = model_image(image)
+            creative_cache.note_sent(len(image_data), len(upload[1]))
+            with span('gemini'):
+                text = llm_gateway.generate([prompt, {'mime_type': 'image/jpeg', 'data': image_data}])
         except Exception as ai_error:
             # Handle Google AI service errors (timeouts, service unavailable, etc.)
             error_type = type(ai_error).__name__
@@ -994,6 +1349,7 @@ def creative_content():
             if match:
                 json_str = match.group(0)
                 data = json.loads(json_str)
+                creative_cache.put(signature, CREATIVE_PROMPT_VERSION, data)
                 return jsonify(data)
             else:
                 raise ValueError("No JSON object found in response.")
@@ -1035,12 +1391,43 @@ def creative_content():
             }
         }), 500
 
+@app.route('/api/discount-cache-stats')
+def discount_cache_stats():
+    """Get hit rate and stored recommendations of the discount recommendation cache"""
+    if discount_calculator.cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(discount_calculator.cache.stats(), enabled=True))
+
+@app.route('/api/llm-stats')
+def llm_stats():
+    """Get Gemini call, coalescing, timeout and circuit breaker counters"""
+    return jsonify(llm_gateway.stats())
+
+@app.route('/api/creative-cache-stats')
+def creative_cache_stats():
+    """Get hit rate, entries and bytes sent to Gemini for creative content"""
+    return jsonify(creative_cache.stats())
+
+@app.route('/api/mask-cache-stats')
+def mask_cache_stats():
+    """Get hit/miss counters for the BiRefNet mask cache"""
+    return jsonify(mask_cache.stats())
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
-@app.route('/processed/<filename>')
+@app.route('/processed/<path:filename>')
 def processed_file(filename):
+    key, _, name = filename.partition('/')
+    if name and asset_store.is_key(key):
+        # Content-addressed asset: the path is derived from the content, so it
+        # doubles as a strong ETag and the file can be cached forever
+        response = send_from_directory(app.config['PROCESSED_FOLDER'], filename,
+                                       etag=filename, max_age=31536000)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
     return send_from_directory(app.config['PROCESSED_FOLDER'], filename)
 
 @app.route('/get-in-touch')
@@ -1090,10 +1477,12 @@ def generate_campaign_content():
         }}
         """
 
-        # Initialize Gemini model
-        model = genai.GenerativeModel("gemini-1.5-flash") # Using gemini-pro for text generation
-        response = model.generate_content(prompt)
-        raw_text = response.text.strip()
+        try:
+            with span('gemini'):
+                raw_text = llm_gateway.generate(prompt)
+        except LLMError as e:
+            print(f"⚠️ Campaign content unavailable: {e}")
+            return jsonify({'error': 'AI service temporarily unavailable. Please try again in a few minutes.'}), 503
 
         # Attempt to parse the JSON response. Gemini sometimes wraps it in markdown.
         try:
@@ -1123,6 +1512,9 @@ if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8050))
     debug_mode = os.environ.get("FLASK_ENV") == "development"
     print(f"Starting Flask development server on port {port}")
+    if not debug_mode or os.environ.get("WERKZEUG_RUN_MAIN"):
+        # Only in the process that serves requests, not the reloader parent
+        warm_up_models()
     app.run(host="0.0.0.0", port=port, debug=debug_mode)
 else:
     # Production deployment (Gunicorn)
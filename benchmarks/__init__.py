@@ -0,0 +1 @@
+# Benchmarks for the Photogenix image pipeline
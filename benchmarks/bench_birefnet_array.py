@@ -0,0 +1,97 @@
+"""
+BiRefNet Array Path Benchmark
+Compares the legacy PNG round-trip (remove_background_advanced + alpha split,
+what run_birefnet used to do) with the array-native predict_mask path.
+
+Usage:
+    python -m benchmarks.bench_birefnet_array --stub --sizes 1 4 12
+    python -m benchmarks.bench_birefnet_array --model birefnet-general --sizes 12
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_product_image, megapixel_size
+from benchmarks.stub_session import make_stub_remover
+
+
+def _time_call(func, repeat):
+    """Run func() repeat times and return (best seconds, last result)."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_benchmark(remover, sizes, repeat=3):
+    """
+    Time both paths for each image size.
+
+    Args:
+        remover (BiRefNetBackgroundRemover): Remover to benchmark
+        sizes (list): Image sizes in megapixels
+        repeat (int): Repetitions per measurement (best is reported)
+
+    Returns:
+        list: One result dict per size
+    """
+    results = []
+    for megapixels in sizes:
+        width, height = megapixel_size(megapixels)
+        img = make_product_image(width, height).convert('RGBA')
+        pixels = np.asarray(img)
+
+        legacy_s, legacy_rgba = _time_call(lambda: remover.remove_background_advanced(img).split()[-1], repeat)
+        array_s, array_mask = _time_call(lambda: remover.predict_mask(pixels), repeat)
+
+        legacy_mask = np.asarray(legacy_rgba)
+        mean_abs_diff = float(np.abs(legacy_mask.astype(np.int16) - array_mask.astype(np.int16)).mean())
+
+        results.append({
+            'megapixels': megapixels,
+            'size': [width, height],
+            'legacy_ms': round(legacy_s * 1000, 1),
+            'array_ms': round(array_s * 1000, 1),
+            'saved_ms': round((legacy_s - array_s) * 1000, 1),
+            'speedup': round(legacy_s / array_s, 2) if array_s else None,
+            'mask_mean_abs_diff': round(mean_abs_diff, 3),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 12], help='Image sizes in megapixels')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--stub', action='store_true', help='Use the offline stub session instead of BiRefNet')
+    parser.add_argument('--model', default='birefnet-general')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    if args.stub:
+        remover = make_stub_remover(args.model)
+    else:
+        from models.birefnet_bg_removal import BiRefNetBackgroundRemover
+        remover = BiRefNetBackgroundRemover(args.model)
+
+    results = run_benchmark(remover, args.sizes, args.repeat)
+
+    print(f"{'MP':>5} {'size':>11} {'legacy ms':>10} {'array ms':>9} {'saved ms':>9} {'speedup':>8} {'mask diff':>9}")
+    for row in results:
+        size = f"{row['size'][0]}x{row['size'][1]}"
+        print(f"{row['megapixels']:>5} {size:>11} {row['legacy_ms']:>10} {row['array_ms']:>9} "
+              f"{row['saved_ms']:>9} {row['speedup']:>8} {row['mask_mean_abs_diff']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'model': 'stub' if args.stub else args.model, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Fallback Removal Benchmark
+Times SimpleBackgroundRemover._fallback_removal (NumPy mask) against the
+original per-pixel getdata()/putdata() loop and checks both give identical
+pixels.
+
+Usage:
+    python -m benchmarks.bench_fallback_removal --sizes 1 4 12
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_product_image, megapixel_size
+from models.simple_bg_removal import SimpleBackgroundRemover
+
+
+def fallback_removal_loop(image, white_threshold=200):
+    """Reference implementation: the original pixel-by-pixel Python loop."""
+    img = image.convert('RGBA')
+    new_data = []
+    for item in img.getdata():
+        if item[0] > white_threshold and item[1] > white_threshold and item[2] > white_threshold:
+            new_data.append((255, 255, 255, 0))
+        else:
+            new_data.append(item)
+    img.putdata(new_data)
+    return img
+
+
+def run_benchmark(sizes, repeat=3, white_threshold=200):
+    """
+    Time both implementations for each image size.
+
+    Args:
+        sizes (list): Image sizes in megapixels
+        repeat (int): Repetitions for the vectorised path (best is reported)
+        white_threshold (int): Near-white threshold passed to both
+
+    Returns:
+        list: One result dict per size
+    """
+    remover = SimpleBackgroundRemover(white_threshold=white_threshold)
+    results = []
+    for megapixels in sizes:
+        width, height = megapixel_size(megapixels)
+        img = make_product_image(width, height)
+
+        start = time.perf_counter()
+        expected = fallback_removal_loop(img, white_threshold)
+        loop_s = time.perf_counter() - start
+
+        numpy_s = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            actual = remover._fallback_removal(img)
+            numpy_s = min(numpy_s, time.perf_counter() - start)
+
+        results.append({
+            'megapixels': megapixels,
+            'size': [width, height],
+            'loop_ms': round(loop_s * 1000, 1),
+            'numpy_ms': round(numpy_s * 1000, 1),
+            'speedup': round(loop_s / numpy_s, 1),
+            'identical': bool(np.array_equal(np.asarray(expected), np.asarray(actual))),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 12], help='Image sizes in megapixels')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--threshold', type=int, default=200)
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.repeat, args.threshold)
+
+    print(f"{'MP':>5} {'size':>11} {'loop ms':>9} {'numpy ms':>9} {'speedup':>8} {'identical':>9}")
+    for row in results:
+        size = f"{row['size'][0]}x{row['size'][1]}"
+        print(f"{row['megapixels']:>5} {size:>11} {row['loop_ms']:>9} {row['numpy_ms']:>9} "
+              f"{row['speedup']:>8} {str(row['identical']):>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'threshold': args.threshold, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
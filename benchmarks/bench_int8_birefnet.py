@@ -0,0 +1,109 @@
+"""
+BiRefNet INT8 vs FP32 Benchmark
+Accuracy and latency of the INT8 BiRefNet copy (benchmarks.quantize_birefnet)
+against the fp32 model on a local image set. The fp32 mask is the reference:
+IoU at 50% and mean absolute error in the band around its edges show what
+the 'fast' quality tier gives up, next to the per-image latency it saves.
+
+Usage:
+    python -m benchmarks.bench_int8_birefnet
+    python -m benchmarks.bench_int8_birefnet --images /data/catalog --limit 50 --output int8.json
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.bench_mask_upsampling import SAMPLE_DIR, load_samples, mask_quality
+
+
+def _best_ms(func, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def compare_precisions(reference, candidate, samples, repeat=3):
+    """
+    Segment every sample with both removers.
+
+    Args:
+        reference (BiRefNetBackgroundRemover): fp32 remover (masks are the ground truth)
+        candidate (BiRefNetBackgroundRemover): INT8 remover
+        samples (list): (name, HxWx3 uint8 array) pairs
+        repeat (int): Timed runs per image and model (best is kept)
+
+    Returns:
+        dict: 'images' (per-image rows) and 'summary' (means and latency percentiles)
+    """
+    reference.warmup()
+    candidate.warmup()
+    rows = []
+    for name, pixels in samples:
+        reference_ms, reference_mask = _best_ms(lambda: reference.predict_mask(pixels), repeat)
+        candidate_ms, candidate_mask = _best_ms(lambda: candidate.predict_mask(pixels), repeat)
+        iou, edge_mae = mask_quality(candidate_mask, reference_mask)
+        rows.append({
+            'image': name,
+            'size': [pixels.shape[1], pixels.shape[0]],
+            'fp32_ms': round(reference_ms, 1),
+            'int8_ms': round(candidate_ms, 1),
+            'iou': round(iou, 4),
+            'edge_mae': round(edge_mae, 2),
+        })
+
+    def percentiles(key):
+        values = [row[key] for row in rows]
+        return {'mean': round(float(np.mean(values)), 1),
+                'p50': round(float(np.percentile(values, 50)), 1),
+                'p95': round(float(np.percentile(values, 95)), 1)}
+
+    summary = {
+        'images': len(rows),
+        'fp32_ms': percentiles('fp32_ms'),
+        'int8_ms': percentiles('int8_ms'),
+        'mean_iou': round(float(np.mean([row['iou'] for row in rows])), 4),
+        'min_iou': round(float(min(row['iou'] for row in rows)), 4),
+        'mean_edge_mae': round(float(np.mean([row['edge_mae'] for row in rows])), 2),
+    }
+    summary['speedup'] = round(summary['fp32_ms']['mean'] / max(summary['int8_ms']['mean'], 1e-6), 2)
+    return {'images': rows, 'summary': summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', default=SAMPLE_DIR, help='Folder of .jpg/.png images')
+    parser.add_argument('--megapixels', type=float, help='Resize every image to about this many megapixels')
+    parser.add_argument('--limit', type=int, help='Only use the first N images')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--model', default='birefnet-general')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    from models.birefnet_bg_removal import BiRefNetBackgroundRemover
+    reference = BiRefNetBackgroundRemover(args.model)
+    candidate = BiRefNetBackgroundRemover(args.model, precision='int8')
+    results = compare_precisions(reference, candidate, load_samples(args.images, args.megapixels, args.limit),
+                                 args.repeat)
+
+    print(f"{'image':>24} {'fp32 ms':>8} {'int8 ms':>8} {'IoU':>7} {'edge MAE':>9}")
+    for row in results['images']:
+        print(f"{row['image'][-24:]:>24} {row['fp32_ms']:>8} {row['int8_ms']:>8} {row['iou']:>7} {row['edge_mae']:>9}")
+    summary = results['summary']
+    print(f"\n{summary['images']} images: fp32 p50 {summary['fp32_ms']['p50']} ms, "
+          f"int8 p50 {summary['int8_ms']['p50']} ms ({summary['speedup']}x); "
+          f"IoU mean {summary['mean_iou']} (min {summary['min_iou']}), edge MAE {summary['mean_edge_mae']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(results, model=args.model), f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Mask Upsampling Benchmark
+Quality and latency of the BiRefNet mask modes on the sample images in
+static/img:
+
+    full      whole image resized into the model, mask resized back (Lanczos)
+    guided    segmentation on a copy bounded to a max side, guided-filter upsampling
+    bilinear  same bounded copy, plain bilinear upsampling (shows what the filter adds)
+
+Quality runs at the samples' native resolution (~1000px long side), which
+has real edge detail. The downscale a 12 MP photo sees going into a 1024px
+model is emulated by segmenting at --quality-side (default 256, the same ~4x
+ratio). With --stub the network is a per-pixel brightness threshold, so
+running it directly on the full image gives an exact reference mask and the
+stub model input is shrunk to --quality-side too. With a real model the
+reference is 'full' at native resolution (the model sees nearly every pixel).
+
+Latency runs on the samples upscaled to --megapixels with --max-side.
+
+Usage:
+    python -m benchmarks.bench_mask_upsampling --stub
+    python -m benchmarks.bench_mask_upsampling --model birefnet-general --megapixels 4 12
+"""
+
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmarks.stub_session import make_stub_remover
+from models.mask_refine import bounded_size
+
+SAMPLE_DIR = os.path.join('static', 'img')
+
+
+def load_samples(sample_dir=SAMPLE_DIR, megapixels=None, limit=None):
+    """Sample images as RGB arrays, optionally Lanczos-upscaled to roughly the given megapixels."""
+    names = sorted(n for n in os.listdir(sample_dir) if n.lower().endswith(('.jpg', '.jpeg', '.png')))
+    samples = []
+    for name in names[:limit]:
+        img = Image.open(os.path.join(sample_dir, name)).convert('RGB')
+        if megapixels:
+            scale = (megapixels * 1_000_000 / (img.width * img.height)) ** 0.5
+            img = img.resize((round(img.width * scale), round(img.height * scale)), Image.LANCZOS)
+        samples.append((name, np.asarray(img)))
+    return samples
+
+
+def stub_reference_mask(remover, pixels):
+    """Exact stub mask: the per-pixel stub network applied at full resolution."""
+    rgb = pixels[:, :, :3].astype(np.float32) / max(int(pixels.max()), 1)
+    tensor = ((rgb - [0.485, 0.456, 0.406]) / [0.229, 0.224, 0.225]).astype(np.float32)
+    inner = remover.session.inner_session
+    logits = inner.run(None, {'input_image': tensor.transpose(2, 0, 1)[np.newaxis]})[0][0, 0]
+    return remover.postprocess_logits(logits, (pixels.shape[1], pixels.shape[0]))
+
+
+def bilinear_mask(remover, pixels, max_side):
+    height, width = pixels.shape[:2]
+    work = cv2.resize(pixels, bounded_size(width, height, max_side), interpolation=cv2.INTER_AREA)
+    return cv2.resize(remover.predict_mask(work), (width, height), interpolation=cv2.INTER_LINEAR)
+
+
+def mask_modes(remover, max_side):
+    return {
+        'full': lambda px: remover.predict_mask(px),
+        'guided': lambda px: remover.predict_mask(px, mask_mode='guided', max_side=max_side),
+        'bilinear': lambda px: bilinear_mask(remover, px, max_side),
+    }
+
+
+def mask_quality(mask, reference, band=7):
+    """IoU at 50% and mean absolute error inside the band around reference edges."""
+    fg, ref_fg = mask >= 128, reference >= 128
+    union = np.logical_or(fg, ref_fg).sum()
+    iou = np.logical_and(fg, ref_fg).sum() / union if union else 1.0
+    kernel = np.ones((band, band), np.uint8)
+    binary = ref_fg.astype(np.uint8)
+    edges = (cv2.dilate(binary, kernel) - cv2.erode(binary, kernel)).astype(bool)
+    diff = np.abs(mask.astype(np.int16) - reference.astype(np.int16))
+    edge_mae = float(diff[edges].mean()) if edges.any() else 0.0
+    return float(iou), edge_mae
+
+
+def quality_benchmark(remover, quality_side, stub=True, limit=None):
+    """
+    Score every mask mode at native sample resolution.
+
+    Returns:
+        list: One result dict per mode, averaged over the samples
+    """
+    modes = mask_modes(remover, quality_side)
+    if not stub:
+        # 'full' at native resolution is the reference for a real model
+        modes.pop('full')
+    scores = {mode: [] for mode in modes}
+    for _, pixels in load_samples(limit=limit):
+        reference = stub_reference_mask(remover, pixels) if stub else remover.predict_mask(pixels)
+        for mode, func in modes.items():
+            scores[mode].append(mask_quality(func(pixels), reference))
+    return [{
+        'mode': mode,
+        'segment_side': quality_side,
+        'images': len(rows),
+        'iou': round(float(np.mean([r[0] for r in rows])), 4),
+        'edge_mae': round(float(np.mean([r[1] for r in rows])), 2),
+    } for mode, rows in scores.items()]
+
+
+def latency_benchmark(remover, megapixels_list, max_side=1024, repeat=3, limit=None):
+    """
+    Time every mask mode on upscaled samples (best of repeat, averaged over samples).
+
+    Returns:
+        list: One result dict per (megapixels, mode)
+    """
+    modes = mask_modes(remover, max_side)
+    results = []
+    for megapixels in megapixels_list:
+        samples = load_samples(megapixels=megapixels, limit=limit)
+        timings = {mode: [] for mode in modes}
+        for _, pixels in samples:
+            for mode, func in modes.items():
+                best = float('inf')
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    func(pixels)
+                    best = min(best, time.perf_counter() - start)
+                timings[mode].append(best * 1000)
+        results.extend({
+            'megapixels': megapixels,
+            'mode': mode,
+            'images': len(samples),
+            'mean_ms': round(float(np.mean(ms)), 1),
+        } for mode, ms in timings.items())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[4, 12])
+    parser.add_argument('--max-side', type=int, default=1024, help='Guided-mode long side for the latency runs')
+    parser.add_argument('--quality-side', type=int, default=256, help='Segmentation long side for the quality runs')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--limit', type=int, help='Only use the first N sample images')
+    parser.add_argument('--stub', action='store_true', help='Use the offline stub session instead of BiRefNet')
+    parser.add_argument('--model', default='birefnet-general')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    if args.stub:
+        quality_remover = make_stub_remover(args.model, input_size=(args.quality_side, args.quality_side))
+        latency_remover = make_stub_remover(args.model)
+    else:
+        from models.birefnet_bg_removal import BiRefNetBackgroundRemover
+        quality_remover = latency_remover = BiRefNetBackgroundRemover(args.model)
+
+    quality = quality_benchmark(quality_remover, args.quality_side, args.stub, args.limit)
+    latency = latency_benchmark(latency_remover, args.megapixels, args.max_side, args.repeat, args.limit)
+
+    reference = 'exact stub mask' if args.stub else "'full' at native resolution"
+    print(f"Quality at native resolution, segmenting at {args.quality_side}px (reference: {reference})")
+    print(f"{'mode':>9} {'images':>7} {'IoU':>7} {'edge MAE':>9}")
+    for row in quality:
+        print(f"{row['mode']:>9} {row['images']:>7} {row['iou']:>7} {row['edge_mae']:>9}")
+    print(f"\nLatency, guided/bilinear segmenting at {args.max_side}px")
+    print(f"{'MP':>5} {'mode':>9} {'images':>7} {'mean ms':>9}")
+    for row in latency:
+        print(f"{row['megapixels']:>5} {row['mode']:>9} {row['images']:>7} {row['mean_ms']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'model': 'stub' if args.stub else args.model, 'max_side': args.max_side,
+                       'quality_side': args.quality_side, 'quality': quality, 'latency': latency}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
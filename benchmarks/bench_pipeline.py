@@ -0,0 +1,384 @@
+"""
+Photogenix Pipeline Benchmark
+Drives the image /process/* routes through Flask's test client with
+synthetic product shots at several resolutions and breaks every request
+down into pipeline stages (upload, decode, mask cache, preprocess, BiRefNet,
+mask resize, cutout, composite, shadow blur, enhance, preset, crop, encode).
+
+Stage times are self times: a stage called inside another (the shadow blur
+inside composite) is not counted twice, and 'other' is what the request
+spent outside every stage (Flask, the job queue, asset hashing). The batch
+route runs stages on several threads, so its stage times are summed across
+them. Peak memory is resident memory above the level before the request
+(Linux only). Each request uploads a fresh image, so the asset store and the
+mask cache never answer from a previous run; jobs run on a thread pool in
+this process so the stages can be timed.
+
+With --stub the BiRefNet network is benchmarks.stub_session's threshold
+model and the suite runs offline. /process/creative_content calls Gemini and
+is not part of the suite. Results written with --output carry the commit
+they were measured on; pass an earlier file as --baseline to print the p50
+change per route.
+
+Usage:
+    python -m benchmarks.bench_pipeline --stub --sizes 1 4 12
+    python -m benchmarks.bench_pipeline --stub --routes replace_background enhance --output pipeline.json
+    python -m benchmarks.bench_pipeline --stub --baseline pipeline.json
+"""
+
+import argparse
+import functools
+import importlib
+import inspect
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.bench_tone_pipeline import peak_extra
+from benchmarks.stub_session import make_stub_remover
+from benchmarks.synthetic import make_product_image, megapixel_size
+
+# Stage name -> functions timed as that stage ('module.function' or 'module.Class.method')
+STAGES = {
+    'upload': ['models.upload_guard.read_image_upload'],
+    'decode': ['models.photogenix_jobs._decode', 'models.photogenix_jobs._decode_product',
+               'models.batch_processor.BatchProcessor._decode'],
+    'mask_cache': ['models.mask_cache.MaskCache.make_key', 'models.mask_cache.MaskCache.get',
+                   'models.mask_cache.MaskCache.put'],
+    'threshold_mask': ['models.segmentation_cascade.threshold_tier'],
+    'preprocess': ['models.birefnet_bg_removal.BiRefNetBackgroundRemover.preprocess_array'],
+    'birefnet': ['models.birefnet_bg_removal.BiRefNetBackgroundRemover.predict_mask',
+                 'models.birefnet_bg_removal.BiRefNetBackgroundRemover.predict_masks'],
+    'mask_resize': ['models.birefnet_bg_removal.BiRefNetBackgroundRemover.postprocess_logits',
+                    'models.mask_refine.guided_upsample'],
+    'cutout': ['models.photogenix_ops.apply_mask'],
+    'composite': ['models.photogenix_ops.composite_product', 'models.tiled_ops.composite_product_tiled'],
+    'shadow_blur': ['models.photogenix_ops.drop_shadow'],
+    'enhance': ['models.photogenix_ops.enhance_image', 'models.tiled_ops.enhance_image_tiled'],
+    'preset': ['models.photogenix_ops.apply_preset'],
+    'crop': ['models.photogenix_ops.crop_to_platform', 'models.photogenix_ops.crop_to_platforms'],
+    'encode': ['models.output_encoder.save_output'],
+}
+
+# Route name -> (path, form fields); 'batch' uploads several images under 'images'
+ROUTES = {
+    'background_removal': ('/process/background_removal', {}),
+    'enhance': ('/process/enhance', {}),
+    'replace_background': ('/process/replace_background', {'background': 'white.jpg'}),
+    'crop_resize': ('/process/crop_resize', {'platforms': 'meesho,amazon,instagram'}),
+    'make_professional': ('/process/make_professional', {'preset': 'clean_studio'}),
+    'recipe': ('/process/recipe', {'steps': 'remove,enhance,crop', 'platforms': 'meesho,amazon'}),
+    'batch': ('/process/batch', {'operations': 'replace,enhance'}),
+}
+
+
+class StageRecorder:
+    """
+    Wraps pipeline functions in place and records the self time of every
+    call, per thread, until uninstall() puts the originals back.
+    """
+
+    def __init__(self, stages=STAGES):
+        self.stages = stages
+        self.samples = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._restore = []
+
+    def _wrap(self, stage, func):
+        recorder = self
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            stack = recorder._local.__dict__.setdefault('stack', [])
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                with recorder._lock:
+                    recorder.samples.append((stage, (elapsed - nested) * 1000))
+        return timed
+
+    def _patch(self, owner, name, value):
+        self._restore.append((owner, name, vars(owner)[name]))
+        setattr(owner, name, value)
+
+    def install(self):
+        """Wrap every function in self.stages, including copies imported by name into other models modules."""
+        for stage, paths in self.stages.items():
+            for path in paths:
+                module_name, _, attr = path.rpartition('.')
+                try:
+                    module = importlib.import_module(module_name)
+                except ModuleNotFoundError:
+                    # module.Class.method
+                    module_name, _, class_name = module_name.rpartition('.')
+                    owner = getattr(importlib.import_module(module_name), class_name)
+                    raw = inspect.getattr_static(owner, attr)
+                    if isinstance(raw, staticmethod):
+                        self._patch(owner, attr, staticmethod(self._wrap(stage, raw.__func__)))
+                    else:
+                        self._patch(owner, attr, self._wrap(stage, raw))
+                    continue
+                original = getattr(module, attr)
+                timed = self._wrap(stage, original)
+                for loaded in list(sys.modules.values()):
+                    name = getattr(loaded, '__name__', '')
+                    if not (name.startswith('models.') or name == 'app'):
+                        continue
+                    for key, value in list(vars(loaded).items()):
+                        if value is original:
+                            self._patch(loaded, key, timed)
+
+    def uninstall(self):
+        while self._restore:
+            owner, name, value = self._restore.pop()
+            setattr(owner, name, value)
+
+    def drain(self):
+        """Samples recorded since the last drain, as (stage, ms) pairs."""
+        with self._lock:
+            samples, self.samples = self.samples, []
+        return samples
+
+
+def load_app(workdir, stub=False, stub_latency_ms=0.0):
+    """
+    Import the Flask app and point its outputs at workdir: asset store, batch
+    outputs and mask cache. Jobs run on one thread in this process and
+    requests wait for them.
+
+    Args:
+        workdir (str): Scratch directory for processed images and cached masks
+        stub (bool): Segment with the offline stub model instead of BiRefNet
+        stub_latency_ms (float): Simulated model latency per stub session run
+
+    Returns:
+        module: The imported app module
+    """
+    import app as app_module
+    import models.birefnet_bg_removal as birefnet
+    import models.mask_cache as mask_cache
+    from models.asset_store import AssetStore
+    from models.job_queue import JobQueue
+
+    if stub:
+        birefnet._bg_remover = make_stub_remover(latency_ms=stub_latency_ms)
+    mask_cache._mask_cache = app_module.mask_cache = mask_cache.MaskCache(cache_dir=os.path.join(workdir, 'masks'))
+    app_module.app.config['PROCESSED_FOLDER'] = workdir
+    app_module.app.config['JOB_INLINE_WAIT'] = 3600
+    app_module.asset_store = AssetStore(workdir)
+    app_module.batch_processor.output_dir = workdir
+    app_module.batch_processor.asset_store = app_module.asset_store
+    app_module.job_queue = JobQueue(workers=1, mode='thread')
+    return app_module
+
+
+def _summarise(samples):
+    values = np.array(samples, dtype=np.float64)
+    return {
+        'mean': round(float(values.mean()), 1),
+        'p50': round(float(np.percentile(values, 50)), 1),
+        'p95': round(float(np.percentile(values, 95)), 1),
+    }
+
+
+def _upload(pixels, serial):
+    """JPEG upload of the base shot with a corner patch coloured by serial, so no two uploads hash alike."""
+    variant = pixels.copy()
+    variant[:16, :16] = (serial * 53 % 256, serial * 101 % 256, serial // 256 * 197 % 256)
+    buf = io.BytesIO()
+    Image.fromarray(variant).save(buf, 'JPEG', quality=92)
+    return buf.getvalue()
+
+
+def _post(client, route, pixels, serial, form, batch_images):
+    path, route_form = ROUTES[route]
+    data = dict(route_form, **form)
+    if route == 'batch':
+        data['images'] = [(io.BytesIO(_upload(pixels, serial + i)), f'product_{i}.jpg') for i in range(batch_images)]
+    else:
+        data['image'] = (io.BytesIO(_upload(pixels, serial)), 'product.jpg')
+    start = time.perf_counter()
+    response = client.post(path, data=data, content_type='multipart/form-data')
+    body = response.get_data(as_text=True)
+    latency_ms = (time.perf_counter() - start) * 1000
+    if route == 'batch':
+        # The last line is the summary
+        failed = [line for line in body.splitlines()[:-1] if json.loads(line)['status'] != 'ok']
+    else:
+        failed = [] if response.status_code == 200 and json.loads(body).get('status') != 'failed' else [body]
+    if response.status_code != 200 or failed:
+        raise RuntimeError(f'{path} failed ({response.status_code}): {failed or body}')
+    return latency_ms
+
+
+def run_benchmark(app_module, sizes, routes=tuple(ROUTES), repeat=5, warmup=1, batch_images=4, form=None):
+    """
+    Time every route at every size, stage by stage.
+
+    Args:
+        app_module (module): App from load_app()
+        sizes (list): Image sizes in megapixels
+        routes (list): Keys of ROUTES to run
+        repeat (int): Measured requests per route and size
+        warmup (int): Unmeasured requests first (model load, caches, pools)
+        batch_images (int): Images per /process/batch request
+        form (dict): Extra form fields for every request (mask_mode, segmentation, format)
+
+    Returns:
+        list: One result dict per route and size
+    """
+    client = app_module.app.test_client()
+    recorder = StageRecorder()
+    recorder.install()
+    serial = 0
+    results = []
+    try:
+        for megapixels in sizes:
+            width, height = megapixel_size(megapixels)
+            pixels = np.asarray(make_product_image(width, height))
+            for route in routes:
+                latencies, peaks, stage_ms, stage_calls = [], [], {}, {}
+                for i in range(warmup + repeat):
+                    timing = []
+                    peak = peak_extra(lambda: timing.append(
+                        _post(client, route, pixels, serial, form or {}, batch_images)))
+                    serial += batch_images
+                    samples = recorder.drain()
+                    if i < warmup:
+                        continue
+                    latencies.append(timing[0])
+                    if peak is not None:
+                        peaks.append(peak / 1e6)
+                    totals = {}
+                    for stage, ms in samples:
+                        totals[stage] = totals.get(stage, 0.0) + ms
+                        stage_calls[stage] = stage_calls.get(stage, 0) + 1
+                    totals['other'] = max(0.0, timing[0] - sum(totals.values()))
+                    for stage, ms in totals.items():
+                        stage_ms.setdefault(stage, []).append(ms)
+                order = list(STAGES) + ['other']
+                results.append({
+                    'route': route,
+                    'path': ROUTES[route][0],
+                    'megapixels': megapixels,
+                    'size': [width, height],
+                    'requests': repeat,
+                    'images_per_request': batch_images if route == 'batch' else 1,
+                    'latency_ms': _summarise(latencies),
+                    'peak_mb': round(max(peaks), 1) if peaks else None,
+                    'stages': {
+                        stage: dict(_summarise(stage_ms[stage] + [0.0] * (repeat - len(stage_ms[stage]))),
+                                    calls=stage_calls.get(stage, 0) // repeat)
+                        for stage in order if stage in stage_ms
+                    },
+                })
+    finally:
+        recorder.uninstall()
+    return results
+
+
+def compare(results, baseline):
+    """
+    p50 latency against an earlier run, per route and size present in both.
+
+    Args:
+        results (list): run_benchmark() results
+        baseline (dict): JSON written by an earlier --output run
+
+    Returns:
+        list: (route, megapixels, baseline p50 ms, p50 ms, change %) tuples
+    """
+    before = {(row['route'], row['megapixels']): row['latency_ms']['p50'] for row in baseline['results']}
+    rows = []
+    for row in results:
+        key = (row['route'], row['megapixels'])
+        if key in before:
+            now = row['latency_ms']['p50']
+            rows.append((*key, before[key], now, round((now / max(before[key], 1e-6) - 1) * 100, 1)))
+    return rows
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 12], help='Image sizes in megapixels')
+    parser.add_argument('--routes', nargs='+', choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--batch-images', type=int, default=4)
+    parser.add_argument('--stub', action='store_true', help='Offline stub segmentation model')
+    parser.add_argument('--stub-latency-ms', type=float, default=0.0)
+    parser.add_argument('--mask-mode', choices=['full', 'guided'], default='full')
+    parser.add_argument('--segmentation', choices=['birefnet', 'cascade'], default='birefnet')
+    parser.add_argument('--format', help='Output format form field (default: the encoder default)')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    parser.add_argument('--baseline', help='Earlier --output file to compare p50 latency against')
+    args = parser.parse_args()
+
+    form = {'mask_mode': args.mask_mode, 'segmentation': args.segmentation}
+    if args.format:
+        form['format'] = args.format
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir, args.stub, args.stub_latency_ms)
+        try:
+            results = run_benchmark(app_module, args.sizes, args.routes, args.repeat, args.warmup,
+                                    args.batch_images, form)
+        finally:
+            app_module.job_queue.shutdown()
+
+    for row in results:
+        latency = row['latency_ms']
+        print(f"\n{row['route']} {row['megapixels']} MP ({row['size'][0]}x{row['size'][1]}): "
+              f"p50 {latency['p50']} ms, p95 {latency['p95']} ms, peak {row['peak_mb']} MB")
+        print(f"  {'stage':<15} {'p50 ms':>9} {'p95 ms':>9} {'calls':>6}")
+        for stage, stats in row['stages'].items():
+            print(f"  {stage:<15} {stats['p50']:>9} {stats['p95']:>9} {stats['calls']:>6}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nAgainst {args.baseline} ({baseline['meta'].get('commit')}):")
+        print(f"{'route':<20} {'MP':>5} {'before p50':>11} {'after p50':>10} {'change %':>9}")
+        for route, megapixels, before, after, change in compare(results, baseline):
+            print(f"{route:<20} {megapixels:>5} {before:>11} {after:>10} {change:>+9}")
+
+    if args.output:
+        meta = {
+            'commit': _commit(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'stub': args.stub,
+            'stub_latency_ms': args.stub_latency_ms,
+            'repeat': args.repeat,
+            'batch_images': args.batch_images,
+            'form': form,
+        }
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
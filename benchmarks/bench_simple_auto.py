@@ -0,0 +1,92 @@
+"""
+Simple Remover Auto-Selection Benchmark
+Times SimpleBackgroundRemover.auto_mask (all three methods on a downscaled
+copy, winner refined at full size) with the time each method took, and
+optionally the original auto path, which ran GrabCut at full resolution and
+returned it whenever it did not raise. Full-resolution GrabCut takes minutes
+on multi-megapixel images, so the legacy timing is opt-in.
+
+Usage:
+    python -m benchmarks.bench_simple_auto --sizes 0.3 2 12
+    python -m benchmarks.bench_simple_auto --sizes 0.3 1 --legacy --output auto.json
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_product_image, megapixel_size
+from models.simple_bg_removal import AUTO_MAX_SIDE, SimpleBackgroundRemover
+
+
+def mask_iou(a, b):
+    fg_a, fg_b = a >= 128, b >= 128
+    union = np.logical_or(fg_a, fg_b).sum()
+    return float(np.logical_and(fg_a, fg_b).sum() / union) if union else 1.0
+
+
+def run_benchmark(sizes, max_side=AUTO_MAX_SIDE, legacy=False):
+    """
+    Run auto selection on a synthetic product shot of each size.
+
+    Args:
+        sizes (list): Image sizes in megapixels
+        max_side (int): Long side of the comparison copy
+        legacy (bool): Also time full-resolution GrabCut (the old auto path)
+
+    Returns:
+        list: One result dict per size
+    """
+    remover = SimpleBackgroundRemover()
+    results = []
+    for megapixels in sizes:
+        width, height = megapixel_size(megapixels)
+        pixels = np.asarray(make_product_image(width, height))
+        mask, report = remover.auto_mask(pixels, max_side)
+        # Full-resolution threshold mask as the reference for these plain-backdrop shots
+        row = {
+            'megapixels': megapixels,
+            'size': [width, height],
+            'method': report['method'],
+            'auto_ms': report['total_ms'],
+            'refine_ms': report['refine_ms'],
+            'methods': report['methods'],
+            'iou_vs_full_threshold': round(mask_iou(mask, remover.smart_threshold_mask(pixels)), 4),
+        }
+        if legacy:
+            start = time.perf_counter()
+            remover.grabcut_mask(pixels)
+            row['legacy_grabcut_ms'] = round((time.perf_counter() - start) * 1000, 1)
+            row['speedup'] = round(row['legacy_grabcut_ms'] / max(row['auto_ms'], 1e-6), 1)
+        results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0.3, 2, 12], help='Image sizes in megapixels')
+    parser.add_argument('--max-side', type=int, default=AUTO_MAX_SIDE)
+    parser.add_argument('--legacy', action='store_true', help='Also time full-resolution GrabCut (slow)')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.max_side, args.legacy)
+
+    print(f"{'MP':>5} {'size':>11} {'grabcut':>8} {'watershed':>10} {'threshold':>10} {'refine':>7} "
+          f"{'auto ms':>8} {'winner':>10} {'IoU':>6} {'legacy ms':>10}")
+    for row in results:
+        size = f"{row['size'][0]}x{row['size'][1]}"
+        ms = [row['methods'][name].get('ms', '-') for name in ('grabcut', 'watershed', 'threshold')]
+        print(f"{row['megapixels']:>5} {size:>11} {ms[0]:>8} {ms[1]:>10} {ms[2]:>10} {row['refine_ms']:>7} "
+              f"{row['auto_ms']:>8} {row['method']:>10} {row['iou_vs_full_threshold']:>6} "
+              f"{row.get('legacy_grabcut_ms', '-'):>10}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'max_side': args.max_side, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
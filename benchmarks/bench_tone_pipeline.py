@@ -0,0 +1,149 @@
+"""
+Tone Pipeline Benchmark
+Times models.tone_pipeline.apply_tone against the chained ImageEnhance calls
+it replaces (enhance_image and composite_product factors), per megapixel, and
+counts what each allocates: PIL images created, and the peak resident memory
+above the input expressed in full-size RGBA copies (Linux only). Also reports
+the largest per-pixel difference between the two.
+
+Usage:
+    python -m benchmarks.bench_tone_pipeline --sizes 1 4 12
+    python -m benchmarks.bench_tone_pipeline --sizes 12 --output tone.json
+"""
+
+import argparse
+import ctypes
+import json
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from benchmarks.synthetic import make_product_image, megapixel_size
+from models.tone_pipeline import apply_tone
+
+# enhance_image and composite_product
+FACTORS = {'enhance': (1.25, 1.35, 1.35), 'composite': (1.08, 1.12, 1.15)}
+
+
+def chained_enhance(img, brightness, contrast, color):
+    """Reference: one ImageEnhance pass (and one new image) per factor."""
+    img = ImageEnhance.Brightness(img).enhance(brightness)
+    img = ImageEnhance.Contrast(img).enhance(contrast)
+    return ImageEnhance.Color(img).enhance(color)
+
+
+def _vm(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def peak_extra(func):
+    """Peak resident memory above the current level while func runs, or None if it cannot be reset."""
+    try:
+        # Hand freed blocks back first so reused heap pages do not hide the allocations
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return None
+    base = _vm('VmRSS:')
+    result = func()
+    del result
+    return _vm('VmHWM:') - base
+
+
+def count_images(func):
+    """Number of PIL images created while func runs."""
+    created = [0]
+    original = Image.Image.__init__
+
+    def counting_init(self, *args, **kwargs):
+        created[0] += 1
+        original(self, *args, **kwargs)
+
+    Image.Image.__init__ = counting_init
+    try:
+        func()
+    finally:
+        Image.Image.__init__ = original
+    return created[0]
+
+
+def _best_ms(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run_benchmark(sizes, repeat=3, mode='RGB'):
+    """
+    Time and measure both implementations for each size and factor set.
+
+    Args:
+        sizes (list): Image sizes in megapixels
+        repeat (int): Timed runs per implementation (best is kept)
+        mode (str): 'RGB' or 'RGBA' input
+
+    Returns:
+        list: One result dict per size and factor set
+    """
+    results = []
+    for megapixels in sizes:
+        width, height = megapixel_size(megapixels)
+        img = make_product_image(width, height).convert(mode)
+        copy_bytes = width * height * 4
+        for name, factors in FACTORS.items():
+            implementations = {
+                'chained': lambda: chained_enhance(img, *factors),
+                'fused': lambda: apply_tone(img, *factors),
+            }
+            row = {'megapixels': megapixels, 'size': [width, height], 'factors': name}
+            for label, func in implementations.items():
+                peak = peak_extra(func)
+                ms = _best_ms(func, repeat)
+                row[label] = {
+                    'ms': round(ms, 1),
+                    'ms_per_mp': round(ms / megapixels, 1),
+                    'pil_images': count_images(func),
+                    'peak_copies': None if peak is None else round(peak / copy_bytes, 2),
+                }
+            diff = np.abs(np.asarray(implementations['chained'](), dtype=np.int16)
+                          - np.asarray(implementations['fused'](), dtype=np.int16))
+            row['max_diff'] = int(diff.max())
+            row['speedup'] = round(row['chained']['ms'] / max(row['fused']['ms'], 1e-6), 2)
+            results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 12], help='Image sizes in megapixels')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--mode', choices=['RGB', 'RGBA'], default='RGB')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.repeat, args.mode)
+
+    print(f"{'MP':>5} {'factors':>10} {'chained ms/MP':>14} {'fused ms/MP':>12} {'speedup':>8} "
+          f"{'images':>9} {'peak copies':>13} {'max diff':>9}")
+    for row in results:
+        chained, fused = row['chained'], row['fused']
+        print(f"{row['megapixels']:>5} {row['factors']:>10} {chained['ms_per_mp']:>14} {fused['ms_per_mp']:>12} "
+              f"{row['speedup']:>8} {chained['pil_images']:>4}/{fused['pil_images']:<4} "
+              f"{str(chained['peak_copies']):>6}/{str(fused['peak_copies']):<6} {row['max_diff']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'mode': args.mode, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Local Discount Model Calibration
+Fits the local discount model's weights to the discounts Gemini chose, as
+logged in DISCOUNT_LOG (default logs/discount_gemini.jsonl), and writes them
+to DISCOUNT_MODEL_PATH, where the discount calculator loads them at startup.
+Reports the mean absolute error against Gemini for the current and fitted
+weights on a held-out share of the log.
+
+Usage:
+    python -m benchmarks.calibrate_discount_model
+    python -m benchmarks.calibrate_discount_model --log logs/discount_gemini.jsonl --dry-run
+"""
+
+import argparse
+import random
+
+import numpy as np
+
+from models.discount_model import DISCOUNT_LOG, DISCOUNT_MODEL_PATH, LocalDiscountModel, read_discount_log
+
+
+def mean_abs_error(model, records):
+    if not records:
+        return None
+    errors = [abs(model.predict(r['product'], r['health_score'], r['festivals']) - r['discount']) for r in records]
+    return float(np.mean(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', default=DISCOUNT_LOG, help='JSON-lines log of Gemini discount decisions')
+    parser.add_argument('--output', default=DISCOUNT_MODEL_PATH, help='Where to write the weights')
+    parser.add_argument('--ridge', type=float, default=1.0, help='Pull towards the default weights')
+    parser.add_argument('--holdout', type=float, default=0.2, help='Share of records kept for evaluation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dry-run', action='store_true', help='Report without writing the weights')
+    args = parser.parse_args()
+
+    records = read_discount_log(args.log)
+    random.Random(args.seed).shuffle(records)
+    held_out = records[:int(len(records) * args.holdout)]
+    train = records[len(held_out):]
+    print(f"{len(records)} logged decisions: {len(train)} to fit, {len(held_out)} held out")
+
+    current = LocalDiscountModel.load(args.output)
+    fitted = LocalDiscountModel.calibrate(train, ridge=args.ridge)
+    print(f"{'weights':<12}{'train MAE':>12}{'held-out MAE':>14}")
+    for name, model in (('current', current), ('fitted', fitted)):
+        held_mae = mean_abs_error(model, held_out)
+        held = '-' if held_mae is None else f'{held_mae:.2f}'
+        print(f"{name:<12}{mean_abs_error(model, train):>12.2f}{held:>14}")
+    print('  '.join(f"{name}={value:.2f}" for name, value in fitted.weights.items()))
+
+    if not args.dry_run:
+        # The shipped model is fitted on every record
+        path = LocalDiscountModel.calibrate(records, ridge=args.ridge).save(args.output)
+        print(f"✅ Weights written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+BiRefNet INT8 Quantisation Tool
+Writes a dynamically quantised INT8 copy of a rembg BiRefNet model to
+QUANTIZED_MODEL_DIR (default ~/.u2net/quantized), where
+BiRefNetBackgroundRemover(precision='int8') and quality_tier=fast pick it up.
+Needs the 'onnx' package in addition to onnxruntime.
+
+Check the accuracy trade with benchmarks.bench_int8_birefnet before rolling
+the 'fast' tier out.
+
+Usage:
+    python -m benchmarks.quantize_birefnet --model birefnet-general
+    python -m benchmarks.quantize_birefnet --op-types MatMul Conv --per-channel
+"""
+
+import argparse
+import os
+
+from models.onnx_session import DEFAULT_QUANTIZE_OP_TYPES, quantize_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='birefnet-general')
+    parser.add_argument('--output', help='Destination path (defaults to where the remover looks)')
+    parser.add_argument('--op-types', nargs='+', default=list(DEFAULT_QUANTIZE_OP_TYPES),
+                        help='ONNX operator types to quantise')
+    parser.add_argument('--per-channel', action='store_true', help='Per-channel weight scales')
+    args = parser.parse_args()
+
+    path = quantize_model(args.model, args.output, tuple(args.op_types), args.per_channel)
+    print(f"✅ INT8 {args.model} written to {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Stub Segmentation Session
+A stand-in for the BiRefNet ONNX session that runs fully offline. It keeps the
+real rembg BiRefNet pre/post-processing and only replaces the network with a
+cheap brightness threshold, so pipeline overheads can be measured in isolation.
+"""
+
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from rembg.sessions.birefnet_general import BiRefNetSessionGeneral
+
+from models.birefnet_bg_removal import BiRefNetBackgroundRemover, BIREFNET_MEAN, BIREFNET_STD
+
+
+class StubInferenceSession:
+    """Mimics onnxruntime.InferenceSession for a 1024x1024 BiRefNet graph."""
+
+    def __init__(self, input_size=(1024, 1024), latency_ms=0.0, batch_dim='batch'):
+        self.input_size = input_size
+        self.latency_ms = latency_ms
+        self.batch_dim = batch_dim
+        self.calls = 0
+
+    def get_inputs(self):
+        width, height = self.input_size
+        return [SimpleNamespace(name='input_image', shape=[self.batch_dim, 3, height, width])]
+
+    def run(self, output_names, feeds):
+        self.calls += 1
+        tensor = next(iter(feeds.values()))
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        # Undo the ImageNet normalisation and call anything darker than the sweep foreground
+        mean = BIREFNET_MEAN.reshape(1, 3, 1, 1)
+        std = BIREFNET_STD.reshape(1, 3, 1, 1)
+        brightness = (tensor * std + mean).mean(axis=1, keepdims=True)
+        logits = (0.85 - brightness) * 40.0
+        return [logits.astype(np.float32)]
+
+
+def make_stub_session(model_name='birefnet-general', latency_ms=0.0, input_size=(1024, 1024)):
+    """Build a rembg BiRefNet session object backed by StubInferenceSession."""
+    session = BiRefNetSessionGeneral.__new__(BiRefNetSessionGeneral)
+    session.model_name = model_name
+    session.inner_session = StubInferenceSession(input_size=input_size, latency_ms=latency_ms)
+    return session
+
+
+def make_stub_remover(model_name='birefnet-general', latency_ms=0.0, input_size=(1024, 1024)):
+    """BiRefNetBackgroundRemover wired to the stub session (no model download)."""
+    return BiRefNetBackgroundRemover(model_name, session=make_stub_session(model_name, latency_ms, input_size))
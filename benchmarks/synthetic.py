@@ -0,0 +1,45 @@
+"""
+Synthetic Product Images
+Deterministic catalogue-style test images (a product on a light sweep) so the
+benchmarks run offline without shipping large sample photos.
+"""
+
+import numpy as np
+from PIL import Image
+
+
+def make_product_image(width, height, seed=0):
+    """
+    Generate an RGB product shot: soft gradient backdrop with a coloured,
+    textured ellipse in the middle.
+
+    Args:
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+        seed (int): Seed for the texture noise
+
+    Returns:
+        PIL.Image: RGB image
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+
+    # Light studio sweep, slightly darker towards the bottom
+    backdrop = 250 - 18 * (yy / max(height - 1, 1))
+    img = np.repeat(backdrop[:, :, np.newaxis], 3, axis=2)
+
+    # Product: an ellipse covering roughly the middle third
+    cx, cy = width / 2, height * 0.55
+    rx, ry = width * 0.22, height * 0.3
+    inside = ((xx - cx) / rx) ** 2 + ((yy - cy) / ry) ** 2 <= 1.0
+    base = np.array([40 + 30 * (seed % 5), 90, 160], dtype=np.float32)
+    texture = rng.normal(0, 12, size=(height, width, 1)).astype(np.float32)
+    img[inside] = np.clip(base + texture[inside], 0, 255)
+
+    return Image.fromarray(img.astype(np.uint8), 'RGB')
+
+
+def megapixel_size(megapixels, aspect=4 / 3):
+    """Return (width, height) for a landscape image of about N megapixels."""
+    height = int(round((megapixels * 1_000_000 / aspect) ** 0.5))
+    return int(round(height * aspect)), height
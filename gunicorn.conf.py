@@ -5,7 +5,9 @@ import os
 port = os.environ.get('PORT', '8050')
 bind = f"0.0.0.0:{port}"
 workers = 1
-worker_class = "sync"
+# Threads keep the app responsive while Photogenix jobs run on the job queue's process pool
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
 worker_connections = 1000
 max_requests = 1000
 max_requests_jitter = 100
@@ -13,5 +15,11 @@ timeout = 30
 keepalive = 2
 preload_app = True
 
+def post_worker_init(worker):
+    # Load and warm the segmentation model before the first request arrives
+    # (job pools are created after the fork, never in the preloaded master)
+    from app import warm_up_models
+    warm_up_models()
+
 # Debug: Print the port being used
 print(f"Gunicorn binding to: {bind}")
@@ -0,0 +1,102 @@
+"""
+Asset Store Module
+Content-addressed storage for processed Photogenix outputs. Every result
+lives in a directory named after a hash of the input bytes and the
+operation parameters, so identical requests map to the same immutable
+files: they can be served with strong ETags and long-lived caching, and a
+repeat request is answered from the stored manifest without any work.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+# Bump when processing changes so old outputs are no longer matched
+ASSET_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+
+class AssetStore:
+    """
+    Hash-addressed directories of processed outputs, each with a manifest
+    written last so a directory is only visible once all outputs exist.
+    """
+
+    def __init__(self, root_dir):
+        """
+        Initialize the asset store.
+
+        Args:
+            root_dir (str): Folder holding one sub-directory per asset key
+        """
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(data, operation, params):
+        """
+        Key for an upload processed with an operation and parameters.
+
+        Args:
+            data (bytes): Encoded upload
+            operation (str): Operation name
+            params (dict): JSON-serialisable operation parameters
+
+        Returns:
+            str: 32-character hex key
+        """
+        params = dict(params)
+        output = params.get('output')
+        if output and output.get('format') != 'auto':
+            # Accept negotiation only matters for 'auto'
+            params['output'] = {k: v for k, v in output.items() if k != 'accept'}
+        h = hashlib.blake2b(digest_size=16)
+        h.update(json.dumps([ASSET_VERSION, operation, params], sort_keys=True).encode('utf-8'))
+        h.update(data)
+        return h.hexdigest()
+
+    @staticmethod
+    def is_key(name):
+        return len(name) == 32 and all(c in '0123456789abcdef' for c in name)
+
+    def path_for(self, key):
+        return os.path.join(self.root_dir, key)
+
+    def lookup(self, key):
+        """Manifest of a stored asset, or None if it has not been produced yet."""
+        try:
+            with open(os.path.join(self.path_for(key), MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def prepare(self, key):
+        """Create (if needed) and return the directory outputs for key are written to."""
+        path = self.path_for(key)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def commit(self, key, result):
+        """
+        Record a finished result for key.
+
+        Args:
+            key (str): Asset key
+            result (dict): run_operation() result with filenames relative to the key directory
+
+        Returns:
+            dict: The result with filenames made relative to root_dir ('<key>/<name>')
+        """
+        result = dict(result)
+        result['processed_filenames'] = [f'{key}/{name}' for name in result['processed_filenames']]
+        result['processed_filename'] = result['processed_filenames'][0]
+        result['encodings'] = [dict(encoding, filename=f"{key}/{encoding['filename']}")
+                               for encoding in result.get('encodings', [])]
+        manifest = dict(result, key=key, created_at=time.time())
+        path = os.path.join(self.path_for(key), MANIFEST_NAME)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+        return result
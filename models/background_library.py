@@ -0,0 +1,241 @@
+"""
+Background Library Module
+In-memory index of the studio backgrounds in static/backgrounds. Each file is
+decoded once; its dominant colour goes into a small array so picking the best
+contrast background is a vector distance, and resized copies are cached so
+compositing does not decode a JPEG on every request.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+BACKGROUNDS_DIR = os.path.join('static', 'backgrounds')
+DEFAULT_BACKGROUND = 'white.jpg'
+BACKGROUND_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def get_dominant_color(img):
+    """Mean colour of an image, ignoring near-white pixels."""
+    # No full-size RGB copy when the image already is RGB
+    img = (img if img.mode == 'RGB' else img.convert('RGB')).resize((64, 64))
+    arr = np.array(img)
+    arr = arr.reshape((-1, 3))
+    arr = arr[(arr < 250).any(axis=1)]  # Ignore near-white
+    if len(arr) == 0:
+        return (255, 255, 255)
+    color = tuple(np.mean(arr, axis=0).astype(int))
+    return color
+
+
+class BackgroundLibrary:
+    """
+    Catalogue of background images with precomputed dominant colours and an
+    LRU cache of copies resized to product sizes.
+
+    The index is rebuilt when the directory listing (names, sizes, mtimes)
+    changes; the listing is re-checked at most every refresh_interval seconds.
+    """
+
+    def __init__(self, backgrounds_dir=BACKGROUNDS_DIR, max_resized_bytes=256 * 1024 * 1024,
+                 refresh_interval=5.0, prewarm_sizes=()):
+        """
+        Initialize and build the background index.
+
+        Args:
+            backgrounds_dir (str): Folder holding background images
+            max_resized_bytes (int): Upper bound for cached resized backgrounds
+            refresh_interval (float): Seconds between directory change checks
+            prewarm_sizes (iterable): (width, height) sizes to resize every background to up front
+        """
+        self.backgrounds_dir = backgrounds_dir
+        self.max_resized_bytes = max_resized_bytes
+        self.refresh_interval = refresh_interval
+        self.prewarm_sizes = [tuple(size) for size in prewarm_sizes]
+
+        self._lock = threading.RLock()
+        self._signature = None
+        self._last_check = 0.0
+        self.names = []
+        self.colors = np.zeros((0, 3), dtype=np.float32)
+        self._decoded = {}
+        self._resized = OrderedDict()
+        self._resized_bytes = 0
+
+        self.builds = 0
+        self.resized_hits = 0
+        self.resized_misses = 0
+
+        self.refresh(force=True)
+
+    def _listing(self):
+        """Directory signature used to detect added, removed or replaced files."""
+        try:
+            entries = os.scandir(self.backgrounds_dir)
+        except FileNotFoundError:
+            return ()
+        with entries:
+            return tuple(sorted(
+                (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+                for entry in entries
+                if entry.is_file() and entry.name.lower().endswith(BACKGROUND_EXTENSIONS)
+            ))
+
+    def refresh(self, force=False):
+        """Rebuild the index if the directory changed (or force is set)."""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.refresh_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            signature = self._listing()
+            if not force and signature == self._signature:
+                return
+            self._build(signature)
+
+    def _build(self, signature):
+        """Decode every background once and compute its dominant colour (lock held)."""
+        names, colors, decoded = [], [], {}
+        for name, _, _ in signature:
+            try:
+                with Image.open(os.path.join(self.backgrounds_dir, name)) as bg_img:
+                    rgb = bg_img.convert('RGB')
+            except OSError as e:
+                print(f"⚠️ Skipping unreadable background {name}: {e}")
+                continue
+            names.append(name)
+            colors.append(get_dominant_color(rgb))
+            decoded[name] = rgb
+
+        self.names = names
+        self.colors = np.array(colors, dtype=np.float32).reshape(-1, 3)
+        self._decoded = decoded
+        self._resized.clear()
+        self._resized_bytes = 0
+        self._signature = signature
+        self.builds += 1
+
+        for size in self.prewarm_sizes:
+            for name in names:
+                self.get_resized(name, size)
+        print(f"✅ Background library indexed {len(names)} backgrounds")
+
+    def path_for(self, bg_name):
+        """Path of a background by name, falling back to the default background."""
+        name = os.path.basename(bg_name or DEFAULT_BACKGROUND)
+        self.refresh()
+        if name not in self._decoded:
+            name = DEFAULT_BACKGROUND
+        return os.path.join(self.backgrounds_dir, name)
+
+    def pick_best(self, product_img):
+        """
+        Pick the background whose dominant colour contrasts most with the product.
+
+        Args:
+            product_img (PIL.Image): Product image
+
+        Returns:
+            str: Path of the chosen background
+        """
+        self.refresh()
+        dominant = np.array(get_dominant_color(product_img), dtype=np.float32)
+        with self._lock:
+            if not self.names:
+                return os.path.join(self.backgrounds_dir, DEFAULT_BACKGROUND)
+            scores = np.linalg.norm(self.colors - dominant, axis=1)
+            return os.path.join(self.backgrounds_dir, self.names[int(np.argmax(scores))])
+
+    def get_resized(self, bg_name, size):
+        """
+        Background resized to size, served from the LRU cache when possible.
+
+        The returned image is shared with the cache; callers must not modify
+        it in place (convert()/copy() first).
+
+        Args:
+            bg_name (str): Background file name or path
+            size (tuple): (width, height)
+
+        Returns:
+            PIL.Image: RGB background at the requested size
+        """
+        name = os.path.basename(self.path_for(bg_name))
+        key = (name, tuple(size))
+        with self._lock:
+            cached = self._resized.get(key)
+            if cached is not None:
+                self._resized.move_to_end(key)
+                self.resized_hits += 1
+                return cached
+            self.resized_misses += 1
+            source = self._decoded.get(name)
+
+        if source is None:
+            source = Image.open(os.path.join(self.backgrounds_dir, name)).convert('RGB')
+        resized = source.resize(key[1])
+        nbytes = key[1][0] * key[1][1] * 3
+
+        with self._lock:
+            if nbytes <= self.max_resized_bytes and key not in self._resized:
+                self._resized[key] = resized
+                self._resized_bytes += nbytes
+                while self._resized_bytes > self.max_resized_bytes:
+                    (_, old_size), _ = self._resized.popitem(last=False)
+                    self._resized_bytes -= old_size[0] * old_size[1] * 3
+        return resized
+
+    def get_rows(self, bg_name, size, top, bottom):
+        """
+        Rows top..bottom of the background resized to size, without building
+        the full-size copy unless it is already cached (for tiled compositing).
+
+        Returns:
+            PIL.Image: RGB strip of size (width, bottom - top)
+        """
+        name = os.path.basename(self.path_for(bg_name))
+        width, height = size
+        with self._lock:
+            cached = self._resized.get((name, tuple(size)))
+            source = self._decoded.get(name)
+        if cached is not None:
+            return cached.crop((0, top, width, bottom))
+        if source is None:
+            source = Image.open(os.path.join(self.backgrounds_dir, name)).convert('RGB')
+        scale = source.height / height
+        return source.resize((width, bottom - top), box=(0, top * scale, source.width, bottom * scale))
+
+    def stats(self):
+        """Index size and resized-cache counters."""
+        with self._lock:
+            return {
+                'backgrounds': len(self.names),
+                'builds': self.builds,
+                'resized_entries': len(self._resized),
+                'resized_bytes': self._resized_bytes,
+                'resized_hits': self.resized_hits,
+                'resized_misses': self.resized_misses,
+            }
+
+
+# Global instance shared by the Photogenix routes
+_background_library = None
+
+def get_background_library(backgrounds_dir=BACKGROUNDS_DIR):
+    """Get or create the global background library."""
+    global _background_library
+    if _background_library is None:
+        prewarm = [
+            tuple(int(v) for v in size.lower().split('x'))
+            for size in os.environ.get('BACKGROUND_PREWARM_SIZES', '').split(',') if size.strip()
+        ]
+        _background_library = BackgroundLibrary(
+            backgrounds_dir,
+            max_resized_bytes=int(os.environ.get('BACKGROUND_CACHE_MB', 256)) * 1024 * 1024,
+            prewarm_sizes=prewarm,
+        )
+    return _background_library
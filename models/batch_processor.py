@@ -0,0 +1,263 @@
+"""
+Batch Processor Module
+Catalog-scale Photogenix processing. Images are decoded and encoded on a
+worker pool while BiRefNet runs on batched tensors in between, and a result
+is yielded for each image as soon as its output file is written.
+"""
+
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+from models.birefnet_bg_removal import get_bg_remover, mask_cache_tag
+from models.mask_cache import get_mask_cache
+from models.photogenix_ops import (
+    DEFAULT_BACKGROUND, apply_mask, composite_product, crop_to_platform,
+    enhance_image, load_background,
+)
+from models.output_encoder import save_output
+from models.segmentation_cascade import note_birefnet, record_tier, threshold_tier
+from models.tiled_ops import composite_product_tiled, enhance_image_tiled, should_tile
+from models.upload_guard import open_image
+
+BATCH_OPERATIONS = ('remove', 'replace', 'enhance', 'crop')
+
+
+def parse_operations(raw, allowed=BATCH_OPERATIONS):
+    """
+    Parse the operation list of a batch or recipe request.
+
+    Args:
+        raw (str): JSON list ('["remove", "crop"]') or comma-separated names
+        allowed (tuple): Valid operation names
+
+    Returns:
+        list: Operation names in the order they will be applied
+
+    Raises:
+        ValueError: If the list is empty or names an unknown operation
+    """
+    raw = (raw or '').strip()
+    if raw.startswith('['):
+        operations = json.loads(raw)
+    else:
+        operations = raw.split(',')
+    operations = [str(op).strip().lower() for op in operations if str(op).strip()]
+    if not operations:
+        raise ValueError('At least one operation is required')
+    unknown = [op for op in operations if op not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown operation(s): {', '.join(unknown)}. Supported: {', '.join(allowed)}")
+    return operations
+
+
+class BatchProcessor:
+    """
+    Runs an ordered list of Photogenix operations over many images.
+
+    Decoding, post-processing and PNG encoding run on a thread pool; mask
+    prediction is grouped into batches of batch_size images per ONNX call.
+    """
+
+    def __init__(self, output_dir, model_name='birefnet-general', batch_size=4, workers=4, asset_store=None):
+        """
+        Initialize the batch processor.
+
+        Args:
+            output_dir (str): Folder processed images are written to
+            model_name (str): BiRefNet model used for segmentation
+            batch_size (int): Images per batched inference call
+            workers (int): Threads for decode/encode work
+            asset_store (AssetStore): Content-addressed store; items already
+                processed with the same settings are answered from it
+        """
+        self.output_dir = output_dir
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.asset_store = asset_store
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='photogenix-batch')
+
+    def _decode(self, data, needs_mask, mask_mode, segmentation='birefnet'):
+        """
+        Decode upload bytes and look the mask up in the shared cache. In
+        cascade mode a cache miss tries the threshold tier; its mask is used
+        when confident, otherwise it is kept to score BiRefNet's agreement.
+        """
+        img = open_image(data).convert('RGBA')
+        pixels = np.asarray(img)
+        cache_key = None
+        mask = None
+        cascade = None
+        if needs_mask:
+            cache = get_mask_cache()
+            cache_key = cache.make_key(pixels, mask_cache_tag(self.model_name, mask_mode))
+            mask = cache.get(cache_key)
+            if mask is None and segmentation == 'cascade':
+                threshold_mask, info = threshold_tier(pixels)
+                if info['tier'] == 'threshold':
+                    mask = threshold_mask
+                    record_tier(info)
+                cascade = (threshold_mask, info)
+        return img, pixels, cache_key, mask, cascade
+
+    def _finish(self, index, filename, img, mask, operations, background, platform, output, asset_key=None):
+        """Apply the operations to one image and write the encoded result."""
+        try:
+            result = img
+            mask_img = Image.fromarray(mask, 'L') if mask is not None else None
+            for op in operations:
+                if op == 'remove':
+                    result = apply_mask(result, mask_img)
+                elif op == 'replace':
+                    if should_tile(result):
+                        result = composite_product_tiled(result, mask_img, background)
+                    else:
+                        bg = load_background(background, result.size)
+                        result = composite_product(result.convert('RGBA'), mask_img, bg)
+                elif op == 'enhance':
+                    result = enhance_image_tiled(result) if should_tile(result) else enhance_image(result)
+                elif op == 'crop':
+                    result = crop_to_platform(result, platform)
+                    if mask_img is not None:
+                        mask_img = crop_to_platform(mask_img, platform)
+
+            base = filename.rsplit('.', 1)[0] or 'image'
+            if asset_key is not None:
+                encoding = save_output(result, self.asset_store.prepare(asset_key), f'batch_{base}', output)
+                stored = self.asset_store.commit(asset_key, {'processed_filenames': [encoding['filename']],
+                                                             'encodings': [encoding]})
+                processed_filename = stored['processed_filename']
+            else:
+                encoding = save_output(result, self.output_dir, f'batch_{index}_{base}', output)
+                processed_filename = encoding['filename']
+            return {'index': index, 'filename': filename, 'status': 'ok',
+                    'processed_filename': processed_filename, 'format': encoding['format'],
+                    'bytes': encoding['bytes'], 'encode_ms': encoding['encode_ms']}
+        except Exception as e:
+            print(f"❌ Batch item {index} ({filename}) failed: {e}")
+            return {'index': index, 'filename': filename, 'status': 'error', 'error': str(e)}
+
+    def process(self, items, operations, background=DEFAULT_BACKGROUND, platform='meesho', mask_mode='full',
+                output=None, segmentation='birefnet'):
+        """
+        Process images and yield one result dict per image as it completes,
+        followed by a summary dict with 'done': True.
+
+        Args:
+            items (iterable): (filename, image bytes) pairs; consumed lazily
+            operations (list): Names from BATCH_OPERATIONS, applied in order
+            background (str): Background for 'replace'
+            platform (str): Platform for 'crop'
+            mask_mode (str): BiRefNet mask mode, 'full' or 'guided'
+            output (dict): Encoder options from output_encoder.output_options()
+            segmentation (str): 'birefnet', or 'cascade' to try the threshold tier first
+
+        Yields:
+            dict: Per-image results (completion order), then the summary
+        """
+        needs_mask = 'remove' in operations or 'replace' in operations
+        items = enumerate(items)
+        decoding = deque()
+        finishing = set()
+        window = self.batch_size * 2
+        summary = {'done': True, 'total': 0, 'succeeded': 0, 'failed': 0,
+                   'inference_batches': 0, 'mask_cache_hits': 0, 'asset_hits': 0}
+        if segmentation == 'cascade':
+            summary['segmentation_tiers'] = {'threshold': 0, 'birefnet': 0}
+        tiers = {}
+        asset_keys = {}
+        stored = deque()
+        key_params = {'operations': operations, 'background': background, 'platform': platform,
+                      'mask_mode': mask_mode, 'output': output, 'segmentation': segmentation}
+
+        def fill_decode_window():
+            # Keep a bounded number of decodes in flight ahead of inference
+            while len(decoding) < window:
+                item = next(items, None)
+                if item is None:
+                    return
+                index, (filename, data) = item
+                summary['total'] += 1
+                if self.asset_store is not None:
+                    key = self.asset_store.make_key(data, 'batch', key_params)
+                    manifest = self.asset_store.lookup(key)
+                    if manifest is not None:
+                        # Same image and settings already processed: no decode, no inference
+                        summary['asset_hits'] += 1
+                        encoding = manifest['encodings'][0]
+                        stored.append({'index': index, 'filename': filename, 'status': 'ok',
+                                       'processed_filename': manifest['processed_filename'],
+                                       'format': encoding['format'], 'bytes': encoding['bytes'],
+                                       'encode_ms': 0.0, 'cached': True})
+                        continue
+                    asset_keys[index] = key
+                decoding.append((index, filename, self.executor.submit(self._decode, data, needs_mask, mask_mode,
+                                                                         segmentation)))
+
+        def collect(result):
+            summary['succeeded' if result['status'] == 'ok' else 'failed'] += 1
+            tier = tiers.pop(result['index'], None)
+            if tier is not None:
+                result['segmentation_tier'] = tier
+                summary['segmentation_tiers'][tier] += 1
+            return result
+
+        fill_decode_window()
+        while decoding or stored:
+            while stored:
+                yield collect(stored.popleft())
+            group = []
+            while decoding and len(group) < self.batch_size:
+                index, filename, future = decoding.popleft()
+                try:
+                    group.append((index, filename) + future.result())
+                except Exception as e:
+                    yield collect({'index': index, 'filename': filename, 'status': 'error',
+                                   'error': f'Could not decode image: {e}'})
+                fill_decode_window()
+
+            # Everything not served by the mask cache (or the threshold tier) goes through one batched call
+            for entry in group:
+                if entry[6] is not None:
+                    tiers[entry[0]] = entry[6][1]['tier']
+            pending = [entry for entry in group if needs_mask and entry[5] is None]
+            summary['mask_cache_hits'] += sum(1 for entry in group
+                                              if needs_mask and entry[5] is not None and entry[6] is None)
+            masks = {}
+            if pending:
+                cache = get_mask_cache()
+                try:
+                    started = time.perf_counter()
+                    predicted = get_bg_remover(self.model_name).predict_masks(
+                        [entry[3] for entry in pending], batch_size=self.batch_size, mask_mode=mask_mode)
+                    batch_ms = (time.perf_counter() - started) * 1000 / len(pending)
+                    summary['inference_batches'] += 1
+                    for entry, mask in zip(pending, predicted):
+                        cache.put(entry[4], mask)
+                        if entry[6] is not None:
+                            record_tier(note_birefnet(entry[6][1], entry[6][0], mask, batch_ms))
+                except Exception as e:
+                    print(f"❌ Batched BiRefNet inference failed: {e}")
+                    # Fully opaque masks as fallback; not cached so a retry re-runs inference
+                    predicted = [np.full(entry[3].shape[:2], 255, dtype=np.uint8) for entry in pending]
+                for entry, mask in zip(pending, predicted):
+                    masks[entry[0]] = mask
+
+            for index, filename, img, _, _, cached_mask, _ in group:
+                mask = cached_mask if cached_mask is not None else masks.get(index)
+                finishing.add(self.executor.submit(
+                    self._finish, index, filename, img, mask, operations, background, platform, output,
+                    asset_keys.pop(index, None)))
+
+            for future in [f for f in finishing if f.done()]:
+                finishing.remove(future)
+                yield collect(future.result())
+
+        for future in as_completed(finishing):
+            yield collect(future.result())
+
+        yield summary
@@ -5,10 +5,29 @@ BiRefNet significantly outperforms U2Net in accuracy and edge quality.
 """
 
 import os
+import time
+import cv2
 import numpy as np
 from PIL import Image
 import io
 from rembg import remove, new_session
+from models.mask_cache import get_mask_cache
+from models.mask_refine import bounded_size, guided_upsample
+from models.onnx_session import load_session
+
+# ImageNet normalisation used by every BiRefNet checkpoint
+BIREFNET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+BIREFNET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+BIREFNET_INPUT_SIZE = (1024, 1024)
+
+# 'full': the whole image is resized into the model and the mask resized back.
+# 'guided': segmentation runs on a copy bounded to GUIDED_MAX_SIDE and the mask
+# is upsampled with a guided filter, so full-resolution cost stays small.
+MASK_MODES = ('full', 'guided')
+GUIDED_MAX_SIDE = int(os.environ.get('BIREFNET_GUIDED_MAX_SIDE', 1024))
+
+# Request-facing quality tiers and the model weights each one runs
+QUALITY_TIERS = {'high': 'fp32', 'fast': 'int8'}
 
 class BiRefNetBackgroundRemover:
     """
@@ -16,7 +35,7 @@ class BiRefNetBackgroundRemover:
     BiRefNet is state-of-the-art for dichotomous image segmentation.
     """
     
-    def __init__(self, model_name='birefnet-general'):
+    def __init__(self, model_name='birefnet-general', session=None, precision='fp32'):
         """
         Initialize BiRefNet background remover.
         
@@ -25,29 +44,224 @@ class BiRefNetBackgroundRemover:
                 - 'birefnet-general': Best overall performance
                 - 'birefnet-portrait': Optimized for people
                 - 'birefnet-massive': Trained on massive dataset
+            session: Pre-built rembg session to use instead of loading one
+            precision (str): 'fp32' or 'int8' (the quantised copy; see
+                models.onnx_session.quantize_model)
         """
         self.model_name = model_name
-        self.session = None
-        self._initialize_session()
+        self.precision = precision
+        self.session = session
+        self._batch_unsupported = False
+        # ONNX Runtime settings and load time (see models.onnx_session)
+        self.session_info = {'model_name': model_name, 'precision': precision, 'prebuilt': True}
+        self.warmup_ms = None
+        if self.session is None:
+            self._initialize_session()
     
     def _initialize_session(self):
         """Initialize the rembg session with BiRefNet model."""
+        if self.precision != 'fp32':
+            # No silent fallback: a missing INT8 copy must not turn into an fp32 (or U2Net) model
+            self.session, self.session_info = load_session(self.model_name, precision=self.precision)
+            return
         try:
             # Create session with BiRefNet model
-            self.session = new_session(self.model_name)
+            self.session, self.session_info = load_session(self.model_name)
             print(f"✅ BiRefNet model '{self.model_name}' loaded successfully")
         except Exception as e:
             print(f"⚠️ Failed to load BiRefNet model '{self.model_name}': {e}")
             # Fallback to general model
             try:
-                self.session = new_session('birefnet-general')
+                self.session, self.session_info = load_session('birefnet-general')
                 print("✅ Fallback to birefnet-general model successful")
             except Exception as fallback_error:
                 print(f"❌ Failed to load any BiRefNet model: {fallback_error}")
                 # Final fallback to u2net
                 self.session = new_session('u2net')
+                self.session_info = {'model_name': 'u2net', 'fallback': True}
                 print("⚠️ Using U2Net as final fallback")
     
+    def warmup(self):
+        """
+        Run one inference at the model input size so the first real request
+        does not pay for lazy kernel initialisation and arena allocation.
+        
+        Returns:
+            float: Warm-up time in milliseconds
+        """
+        width, height = self.input_size
+        started = time.perf_counter()
+        self.predict_mask(np.zeros((height, width, 3), dtype=np.uint8))
+        self.warmup_ms = round((time.perf_counter() - started) * 1000, 1)
+        return self.warmup_ms
+    
+    def status(self):
+        """Session settings, load and warm-up times of this process's model."""
+        return dict(self.session_info, input_size=list(self.input_size),
+                    warmup_ms=self.warmup_ms, pid=os.getpid())
+    
+    @property
+    def input_size(self):
+        """(width, height) the ONNX model expects, read from the session when static."""
+        try:
+            shape = self.session.inner_session.get_inputs()[0].shape
+            if isinstance(shape[2], int) and isinstance(shape[3], int):
+                return (shape[3], shape[2])
+        except (AttributeError, IndexError):
+            pass
+        return BIREFNET_INPUT_SIZE
+    
+    def _supports_tensor_path(self):
+        """Whether the loaded session is a BiRefNet graph we can feed directly."""
+        return (
+            getattr(self.session, 'inner_session', None) is not None
+            and self.session.__class__.__name__.startswith('BiRefNet')
+        )
+    
+    def preprocess_array(self, image_array):
+        """
+        Turn an RGB(A) uint8 array into a normalised NCHW float32 tensor.
+        
+        Args:
+            image_array (np.ndarray): HxWx3 or HxWx4 uint8 image
+            
+        Returns:
+            np.ndarray: 1x3xHxW float32 tensor at the model input size
+        """
+        rgb = image_array[:, :, :3]
+        downscale = rgb.shape[1] >= self.input_size[0] and rgb.shape[0] >= self.input_size[1]
+        interpolation = cv2.INTER_AREA if downscale else cv2.INTER_LANCZOS4
+        resized = cv2.resize(rgb, self.input_size, interpolation=interpolation)
+        tensor = resized.astype(np.float32)
+        tensor *= 1.0 / max(int(resized.max()), 1)
+        tensor -= BIREFNET_MEAN
+        tensor /= BIREFNET_STD
+        return tensor.transpose(2, 0, 1)[np.newaxis]
+    
+    @staticmethod
+    def postprocess_logits(logits, output_size):
+        """
+        Turn raw BiRefNet logits into a uint8 mask at the requested size.
+        
+        Args:
+            logits (np.ndarray): HxW logits for one image
+            output_size (tuple): (width, height) of the original image
+            
+        Returns:
+            np.ndarray: HxW uint8 mask
+        """
+        pred = 1.0 / (1.0 + np.exp(-logits))
+        lo, hi = pred.min(), pred.max()
+        pred = (pred - lo) / max(hi - lo, 1e-6)
+        mask = (pred * 255).astype(np.uint8)
+        return cv2.resize(mask, output_size, interpolation=cv2.INTER_LANCZOS4)
+    
+    @staticmethod
+    def _bounded(image_array, max_side):
+        """Image downscaled so its long side is at most max_side (unchanged if already smaller)."""
+        height, width = image_array.shape[:2]
+        size = bounded_size(width, height, max_side)
+        if size == (width, height):
+            return image_array
+        return cv2.resize(image_array, size, interpolation=cv2.INTER_AREA)
+    
+    def predict_mask(self, image_array, mask_mode='full', max_side=GUIDED_MAX_SIDE):
+        """
+        Array-native segmentation: uint8 pixels in, uint8 mask out.
+        
+        Unlike remove_background(), nothing is encoded to PNG and no RGBA
+        cutout is built; the image goes straight into the ONNX session.
+        
+        Args:
+            image_array (np.ndarray): HxWx3 (RGB) or HxWx4 (RGBA) uint8 image
+            mask_mode (str): 'full' or 'guided' (see MASK_MODES)
+            max_side (int): Long side segmentation runs at in 'guided' mode
+            
+        Returns:
+            np.ndarray: HxW uint8 mask at the input resolution
+        """
+        if image_array.dtype != np.uint8 or image_array.ndim != 3 or image_array.shape[2] not in (3, 4):
+            raise ValueError(f"Expected HxWx3/4 uint8 array, got {image_array.dtype} {image_array.shape}")
+        if mask_mode not in MASK_MODES:
+            raise ValueError(f"Unknown mask_mode '{mask_mode}'. Supported: {', '.join(MASK_MODES)}")
+        
+        if mask_mode == 'guided':
+            work = self._bounded(image_array, max_side)
+            if work is not image_array:
+                return guided_upsample(self.predict_mask(work), image_array, guide_low=work)
+        
+        height, width = image_array.shape[:2]
+        if self._supports_tensor_path():
+            inner = self.session.inner_session
+            feeds = {inner.get_inputs()[0].name: self.preprocess_array(image_array)}
+            logits = inner.run(None, feeds)[0][0, 0]
+            return self.postprocess_logits(logits, (width, height))
+        
+        # Non-BiRefNet fallback sessions (e.g. u2net) keep their own pre/post-processing
+        rgb = Image.fromarray(np.ascontiguousarray(image_array[:, :, :3]))
+        mask = self.session.predict(rgb)[0]
+        if mask.size != (width, height):
+            mask = mask.resize((width, height), Image.LANCZOS)
+        return np.asarray(mask.convert('L'))
+
+    def _session_batch_size(self, requested):
+        """Largest batch the ONNX graph accepts: its static batch dim, or requested if dynamic."""
+        if self._batch_unsupported:
+            return 1
+        batch_dim = self.session.inner_session.get_inputs()[0].shape[0]
+        if isinstance(batch_dim, int) and batch_dim > 0:
+            return batch_dim
+        return requested
+
+    def predict_masks(self, image_arrays, batch_size=4, mask_mode='full', max_side=GUIDED_MAX_SIDE):
+        """
+        Batched array-native segmentation: one ONNX call per group of images.
+
+        Images are preprocessed to the model input size and stacked into a
+        single NCHW tensor, so a group of batch_size images costs one session
+        run instead of batch_size runs. Graphs exported with a fixed batch of
+        1 are detected and run image by image.
+
+        Args:
+            image_arrays (list): HxWx3/4 uint8 images (sizes may differ)
+            batch_size (int): Images per ONNX call
+            mask_mode (str): 'full' or 'guided' (see MASK_MODES)
+            max_side (int): Long side segmentation runs at in 'guided' mode
+
+        Returns:
+            list: HxW uint8 masks in input order
+        """
+        if mask_mode not in MASK_MODES:
+            raise ValueError(f"Unknown mask_mode '{mask_mode}'. Supported: {', '.join(MASK_MODES)}")
+        if mask_mode == 'guided':
+            works = [self._bounded(arr, max_side) for arr in image_arrays]
+            masks = self.predict_masks(works, batch_size=batch_size)
+            return [mask if work is arr else guided_upsample(mask, arr, guide_low=work)
+                    for arr, work, mask in zip(image_arrays, works, masks)]
+        if not self._supports_tensor_path():
+            return [self.predict_mask(arr) for arr in image_arrays]
+
+        inner = self.session.inner_session
+        input_name = inner.get_inputs()[0].name
+        batch_size = max(1, self._session_batch_size(batch_size))
+
+        masks = []
+        for start in range(0, len(image_arrays), batch_size):
+            chunk = image_arrays[start:start + batch_size]
+            tensor = np.concatenate([self.preprocess_array(arr) for arr in chunk], axis=0)
+            try:
+                logits = inner.run(None, {input_name: tensor})[0]
+            except Exception as e:
+                if len(chunk) == 1:
+                    raise
+                print(f"⚠️ Batched BiRefNet inference failed ({e}); falling back to one image per call")
+                self._batch_unsupported = True
+                masks.extend(self.predict_mask(arr) for arr in chunk)
+                continue
+            for i, arr in enumerate(chunk):
+                masks.append(self.postprocess_logits(logits[i, 0], (arr.shape[1], arr.shape[0])))
+        return masks
+
     def remove_background(self, input_image):
         """
         Remove background from image using BiRefNet.
@@ -131,10 +345,17 @@ class BiRefNetBackgroundRemover:
 
 # Global instance for efficient reuse
 _bg_remover = None
+# Quantised removers by model name, loaded next to the fp32 one on first use
+_quantized_removers = {}
 
-def get_bg_remover(model_name='birefnet-general'):
+def get_bg_remover(model_name='birefnet-general', precision='fp32'):
     """Get or create global BiRefNet background remover instance."""
     global _bg_remover
+    if precision != 'fp32':
+        remover = _quantized_removers.get(model_name)
+        if remover is None:
+            remover = _quantized_removers[model_name] = BiRefNetBackgroundRemover(model_name, precision=precision)
+        return remover
     if _bg_remover is None or _bg_remover.model_name != model_name:
         _bg_remover = BiRefNetBackgroundRemover(model_name)
     return _bg_remover
@@ -158,30 +379,72 @@ def remove_background_birefnet(input_image, model_name='birefnet-general', advan
     else:
         return remover.remove_background(input_image)
 
+def mask_cache_tag(model_name, mask_mode='full', precision='fp32'):
+    """Model tag for mask cache keys; guided and INT8 masks are cached apart from full fp32 ones."""
+    tag = model_name if precision == 'fp32' else f'{model_name}:{precision}'
+    if mask_mode == 'guided':
+        return f'{tag}:guided{GUIDED_MAX_SIDE}'
+    return tag
+
+def run_birefnet_array(image_array, model_name='birefnet-general', use_cache=True, mask_mode='full',
+                       precision='fp32'):
+    """
+    Array-native mask prediction with the shared mask cache in front.
+    
+    Args:
+        image_array (np.ndarray): HxWx3 or HxWx4 uint8 image
+        model_name (str): BiRefNet model to use
+        use_cache (bool): Consult and populate the mask cache
+        mask_mode (str): 'full' or 'guided' (see MASK_MODES)
+        precision (str): 'fp32' or 'int8' model weights
+        
+    Returns:
+        np.ndarray: HxW uint8 mask at the input resolution
+    """
+    if mask_mode not in MASK_MODES:
+        raise ValueError(f"Unknown mask_mode '{mask_mode}'. Supported: {', '.join(MASK_MODES)}")
+    cache = get_mask_cache() if use_cache else None
+    if cache is not None:
+        cache_key = cache.make_key(image_array, mask_cache_tag(model_name, mask_mode, precision))
+        cached_mask = cache.get(cache_key)
+        if cached_mask is not None:
+            return cached_mask
+    
+    try:
+        mask = get_bg_remover(model_name, precision).predict_mask(image_array, mask_mode=mask_mode)
+    except Exception as e:
+        print(f"❌ BiRefNet processing failed: {e}")
+        # Fully opaque mask as fallback; not cached so the next request retries
+        return np.full(image_array.shape[:2], 255, dtype=np.uint8)
+    
+    if cache is not None:
+        cache.put(cache_key, mask)
+    
+    return mask
+
 # Compatibility function to replace U2Net
-def run_birefnet(pil_image):
+def run_birefnet(pil_image, model_name='birefnet-general', use_cache=True, mask_mode='full'):
     """
     Drop-in replacement for run_u2net function.
     
+    Masks are looked up in the shared content-addressed mask cache first, so
+    the same image sent to several Photogenix endpoints is segmented once.
+    
     Args:
         pil_image (PIL.Image): Input image
+        model_name (str): BiRefNet model to use
+        use_cache (bool): Consult and populate the mask cache
+        mask_mode (str): 'full' or 'guided' (see MASK_MODES)
         
     Returns:
         PIL.Image: Mask image (L mode) for compatibility
     """
     try:
-        # Remove background using BiRefNet
-        result = remove_background_birefnet(pil_image, advanced=True)
-        
-        # Extract alpha channel as mask for compatibility with existing code
-        if result.mode == 'RGBA':
-            # Get alpha channel
-            mask = result.split()[-1]  # Alpha channel
-        else:
-            # Convert to grayscale if no alpha
-            mask = result.convert('L')
-        
-        return mask
+        if pil_image.mode not in ('RGB', 'RGBA'):
+            pil_image = pil_image.convert('RGB')
+        mask = run_birefnet_array(np.asarray(pil_image), model_name=model_name, use_cache=use_cache,
+                                  mask_mode=mask_mode)
+        return Image.fromarray(mask, 'L')
         
     except Exception as e:
         print(f"❌ BiRefNet processing failed: {e}")
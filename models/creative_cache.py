@@ -0,0 +1,216 @@
+"""
+Creative Content Cache Module
+Gemini answers for /process/creative_content, keyed by a signature of the
+product photo plus the prompt version. The signature is a grayscale
+difference hash (layout) and the mean colour of each quadrant; the colour
+part keeps a red and a blue shirt shot the same way from sharing a caption.
+Sellers re-run the tool on recompressed or re-exported copies of a shot, so
+a lookup also accepts cached photos within CREATIVE_HASH_DISTANCE bits and
+CREATIVE_COLOUR_TOLERANCE levels.
+Photos that do reach Gemini are first bounded to CREATIVE_MAX_SIDE pixels and
+re-encoded as JPEG; the model scales large images down itself, so extra
+resolution only costs upload time.
+"""
+
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from models.mask_refine import bounded_size
+
+# Long side of the image sent to Gemini, and its JPEG quality
+CREATIVE_MAX_SIDE = int(os.environ.get('CREATIVE_MAX_SIDE', 768))
+CREATIVE_JPEG_QUALITY = int(os.environ.get('CREATIVE_JPEG_QUALITY', 85))
+
+
+def perceptual_hash(img):
+    """
+    64-bit difference hash: the sign of the horizontal gradient on a 9x8
+    grayscale thumbnail. Resizing, recompression and small edits flip only a
+    few bits.
+
+    Args:
+        img (PIL.Image): Image in any mode and size
+
+    Returns:
+        int: Hash as an unsigned 64-bit integer
+    """
+    thumb = np.asarray(img.convert('L').resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+
+def hash_distance(a, b):
+    """Number of differing bits between two perceptual hashes."""
+    return bin(a ^ b).count('1')
+
+
+def colour_signature(img):
+    """Mean RGB of each image quadrant, as a 12-tuple of 0-255 integers."""
+    return tuple(np.asarray(img.convert('RGB').resize((2, 2), Image.BOX)).flatten().tolist())
+
+
+def colour_distance(a, b):
+    """Largest difference between two colour signatures, in levels."""
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+def image_signature(img):
+    """
+    Cache signature of a photo.
+
+    Returns:
+        tuple: (perceptual_hash, colour_signature)
+    """
+    return perceptual_hash(img), colour_signature(img)
+
+
+def model_image(img, max_side=None, quality=None):
+    """
+    The image as sent to Gemini: bounded to max_side and encoded as JPEG.
+
+    Args:
+        img (PIL.Image): Product photo
+        max_side (int): Long side limit (defaults to CREATIVE_MAX_SIDE)
+        quality (int): JPEG quality (defaults to CREATIVE_JPEG_QUALITY)
+
+    Returns:
+        bytes: JPEG data
+    """
+    size = bounded_size(img.width, img.height, max_side or CREATIVE_MAX_SIDE)
+    if size != img.size:
+        img = img.resize(size, Image.LANCZOS, reducing_gap=2.0)
+    buf = io.BytesIO()
+    img.convert('RGB').save(buf, 'JPEG', quality=quality or CREATIVE_JPEG_QUALITY)
+    return buf.getvalue()
+
+
+class CreativeCache:
+    """
+    In-memory LRU of creative content answers with a time-to-live, plus the
+    counters behind /api/creative-cache-stats.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=24 * 3600, max_distance=1, colour_tolerance=8,
+                 clock=time.monotonic):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Answers kept before the least recently used is evicted
+            ttl_seconds (float): Age after which an answer is no longer served
+            max_distance (int): Hash bits two photos may differ by and still share an answer
+            colour_tolerance (int): Levels any quadrant's mean colour may differ by
+            clock (callable): Time source in seconds
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.colour_tolerance = colour_tolerance
+        self.clock = clock
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.requests_sent = 0
+        self.bytes_sent = 0
+        self.bytes_uploaded = 0
+
+    def _expire(self, now):
+        for key in [key for key, (_, stored_at) in self._entries.items() if now - stored_at > self.ttl_seconds]:
+            del self._entries[key]
+            self.expirations += 1
+
+    def _near(self, signature, version):
+        """Key of the closest entry within both tolerances, or None (lock held)."""
+        image_hash, colours = signature
+        candidates = [(hash_distance(image_hash, h), colour_distance(colours, c), (v, (h, c)))
+                      for v, (h, c) in self._entries if v == version]
+        matches = [candidate for candidate in candidates
+                   if candidate[0] <= self.max_distance and candidate[1] <= self.colour_tolerance]
+        return min(matches)[2] if matches else None
+
+    def get(self, signature, version):
+        """
+        Cached answer for a photo, or None.
+
+        Args:
+            signature (tuple): image_signature() of the photo
+            version: Prompt version the answer must have been produced with
+
+        Returns:
+            dict: The cached answer, or None
+        """
+        with self._lock:
+            self._expire(self.clock())
+            key = (version, signature)
+            if key not in self._entries:
+                key = self._near(signature, version)
+                if key is None:
+                    self.misses += 1
+                    return None
+                self.near_hits += 1
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, signature, version, answer):
+        """Store a parsed answer for a photo under its image_signature()."""
+        with self._lock:
+            self._entries[(version, signature)] = (answer, self.clock())
+            self._entries.move_to_end((version, signature))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def note_sent(self, bytes_sent, bytes_uploaded):
+        """Record one Gemini request: bytes of the image sent and of the original upload."""
+        with self._lock:
+            self.requests_sent += 1
+            self.bytes_sent += bytes_sent
+            self.bytes_uploaded += bytes_uploaded
+
+    def stats(self):
+        """Return hit/miss counters, entries and bytes sent to Gemini."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'near_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'requests_sent': self.requests_sent,
+                'bytes_sent': self.bytes_sent,
+                'bytes_uploaded': self.bytes_uploaded,
+                'bytes_per_request': self.bytes_sent / self.requests_sent if self.requests_sent else 0.0,
+            }
+
+
+# Global instance shared by the creative content route
+_creative_cache = None
+
+
+def get_creative_cache():
+    """Get or create the global creative content cache."""
+    global _creative_cache
+    if _creative_cache is None:
+        _creative_cache = CreativeCache(
+            max_entries=int(os.environ.get('CREATIVE_CACHE_ENTRIES', 1024)),
+            ttl_seconds=float(os.environ.get('CREATIVE_CACHE_TTL_HOURS', 24)) * 3600,
+            max_distance=int(os.environ.get('CREATIVE_HASH_DISTANCE', 1)),
+            colour_tolerance=int(os.environ.get('CREATIVE_COLOUR_TOLERANCE', 8)),
+        )
+    return _creative_cache
@@ -0,0 +1,195 @@
+"""
+Discount Cache Module
+Gemini discount recommendations keyed by a quantised feature signature:
+category, price band, health bucket and festival set. Products that share a
+signature get near-identical advice, so one answer serves them all for
+DISCOUNT_CACHE_TTL_HOURS. The prompt behind a shared answer describes the
+signature (signature_ranges), never one product's name, stock or age.
+Answers live in SQLite, so they survive worker restarts and are shared by
+every gunicorn worker on the host. Only the model's answer is cached
+(discount, reasoning, strategies); prices and revenue are recomputed for
+each product.
+"""
+
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# SQLite file shared by every worker on the host (under the gitignored logs/ folder by default)
+DISCOUNT_CACHE_DB = os.environ.get('DISCOUNT_CACHE_DB', 'logs/discount_cache.db')
+# Width of a price band as a ratio (0.25: each band spans 25% more than the one below)
+DISCOUNT_PRICE_BAND = float(os.environ.get('DISCOUNT_PRICE_BAND', 0.25))
+# Width of a health score bucket
+DISCOUNT_HEALTH_BUCKET = float(os.environ.get('DISCOUNT_HEALTH_BUCKET', 0.1))
+# Bump when the discount prompt changes, so earlier answers are not served for it
+DISCOUNT_PROMPT_VERSION = 2
+
+
+def feature_signature(product_data, health_score, festival_names, price_band=None, health_bucket=None):
+    """
+    Quantised signature of the inputs that drive a discount recommendation.
+
+    Args:
+        product_data (dict): Product details ('category', 'price')
+        health_score (float): Product health score (0-1)
+        festival_names (list): Recommended festival names
+        price_band (float): Price band width as a ratio (defaults to DISCOUNT_PRICE_BAND)
+        health_bucket (float): Health bucket width (defaults to DISCOUNT_HEALTH_BUCKET)
+
+    Returns:
+        str: Signature such as 'v2|clothing|p31|h2|diwali,holi'
+    """
+    price_band = price_band or DISCOUNT_PRICE_BAND
+    health_bucket = health_bucket or DISCOUNT_HEALTH_BUCKET
+    category = str(product_data.get('category', 'general')).strip().lower()
+    price_index = _price_index(product_data, price_band)
+    health_index = _health_index(health_score, health_bucket)
+    festivals = ','.join(sorted({str(name).strip().lower() for name in festival_names}))
+    return f'v{DISCOUNT_PROMPT_VERSION}|{category}|p{price_index}|h{health_index}|{festivals}'
+
+
+def signature_ranges(product_data, health_score, price_band=None, health_bucket=None):
+    """
+    Price and health score ranges covered by a product's signature.
+
+    Args:
+        product_data (dict): Product details ('price')
+        health_score (float): Product health score (0-1)
+        price_band (float): Price band width as a ratio (defaults to DISCOUNT_PRICE_BAND)
+        health_bucket (float): Health bucket width (defaults to DISCOUNT_HEALTH_BUCKET)
+
+    Returns:
+        dict: 'price' and 'health' as (low, high) tuples; price is (0, 0) when unknown
+    """
+    price_band = price_band or DISCOUNT_PRICE_BAND
+    health_bucket = health_bucket or DISCOUNT_HEALTH_BUCKET
+    price_index = _price_index(product_data, price_band)
+    health_index = _health_index(health_score, health_bucket)
+    price = (0.0, 0.0) if price_index < 0 else ((1 + price_band) ** price_index, (1 + price_band) ** (price_index + 1))
+    return {
+        'price': price,
+        'health': (health_index * health_bucket, min((health_index + 1) * health_bucket, 1.0)),
+    }
+
+
+def _price_index(product_data, price_band):
+    price = float(product_data.get('price', 0) or 0)
+    return int(math.floor(math.log(price) / math.log1p(price_band))) if price > 0 else -1
+
+
+def _health_index(health_score, health_bucket):
+    return int(math.floor(min(max(health_score, 0.0), 1.0) / health_bucket))
+
+
+class DiscountCache:
+    """SQLite table of recommendations by signature, with a time-to-live and hit counters."""
+
+    def __init__(self, db_path=None, ttl_seconds=24 * 3600, clock=time.time):
+        """
+        Initialize the cache.
+
+        Args:
+            db_path (str): SQLite file (defaults to DISCOUNT_CACHE_DB)
+            ttl_seconds (float): Age after which a recommendation is no longer served
+            clock (callable): Wall-clock time source in seconds
+        """
+        self.db_path = db_path or DISCOUNT_CACHE_DB
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.init_database()
+
+    def _connect(self):
+        # Several gunicorn workers share the file; wait for a writer instead of failing
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def init_database(self):
+        """Create the recommendations table if needed."""
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS discount_recommendations (
+                signature TEXT PRIMARY KEY,
+                recommendation TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def get(self, signature):
+        """
+        Cached recommendation for a signature, or None if absent or expired.
+
+        Args:
+            signature (str): feature_signature() of the product
+
+        Returns:
+            dict: The cached recommendation, or None
+        """
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT recommendation FROM discount_recommendations WHERE signature = ? AND created_at >= ?',
+                (signature, self.clock() - self.ttl_seconds)).fetchone()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Discount cache read failed: {e}")
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, signature, recommendation):
+        """Store a recommendation, replacing any earlier one, and drop expired rows (never raises)."""
+        now = self.clock()
+        try:
+            conn = self._connect()
+            conn.execute('INSERT OR REPLACE INTO discount_recommendations VALUES (?, ?, ?)',
+                         (signature, json.dumps(recommendation), now))
+            conn.execute('DELETE FROM discount_recommendations WHERE created_at < ?', (now - self.ttl_seconds,))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Discount cache write failed: {e}")
+
+    def stats(self):
+        """Return hit/miss counters and the number of stored recommendations."""
+        try:
+            conn = self._connect()
+            entries = conn.execute('SELECT COUNT(*) FROM discount_recommendations WHERE created_at >= ?',
+                                   (self.clock() - self.ttl_seconds,)).fetchone()[0]
+            conn.close()
+        except sqlite3.Error:
+            entries = None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': entries,
+                'ttl_seconds': self.ttl_seconds,
+            }
+
+
+# Global instance shared by the discount calculator
+_discount_cache = None
+
+
+def get_discount_cache():
+    """Get or create the global discount cache; None when DISCOUNT_CACHE_TTL_HOURS is 0."""
+    global _discount_cache
+    ttl_hours = float(os.environ.get('DISCOUNT_CACHE_TTL_HOURS', 24))
+    if _discount_cache is None and ttl_hours > 0:
+        _discount_cache = DiscountCache(ttl_seconds=ttl_hours * 3600)
+    return _discount_cache
@@ -3,6 +3,10 @@ import os
 import json
 import re
 
+from models.discount_cache import feature_signature, get_discount_cache, signature_ranges
+from models.discount_model import get_discount_model, record_gemini_discount
+from models.llm_gateway import get_llm_gateway
+
 # Ensure Gemini API is configured (this should also be done in app.py to avoid redundant calls)
 # This check is here for self-containation of the model file, but primary configuration
 # should happen once at app startup in app.py.
@@ -11,6 +15,40 @@ if os.environ.get('GOOGLE_API_KEY'):
 else:
     print("Warning: GOOGLE_API_KEY not found in environment variables. Gemini features in SmartDiscountCalculator may not work.")
 
+# Used when Gemini is unavailable or its answer cannot be parsed
+FALLBACK_STRATEGIES = [
+    {"name": "Clearance Sale", "description": "Aggressively price to clear old stock quickly."},
+    {"name": "Limited-Time Offer", "description": "Create urgency with a short-duration discount."},
+    {"name": "Bundle with Popular Items", "description": "Pair with fast-moving products to increase perceived value."},
+    {"name": "Targeted Promotion", "description": "Offer discount to specific customer segments (e.g., loyal customers)."}
+]
+
+
+def parse_gemini_json(raw_text):
+    """Parse a JSON answer from Gemini, which sometimes wraps it in markdown."""
+    cleaned_text = re.sub(r"^```json|^```|```$", "", raw_text, flags=re.MULTILINE).strip()
+    return json.loads(cleaned_text)
+
+
+def four_strategies(sales_strategies):
+    """Exactly 4 strategies: Gemini's first four, padded with generic ones if it gave fewer."""
+    sales_strategies = list(sales_strategies)[:4]
+    while len(sales_strategies) < 4:
+        sales_strategies.append({
+            "name": f"Generic Strategy {len(sales_strategies) + 1}",
+            "description": "Consider a general promotional tactic to boost sales."
+        })
+    return sales_strategies
+
+
+def fallback_reasoning(health_status, health_score, recommended_discount, recommended_festivals):
+    return (
+        f"Fallback: Based on the product's {health_status} health status (score: {health_score:.1%}) "
+        f"and low sales velocity, a {recommended_discount}% discount is recommended. "
+        f"This aims to quickly move existing stock, reduce holding costs, and free up capital. "
+        f"Consider leveraging any {', '.join(recommended_festivals) if recommended_festivals else 'general'} promotional periods for maximum impact."
+    )
+
 class SmartDiscountCalculator:
     """
     Calculates smart discount recommendations and provides detailed reasoning
@@ -18,11 +56,125 @@ class SmartDiscountCalculator:
     """
 
     def __init__(self):
-        # Initialize Gemini model for text generation
+        # Gemini calls go through the shared gateway (deadline, concurrency limit, circuit breaker)
         # CORRECTED: Using models/gemini-1.5-flash as requested
-        self.gemini_model = genai.GenerativeModel("models/gemini-1.5-flash")
+        self.gemini_model = "models/gemini-1.5-flash"
+        self.llm = get_llm_gateway()
+        # Answers shared by products with the same category, price band, health bucket and festivals
+        self.cache = get_discount_cache()
+        # Deterministic discount for the synchronous response (see quick_discount)
+        self.local_model = get_discount_model()
+
+    @staticmethod
+    def health_status(health_score):
+        if health_score < 0.3:
+            return 'Dead Stock'
+        elif health_score < 0.6:
+            return 'At Risk'
+        return 'Healthy'
+
+    @staticmethod
+    def price_impact(product_data, recommended_discount):
+        """Prices, revenue and category that follow from a discount for this product."""
+        price = product_data.get('price', 0)
+        new_price = price * (1 - recommended_discount / 100)
+        return {
+            'new_price': new_price,
+            'price_reduction': price * (recommended_discount / 100),
+            'expected_revenue': new_price * product_data.get('stock_quantity', 0),
+            'discount_category': 'High' if recommended_discount > 30 else 'Medium' if recommended_discount > 15 else 'Low',
+        }
+
+    def quick_discount(self, product_data, health_score, festival_result):
+        """
+        Discount from the local model, without calling Gemini; reasoning and
+        sales strategies are left empty for explain_discount to fill in later.
+
+        Args:
+            product_data (dict): Product details as for calculate_discount
+            health_score (float): Product health score (0-1, lower is worse)
+            festival_result (dict): Festival recommendations as for calculate_discount
+
+        Returns:
+            dict: The calculate_discount fields, with 'reasoning' and 'sales_strategies' empty
+        """
+        recommended_festivals = [f['name'] for f in festival_result.get('recommended_festivals', [])]
+        recommended_discount = self.local_model.predict(product_data, health_score, recommended_festivals)
+        return dict(
+            self.price_impact(product_data, recommended_discount),
+            recommended_discount=recommended_discount,
+            risk_score=(1 - health_score) * 100,
+            health_status=self.health_status(health_score),
+            reasoning=[],
+            sales_strategies=[],
+        )
+
+    def explain_discount(self, product_data, health_score, festival_result, recommended_discount):
+        """
+        Gemini's reasoning and 4 sales strategies for a discount that has already
+        been decided (by quick_discount), so the text always argues for the number
+        the shopkeeper sees. The answer names the product, so it is not cached.
+
+        Args:
+            product_data (dict): Product details as for calculate_discount
+            health_score (float): Product health score (0-1, lower is worse)
+            festival_result (dict): Festival recommendations as for calculate_discount
+            recommended_discount (int): The discount to explain
+
+        Returns:
+            dict: 'recommended_discount' (unchanged), 'reasoning' (one paragraph in a list)
+                  and 'sales_strategies'
+        """
+        health_status = self.health_status(health_score)
+        recommended_festivals = [f['name'] for f in festival_result.get('recommended_festivals', [])]
+        festival_context = f"Upcoming festival opportunities: {', '.join(recommended_festivals)}." if recommended_festivals else "No specific upcoming festival opportunities."
+
+        prompt = f"""
+        As an expert retail analyst, explain why a {recommended_discount}% discount suits the given product
+        and suggest 4 distinct sales strategies to make the most of that {recommended_discount}% discount.
+        The discount has already been decided; do not propose a different one.
+
+        Product Details:
+        - Name: '{product_data.get('name', 'product')}'
+        - Category: {product_data.get('category', 'general')}
+        - Original Price: ₹{product_data.get('price', 0):.2f}
+        - Current Stock: {product_data.get('stock_quantity', 0)} units
+        - Days in Stock: {product_data.get('days_in_stock', 0)} days
+        - Sales Velocity (units/day): {product_data.get('sales_velocity', 0)}
+        - Product Health Score (0-1, lower is worse): {health_score:.2f} ({health_status})
+        - {festival_context}
+        - Discount: {recommended_discount}%
+
+        Generate the response as a JSON object with the following structure:
+        {{
+            "reasoning_text": "A single, well-structured paragraph (approx. 80-120 words) explaining why a {recommended_discount}% discount suits this product, how it addresses product health, and potential benefits.",
+            "sales_strategies": [
+                {{
+                    "name": "Strategy Name (e.g., Flash Sale, Bundle Offer)",
+                    "description": "A brief, actionable description of this strategy (1-2 sentences)."
+                }}
+            ]
+        }}
+        Give exactly 4 sales strategies.
+        Ensure the output is ONLY a valid JSON object. No additional text, markdown backticks, or explanations outside the JSON.
+        """
+
+        try:
+            parsed_data = parse_gemini_json(self.llm.generate(prompt, model=self.gemini_model))
+            ai_reasoning = parsed_data["reasoning_text"]
+            sales_strategies = four_strategies(parsed_data.get("sales_strategies", []))
+        except Exception as e:
+            print(f"ERROR: Gemini call failed for discount reasoning: {e}")
+            ai_reasoning = fallback_reasoning(health_status, health_score, recommended_discount, recommended_festivals)
+            sales_strategies = list(FALLBACK_STRATEGIES)
 
-    def calculate_discount(self, product_data, health_score, festival_result):
+        return {
+            'recommended_discount': recommended_discount,
+            'reasoning': [ai_reasoning],
+            'sales_strategies': sales_strategies,
+        }
+
+    def calculate_discount(self, product_data, health_score, festival_result, use_cache=True):
         """
         Calculates a recommended discount and generates a detailed reasoning
         and 4 sales strategies based on product health, sales data, and festival opportunities.
@@ -35,11 +187,15 @@ class SmartDiscountCalculator:
                                  Lower score means poorer health (e.g., dead stock).
             festival_result (dict): Dictionary containing festival recommendations,
                                     e.g., {'recommended_festivals': [{'name': 'Diwali'}]}.
+            use_cache (bool): Consult and fill the shared recommendation cache. Without
+                              it Gemini sees the product's own figures, and its choice
+                              is logged to calibrate the local model.
 
         Returns:
             dict: A dictionary containing discount recommendations, AI-generated reasoning,
                   and a list of sales strategies.
         """
+        cache = self.cache if use_cache else None
         product_name = product_data.get('name', 'product')
         price = product_data.get('price', 0)
         stock_quantity = product_data.get('stock_quantity', 0)
@@ -48,12 +204,7 @@ class SmartDiscountCalculator:
         category = product_data.get('category', 'general')
 
         # Determine health status for context in prompt
-        if health_score < 0.3:
-            health_status = 'Dead Stock'
-        elif health_score < 0.6:
-            health_status = 'At Risk'
-        else:
-            health_status = 'Healthy'
+        health_status = self.health_status(health_score)
 
         # Adjust discount based on festival opportunities
         recommended_festivals = [f['name'] for f in festival_result.get('recommended_festivals', [])]
@@ -63,20 +214,32 @@ class SmartDiscountCalculator:
         risk_score = (1 - health_score) * 100 # Convert health score to a risk percentage
 
         # --- Gemini Integration for Discount, Reasoning and Strategies ---
+        if cache:
+            # The answer is shared by every product with this signature, so describe the
+            # signature rather than this product's name, stock and age
+            ranges = signature_ranges(product_data, health_score)
+            subject = "products matching this description"
+            product_details = f"""- Category: {category}
+        - Price Range: ₹{ranges['price'][0]:.2f} to ₹{ranges['price'][1]:.2f}
+        - Product Health Score (0-1, lower is worse): {ranges['health'][0]:.2f} to {ranges['health'][1]:.2f} ({health_status})"""
+        else:
+            subject = "the given product"
+            product_details = f"""- Name: '{product_name}'
+        - Category: {category}
+        - Original Price: ₹{price:.2f}
+        - Current Stock: {stock_quantity} units
+        - Days in Stock: {days_in_stock} days
+        - Sales Velocity (units/day): {sales_velocity}
+        - Product Health Score (0-1, lower is worse): {health_score:.2f} ({health_status})"""
+
         # Craft a detailed prompt for Gemini to generate the discount, reasoning, and strategies
         prompt = f"""
         As an expert retail analyst, determine the optimal discount percentage (as an integer from 0 to 70),
         provide a concise and actionable reasoning for this discount,
-        and suggest 4 distinct sales strategies for the given product.
+        and suggest 4 distinct sales strategies for {subject}.
 
         Product Details:
-        - Name: '{product_name}'
-        - Category: {category}
-        - Original Price: ₹{price:.2f}
-        - Current Stock: {stock_quantity} units
-        - Days in Stock: {days_in_stock} days
-        - Sales Velocity (units/day): {sales_velocity}
-        - Product Health Score (0-1, lower is worse): {health_score:.2f} ({health_status})
+        {product_details}
         - {festival_context}
 
         Generate the response as a JSON object with the following structure:
@@ -110,16 +273,21 @@ class SmartDiscountCalculator:
         ai_reasoning = "Could not generate detailed reasoning."
         sales_strategies = []
 
+        signature = feature_signature(product_data, health_score, recommended_festivals)
+        cached = cache.get(signature) if cache else None
+
         try:
-            print(f"DEBUG: Sending prompt to Gemini for {product_name}...")
-            response = self.gemini_model.generate_content(prompt)
-            raw_text = response.text.strip()
-            print(f"DEBUG: Raw Gemini response received: {raw_text[:500]}...") # Print first 500 chars
-            
-            # Attempt to parse the JSON response. Gemini sometimes wraps it in markdown.
-            cleaned_text = re.sub(r"^```json|^```|```$", "", raw_text, flags=re.MULTILINE).strip()
-            parsed_data = json.loads(cleaned_text)
-            print(f"DEBUG: Parsed Gemini data: {json.dumps(parsed_data, indent=2)}")
+            if cached is not None:
+                print(f"DEBUG: Using cached Gemini recommendation for {signature}")
+                parsed_data = cached
+            else:
+                print(f"DEBUG: Sending prompt to Gemini for {product_name}...")
+                raw_text = self.llm.generate(prompt, model=self.gemini_model)
+                print(f"DEBUG: Raw Gemini response received: {raw_text[:500]}...") # Print first 500 chars
+
+                # Attempt to parse the JSON response. Gemini sometimes wraps it in markdown.
+                parsed_data = parse_gemini_json(raw_text)
+                print(f"DEBUG: Parsed Gemini data: {json.dumps(parsed_data, indent=2)}")
 
             # Extract data from AI response
             recommended_discount = int(parsed_data.get("recommended_discount", recommended_discount))
@@ -133,14 +301,19 @@ class SmartDiscountCalculator:
 
             # Ensure we always return 4 strategies, even if Gemini provides fewer
             # or if parsing fails partially. Fill with generic if needed.
-            while len(sales_strategies) < 4:
-                sales_strategies.append({
-                    "name": f"Generic Strategy {len(sales_strategies) + 1}",
-                    "description": "Consider a general promotional tactic to boost sales."
-                })
-            sales_strategies = sales_strategies[:4] # Ensure max 4
+            sales_strategies = four_strategies(sales_strategies)
             print(f"DEBUG: AI-determined sales_strategies count: {len(sales_strategies)}")
 
+            if cache is None:
+                # Only a choice made from the product's own figures is a calibration label
+                record_gemini_discount(product_data, health_score, recommended_festivals, recommended_discount)
+            elif cached is None:
+                cache.put(signature, {
+                    'recommended_discount': recommended_discount,
+                    'reasoning_text': ai_reasoning,
+                    'sales_strategies': sales_strategies,
+                })
+
         except Exception as e:
             print(f"ERROR: Gemini call failed for discount calculation: {e}")
             print(f"ERROR: Raw Gemini response (if available): {raw_text if 'raw_text' in locals() else 'N/A'}")
@@ -152,34 +325,16 @@ class SmartDiscountCalculator:
             elif health_score < 0.6:
                 recommended_discount = 20
 
-            ai_reasoning = (
-                f"Fallback: Based on the product's {health_status} health status (score: {health_score:.1%}) "
-                f"and low sales velocity, a {recommended_discount}% discount is recommended. "
-                f"This aims to quickly move existing stock, reduce holding costs, and free up capital. "
-                f"Consider leveraging any {', '.join(recommended_festivals) if recommended_festivals else 'general'} promotional periods for maximum impact."
-            )
-            sales_strategies = [
-                {"name": "Clearance Sale", "description": "Aggressively price to clear old stock quickly."},
-                {"name": "Limited-Time Offer", "description": "Create urgency with a short-duration discount."},
-                {"name": "Bundle with Popular Items", "description": "Pair with fast-moving products to increase perceived value."},
-                {"name": "Targeted Promotion", "description": "Offer discount to specific customer segments (e.g., loyal customers)."}
-            ]
+            ai_reasoning = fallback_reasoning(health_status, health_score, recommended_discount, recommended_festivals)
+            sales_strategies = list(FALLBACK_STRATEGIES)
 
         # Recalculate financial impacts using the AI-determined (or fallback) discount
-        new_price = price * (1 - recommended_discount / 100)
-        price_reduction = price * (recommended_discount / 100)
-        
-        # Determine discount category based on the AI-recommended discount
-        discount_category = 'High' if recommended_discount > 30 else 'Medium' if recommended_discount > 15 else 'Low'
-
-        return {
-            'recommended_discount': recommended_discount,
-            'new_price': new_price,
-            'price_reduction': price_reduction,
-            'expected_revenue': new_price * stock_quantity, # Ensure expected_revenue is calculated here
-            'risk_score': risk_score,
-            'health_status': health_status,
-            'discount_category': discount_category,
-            'reasoning': [ai_reasoning], # Still return as a list for consistency with frontend
-            'sales_strategies': sales_strategies # New field
-        }
+        return dict(
+            self.price_impact(product_data, recommended_discount),
+            recommended_discount=recommended_discount,
+            risk_score=risk_score,
+            health_status=health_status,
+            reasoning=[ai_reasoning], # Still return as a list for consistency with frontend
+            sales_strategies=sales_strategies, # New field
+            cached=cached is not None,
+        )
@@ -0,0 +1,161 @@
+"""
+Discount Model Module
+Deterministic local discount predictor, so /api/analyze-product can answer
+with a discount in well under a millisecond while Gemini's reasoning and
+sales strategies are generated in the background. The model is linear in a
+few product features and clipped to 0-70%. Its default weights roughly
+reproduce the calculator's fallback tiers; every discount Gemini chooses from
+a product's full details (the cache bypassed) is logged to DISCOUNT_LOG, and
+benchmarks.calibrate_discount_model refits the weights against that log and
+writes them to DISCOUNT_MODEL_PATH.
+"""
+
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+# Calibrated weights (JSON); the defaults below are used until one is written
+DISCOUNT_MODEL_PATH = os.environ.get('DISCOUNT_MODEL_PATH', 'models/discount_model.json')
+# JSON-lines log of Gemini's discount decisions and their inputs ('' disables logging)
+DISCOUNT_LOG = os.environ.get('DISCOUNT_LOG', 'logs/discount_gemini.jsonl')
+
+FEATURES = ('risk', 'age', 'cover', 'festival')
+DEFAULT_WEIGHTS = {'intercept': 0.0, 'risk': 40.0, 'age': 6.0, 'cover': 8.0, 'festival': 2.0}
+MAX_DISCOUNT = 70
+
+
+def discount_features(product_data, health_score, festival_names):
+    """
+    Features the local model is linear in.
+
+    Args:
+        product_data (dict): Product details ('stock_quantity', 'sales_velocity', 'days_in_stock')
+        health_score (float): Product health score (0-1, lower is worse)
+        festival_names (list): Recommended festival names
+
+    Returns:
+        dict: risk (1 - health), age (years in stock, capped at 2), cover (log days of
+              stock at the current velocity, 1.0 = a year), festival (1 if any is coming)
+    """
+    stock = max(float(product_data.get('stock_quantity', 0) or 0), 0.0)
+    velocity = max(float(product_data.get('sales_velocity', 0) or 0), 0.01)
+    days = max(float(product_data.get('days_in_stock', 0) or 0), 0.0)
+    return {
+        'risk': 1.0 - min(max(float(health_score), 0.0), 1.0),
+        'age': min(days, 730.0) / 365.0,
+        'cover': min(math.log1p(stock / velocity) / math.log1p(365.0), 2.0),
+        'festival': 1.0 if festival_names else 0.0,
+    }
+
+
+class LocalDiscountModel:
+    """Linear discount predictor over discount_features(), clipped and rounded to a whole percent."""
+
+    def __init__(self, weights=None, calibrated_on=0):
+        """
+        Initialize the model.
+
+        Args:
+            weights (dict): 'intercept' plus one weight per feature (defaults to DEFAULT_WEIGHTS)
+            calibrated_on (int): Number of logged Gemini decisions the weights were fitted to
+        """
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.calibrated_on = calibrated_on
+
+    def predict(self, product_data, health_score, festival_names):
+        """Recommended discount as an integer percentage from 0 to MAX_DISCOUNT."""
+        features = discount_features(product_data, health_score, festival_names)
+        value = self.weights['intercept'] + sum(self.weights[name] * features[name] for name in FEATURES)
+        return int(min(max(round(value), 0), MAX_DISCOUNT))
+
+    @classmethod
+    def calibrate(cls, records, ridge=1.0):
+        """
+        Fit weights to logged Gemini decisions by ridge-regularised least squares.
+
+        Args:
+            records (list): Log records with 'product', 'health_score', 'festivals' and 'discount'
+            ridge (float): Pull towards the default weights, which matters for small logs
+
+        Returns:
+            LocalDiscountModel: Model fitted to the records
+        """
+        if not records:
+            raise ValueError('No logged discount decisions to calibrate on')
+        X = np.array([[1.0] + [discount_features(r['product'], r['health_score'], r['festivals'])[name]
+                               for name in FEATURES] for r in records])
+        y = np.array([float(r['discount']) for r in records])
+        prior = np.array([DEFAULT_WEIGHTS['intercept']] + [DEFAULT_WEIGHTS[name] for name in FEATURES])
+        # Solve min |Xw - y|^2 + ridge * |w - prior|^2
+        A = X.T @ X + ridge * np.eye(X.shape[1])
+        w = np.linalg.solve(A, X.T @ y + ridge * prior)
+        weights = {'intercept': float(w[0])}
+        weights.update({name: float(value) for name, value in zip(FEATURES, w[1:])})
+        return cls(weights, calibrated_on=len(records))
+
+    def save(self, path=None):
+        path = path or DISCOUNT_MODEL_PATH
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'weights': self.weights, 'calibrated_on': self.calibrated_on}, f, indent=2)
+        return path
+
+    @classmethod
+    def load(cls, path=None):
+        """Model from a saved weights file, or the default weights if there is none."""
+        path = path or DISCOUNT_MODEL_PATH
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as f:
+            saved = json.load(f)
+        return cls(saved.get('weights'), saved.get('calibrated_on', 0))
+
+
+def record_gemini_discount(product_data, health_score, festival_names, discount, log_path=None):
+    """Append one Gemini discount decision and its inputs to the discount log (never raises)."""
+    log_path = log_path or DISCOUNT_LOG
+    if not log_path:
+        return
+    record = {
+        'product': {key: product_data.get(key) for key in
+                    ('category', 'price', 'stock_quantity', 'days_in_stock', 'sales_velocity')},
+        'health_score': health_score,
+        'festivals': list(festival_names),
+        'discount': discount,
+        'time': round(time.time(), 3),
+    }
+    try:
+        os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+        with open(log_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    except OSError as e:
+        print(f"⚠️ Could not record Gemini discount: {e}")
+
+
+def read_discount_log(log_path=None):
+    """Records from the discount log; unreadable lines are skipped."""
+    records = []
+    with open(log_path or DISCOUNT_LOG) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+# Global instance used by the discount calculator
+_discount_model = None
+
+
+def get_discount_model():
+    """Get or load the global local discount model."""
+    global _discount_model
+    if _discount_model is None:
+        _discount_model = LocalDiscountModel.load()
+        source = f"calibrated on {_discount_model.calibrated_on} Gemini decisions" if _discount_model.calibrated_on else "default weights"
+        print(f"✅ Local discount model loaded ({source})")
+    return _discount_model
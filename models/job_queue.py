@@ -0,0 +1,227 @@
+"""
+Job Queue Module
+Bounded background job queue for heavy Photogenix operations. Work runs on a
+process pool (each worker holding its own warm model session) or a thread
+pool, and callers poll job status by id instead of holding a request open.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+import numpy as np
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at max_pending."""
+
+
+def _summarise(samples):
+    if not samples:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None}
+    values = np.array(samples)
+    return {
+        'count': len(values),
+        'mean': round(float(values.mean()), 4),
+        'p50': round(float(np.percentile(values, 50)), 4),
+        'p95': round(float(np.percentile(values, 95)), 4),
+    }
+
+
+class JobQueue:
+    """
+    Submit callables as jobs and track their status, wait time and run time.
+
+    Job functions may return a dict; 'started_at' and 'run_time' keys, when
+    present, are used for the timing metrics (worker processes report their
+    own start time, which the parent cannot observe directly).
+    """
+
+    def __init__(self, workers=1, max_pending=32, mode='process', initializer=None,
+                 initargs=(), retention_seconds=3600, max_jobs=1000):
+        """
+        Initialize the job queue.
+
+        Args:
+            workers (int): Worker processes (or threads) running jobs
+            max_pending (int): Unfinished jobs allowed before submit() rejects
+            mode (str): 'process' for a process pool, 'thread' for a thread pool
+            initializer (callable): Run once in every worker process
+            initargs (tuple): Arguments for initializer
+            retention_seconds (float): How long finished jobs stay queryable
+            max_jobs (int): Upper bound on job records kept
+        """
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.mode = mode
+        self.initializer = initializer
+        self.initargs = initargs
+        self.retention_seconds = retention_seconds
+        self.max_jobs = max_jobs
+
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._futures = {}
+        self._executor = None
+        self._wait_times = deque(maxlen=500)
+        self._run_times = deque(maxlen=500)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _get_executor(self):
+        """Create the pool lazily (and again if a worker process died)."""
+        if self._executor is None:
+            if self.mode == 'thread':
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='photogenix-job',
+                    initializer=self.initializer, initargs=self.initargs)
+            else:
+                # spawn: workers must not inherit the parent's threads or model sessions
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer, initargs=self.initargs)
+        return self._executor
+
+    def _pending_count(self):
+        return sum(1 for job in self._jobs.values() if job['status'] in ('queued', 'running'))
+
+    def _purge(self):
+        """Drop finished jobs past retention, oldest first (lock held)."""
+        cutoff = time.time() - self.retention_seconds
+        # Jobs finish out of submission order, so an older unfinished job must not end the scan
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            finished = job['status'] in ('done', 'failed')
+            if finished and (job['finished_at'] < cutoff or len(self._jobs) > self.max_jobs):
+                del self._jobs[job_id]
+
+    def submit(self, func, *args, **metadata):
+        """
+        Queue func(*args) as a job.
+
+        Args:
+            func (callable): Picklable top-level function in process mode
+            *args: Arguments for func
+            **metadata: Extra fields stored on the job record (e.g. operation)
+
+        Returns:
+            str: Job id
+
+        Raises:
+            QueueFullError: If max_pending unfinished jobs already exist
+        """
+        with self._lock:
+            self._purge()
+            if self._pending_count() >= self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(f'Job queue is full ({self.max_pending} pending)')
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = dict(metadata, job_id=job_id, status='queued', submitted_at=time.time(),
+                                      started_at=None, finished_at=None, wait_time=None,
+                                      run_time=None, result=None, error=None)
+            try:
+                future = self._get_executor().submit(func, *args)
+            except BrokenProcessPool:
+                self._executor = None
+                future = self._get_executor().submit(func, *args)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f, job_id=job_id: self._on_done(job_id, f))
+        return job_id
+
+    def _on_done(self, job_id, future):
+        finished_at = time.time()
+        with self._lock:
+            self._futures.pop(job_id, None)
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['finished_at'] = finished_at
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                self._executor = None
+                job.update(status='failed', error=f'Worker process died: {e}')
+                self.failed += 1
+                return
+            except Exception as e:
+                job.update(status='failed', error=str(e))
+                self.failed += 1
+                return
+
+            # Without a reported start time the whole turnaround counts as run time
+            started_at = job['submitted_at']
+            run_time = None
+            if isinstance(result, dict):
+                started_at = result.get('started_at', started_at)
+                run_time = result.get('run_time')
+            if run_time is None:
+                run_time = finished_at - started_at
+            wait_time = max(0.0, started_at - job['submitted_at'])
+            job.update(status='done', result=result, started_at=started_at,
+                       wait_time=wait_time, run_time=run_time)
+            self._wait_times.append(wait_time)
+            self._run_times.append(run_time)
+            self.completed += 1
+
+    def get(self, job_id):
+        """
+        Snapshot of a job record, or None if unknown/expired.
+
+        Returns:
+            dict: job_id, status ('queued', 'running', 'done', 'failed'), timings, result, error
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            future = self._futures.get(job_id)
+            if job['status'] == 'queued' and future is not None and future.running():
+                job['status'] = 'running'
+            return dict(job)
+
+    def wait(self, job_id, timeout):
+        """Block up to timeout seconds for a job to finish; returns its snapshot."""
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None and timeout > 0:
+            try:
+                future.exception(timeout=timeout)
+            except Exception:
+                pass
+            # The done callback may still be running on another thread
+            deadline = time.time() + 1.0
+            while future.done() and time.time() < deadline:
+                snapshot = self.get(job_id)
+                if snapshot is None or snapshot['status'] in ('done', 'failed'):
+                    return snapshot
+                time.sleep(0.005)
+        return self.get(job_id)
+
+    def stats(self):
+        """Queue depth, counters and wait/run time percentiles (seconds)."""
+        with self._lock:
+            statuses = [job['status'] for job in self._jobs.values()]
+            running = sum(1 for job_id, future in self._futures.items() if future.running())
+            return {
+                'mode': self.mode,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'queue_depth': statuses.count('queued') + statuses.count('running') - running,
+                'running': running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'wait_time': _summarise(list(self._wait_times)),
+                'run_time': _summarise(list(self._run_times)),
+            }
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
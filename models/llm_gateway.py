@@ -0,0 +1,313 @@
+"""
+LLM Gateway Module
+Single entry point for Gemini calls (discount reasoning, creative content,
+campaign copy). Calls run on a small thread pool so the request thread can
+give up at its deadline instead of pinning a worker until the model answers;
+at most LLM_CONCURRENCY calls are in flight, identical concurrent prompts
+share one call, and a circuit breaker fails fast after repeated errors so
+callers drop straight to their fallback. The backend is pluggable: a stub
+backend answers locally for offline tests and benchmarks.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# Seconds a caller waits for an answer, calls in flight at once, and model used by default
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 8))
+LLM_CONCURRENCY = int(os.environ.get('LLM_CONCURRENCY', 4))
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gemini-1.5-flash')
+# 'gemini' or 'stub'
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')
+
+
+class LLMError(Exception):
+    """Base class for gateway failures; callers fall back on any of them."""
+
+
+class LLMTimeout(LLMError):
+    """Raised when no answer arrived before the caller's deadline."""
+
+
+class LLMUnavailable(LLMError):
+    """Raised without calling the model: circuit open or every slot busy."""
+
+
+class GeminiBackend:
+    """Calls Gemini through google.generativeai and returns the response text."""
+
+    def __init__(self):
+        self._models = {}
+
+    def generate(self, model, parts, timeout):
+        import google.generativeai as genai
+
+        if model not in self._models:
+            self._models[model] = genai.GenerativeModel(model)
+        # The HTTP timeout frees the pool thread shortly after the caller has given up
+        response = self._models[model].generate_content(parts, request_options={'timeout': timeout + 2})
+        return response.text.strip()
+
+
+class StubBackend:
+    """
+    Local stand-in for Gemini. Answers with responder(model, parts), or an
+    empty JSON object, after an optional delay; every call is recorded.
+    """
+
+    def __init__(self, responder=None, latency=0.0):
+        self.responder = responder
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate(self, model, parts, timeout):
+        with self._lock:
+            self.calls.append((model, parts))
+        if self.latency:
+            time.sleep(self.latency)
+        if self.responder is None:
+            return '{}'
+        answer = self.responder(model, parts)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for
+    reset_seconds; then one trial call is let through (half-open), and its
+    outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=3, reset_seconds=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if self.clock() - self.opened_at >= self.reset_seconds else 'open'
+
+    def allow(self):
+        """True if a call may go ahead now."""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_running:
+                    self.times_opened += 1
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+
+def _parts_key(model, parts):
+    """Digest of the model name and prompt parts (text, or inline {'mime_type', 'data'} blobs)."""
+    digest = hashlib.sha256(model.encode())
+    for part in parts if isinstance(parts, (list, tuple)) else [parts]:
+        if isinstance(part, dict):
+            digest.update(json.dumps({k: v for k, v in part.items() if k != 'data'}, sort_keys=True).encode())
+            digest.update(part.get('data', b''))
+        else:
+            digest.update(str(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class LLMGateway:
+    """
+    Bounded, deadline-aware access to an LLM backend.
+
+    generate() blocks for at most its timeout; submit() returns a Future for
+    callers that collect the answer later. Both share in-flight calls for
+    identical (model, parts).
+    """
+
+    def __init__(self, backend=None, concurrency=None, timeout=None, model=None,
+                 failure_threshold=3, reset_seconds=30, clock=time.monotonic):
+        """
+        Initialize the gateway.
+
+        Args:
+            backend: Object with generate(model, parts, timeout) -> str (defaults to Gemini)
+            concurrency (int): Calls in flight at once (defaults to LLM_CONCURRENCY)
+            timeout (float): Default deadline in seconds (defaults to LLM_TIMEOUT)
+            model (str): Default model name (defaults to LLM_MODEL)
+            failure_threshold (int): Consecutive failures that open the circuit
+            reset_seconds (float): How long the circuit stays open before a trial call
+            clock (callable): Time source for the circuit breaker
+        """
+        self.backend = backend or GeminiBackend()
+        self.concurrency = max(1, concurrency or LLM_CONCURRENCY)
+        self.timeout = timeout or LLM_TIMEOUT
+        self.model = model or LLM_MODEL
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds, clock)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='llm')
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._in_flight = {}
+        # Calls whose timeout already counted against the breaker; their late outcome does not
+        self._timed_out = set()
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def _finished(self, key, future):
+        """Done callback: free the slot and feed the breaker, once per backend call."""
+        failed = future.exception() is not None
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            self.failures += failed
+            timed_out = future in self._timed_out
+            self._timed_out.discard(future)
+        self._slots.release()
+        if timed_out:
+            return
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def submit(self, parts, model=None, timeout=None):
+        """
+        Start (or join) a call and return its Future, which resolves to the response text.
+
+        Args:
+            parts: Prompt string, or list of strings and {'mime_type', 'data'} blobs
+            model (str): Model name (defaults to the gateway's model)
+            timeout (float): Deadline passed to the backend
+
+        Raises:
+            LLMUnavailable: If the circuit is open or no slot frees up in time
+        """
+        model = model or self.model
+        timeout = timeout or self.timeout
+        key = _parts_key(model, parts)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+        if not self.breaker.allow():
+            self._reject()
+            raise LLMUnavailable('LLM circuit open after repeated failures')
+        if not self._slots.acquire(timeout=timeout):
+            self._reject()
+            raise LLMUnavailable(f'All {self.concurrency} LLM slots busy')
+        with self._lock:
+            # An identical call may have started while this one waited for a slot
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._slots.release()
+                self.coalesced += 1
+                return future
+            future = self._executor.submit(self.backend.generate, model, parts, timeout)
+            self._in_flight[key] = future
+            self.calls += 1
+        future.add_done_callback(lambda f: self._finished(key, f))
+        return future
+
+    def generate(self, parts, model=None, timeout=None):
+        """
+        Response text for a prompt, within the deadline.
+
+        Args:
+            parts: Prompt string, or list of strings and {'mime_type', 'data'} blobs
+            model (str): Model name (defaults to the gateway's model)
+            timeout (float): Seconds to wait (defaults to the gateway's timeout)
+
+        Returns:
+            str: Response text
+
+        Raises:
+            LLMTimeout: If the answer did not arrive in time
+            LLMUnavailable: If the call was not attempted
+            Exception: Whatever the backend raised
+        """
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        future = self.submit(parts, model, timeout)
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            # A hung call counts against the circuit now, not when it finally returns, and only
+            # once however many coalesced callers gave up on it
+            with self._lock:
+                first = not future.done() and future not in self._timed_out
+                if first:
+                    self._timed_out.add(future)
+                    self.timeouts += 1
+            if first:
+                self.breaker.record_failure()
+            raise LLMTimeout(f'No LLM answer within {timeout:.1f}s') from None
+
+    def stats(self):
+        """Return call, coalescing, timeout and circuit counters."""
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {
+            'backend': type(self.backend).__name__,
+            'model': self.model,
+            'concurrency': self.concurrency,
+            'timeout': self.timeout,
+            'in_flight': in_flight,
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'circuit': self.breaker.state,
+            'circuit_opened': self.breaker.times_opened,
+        }
+
+
+# Global instance shared by every Gemini caller in the process
+_llm_gateway = None
+
+
+def get_llm_gateway():
+    """Get or create the global LLM gateway."""
+    global _llm_gateway
+    if _llm_gateway is None:
+        _llm_gateway = LLMGateway(
+            backend=StubBackend() if LLM_BACKEND == 'stub' else GeminiBackend(),
+            failure_threshold=int(os.environ.get('LLM_BREAKER_FAILURES', 3)),
+            reset_seconds=float(os.environ.get('LLM_BREAKER_RESET', 30)),
+        )
+    return _llm_gateway
@@ -0,0 +1,253 @@
+"""
+Mask Cache Module
+Content-addressed cache for segmentation masks produced by BiRefNet.
+Masks are keyed by a hash of the decoded colour channels plus the model
+name, so the same photo sent to several Photogenix endpoints only pays for
+inference once, whether an endpoint decoded it as RGB or RGBA.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+class MaskCache:
+    """
+    Two-tier (memory + disk) LRU cache of L-mode segmentation masks.
+
+    The memory tier holds recently used masks as uint8 arrays. The disk tier
+    stores them as compressed PNGs and survives worker restarts; both tiers
+    are bounded in bytes and evict the least recently used entry first.
+    """
+
+    def __init__(self, cache_dir='mask_cache', max_memory_bytes=128 * 1024 * 1024,
+                 max_disk_bytes=512 * 1024 * 1024):
+        """
+        Initialize the mask cache.
+
+        Args:
+            cache_dir (str): Directory for the on-disk tier (None disables it)
+            max_memory_bytes (int): Upper bound for masks held in memory
+            max_disk_bytes (int): Upper bound for compressed masks on disk
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+
+    @staticmethod
+    def make_key(image, model_name):
+        """
+        Build the content-addressed key for an image/model pair.
+
+        Args:
+            image (np.ndarray or PIL.Image): Decoded input pixels (RGB or RGBA)
+            model_name (str): Segmentation model the mask belongs to
+
+        Returns:
+            str: Hex digest identifying the mask
+        """
+        pixels = np.asarray(image)
+        if pixels.ndim == 3:
+            # Segmentation reads only the colour channels, so RGB and RGBA decodes share a mask
+            pixels = pixels[..., :3]
+        pixels = np.ascontiguousarray(pixels)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(model_name.encode('utf-8'))
+        digest.update(f"{pixels.dtype}:{pixels.shape[:2]}".encode('utf-8'))
+        digest.update(pixels.data)
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _scan_disk(self):
+        """Return (path, size, mtime) for every mask file in the disk tier."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.png'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key):
+        """
+        Look up a mask by key.
+
+        Args:
+            key (str): Key from make_key()
+
+        Returns:
+            np.ndarray or None: Copy of the cached HxW uint8 mask, or None on a miss
+        """
+        with self._lock:
+            mask = self._memory.get(key)
+            if mask is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return mask.copy()
+
+        if self.cache_dir:
+            path = self._disk_path(key)
+            try:
+                with Image.open(path) as stored:
+                    mask = np.array(stored.convert('L'))
+                os.utime(path)  # Refresh recency for disk eviction
+            except (OSError, ValueError):
+                mask = None
+            if mask is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, mask)
+                return mask.copy()
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, mask):
+        """
+        Store a mask in both tiers.
+
+        Args:
+            key (str): Key from make_key()
+            mask (np.ndarray or PIL.Image): HxW uint8 mask (PIL masks are converted to L)
+        """
+        if isinstance(mask, Image.Image):
+            mask = np.array(mask.convert('L'))
+        else:
+            mask = np.array(mask, dtype=np.uint8)
+        with self._lock:
+            self._remember(key, mask)
+
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            # No optimize pass: it costs tens of milliseconds per miss on the request path
+            Image.fromarray(mask, 'L').save(tmp_path, 'PNG')
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"⚠️ Failed to write mask cache entry: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            self._disk_bytes += size
+            over_limit = self._disk_bytes > self.max_disk_bytes
+        if over_limit:
+            self._evict_disk()
+
+    def _remember(self, key, mask):
+        """Insert into the memory tier and evict LRU entries (lock held)."""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        size = mask.nbytes
+        if size > self.max_memory_bytes:
+            return
+        self._memory[key] = mask
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= old.nbytes
+            self.evictions += 1
+
+    def _evict_disk(self):
+        """Delete least recently used mask files until under the disk bound."""
+        entries = sorted(self._scan_disk(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                continue
+        with self._lock:
+            self._disk_bytes = total
+            self.evictions += removed
+
+    def clear(self, memory_only=False):
+        """Drop cached masks from memory and, unless memory_only, from disk."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.cache_dir and not memory_only:
+            for path, _, _ in self._scan_disk():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self._lock:
+                self._disk_bytes = 0
+
+    def stats(self):
+        """Return hit/miss counters and tier sizes."""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_bytes': self._disk_bytes,
+                'max_memory_bytes': self.max_memory_bytes,
+                'max_disk_bytes': self.max_disk_bytes,
+            }
+
+
+# Global instance shared by every Photogenix endpoint
+_mask_cache = None
+
+def get_mask_cache(cache_dir=None):
+    """
+    Get or create the global mask cache.
+
+    Args:
+        cache_dir (str): Disk tier location; defaults to $MASK_CACHE_DIR or 'mask_cache'
+
+    Returns:
+        MaskCache: Shared cache instance
+    """
+    global _mask_cache
+    if _mask_cache is None:
+        _mask_cache = MaskCache(
+            cache_dir=cache_dir or os.environ.get('MASK_CACHE_DIR', 'mask_cache'),
+            max_memory_bytes=int(os.environ.get('MASK_CACHE_MEMORY_MB', 128)) * 1024 * 1024,
+            max_disk_bytes=int(os.environ.get('MASK_CACHE_DISK_MB', 512)) * 1024 * 1024,
+        )
+    return _mask_cache
@@ -0,0 +1,231 @@
+"""
+ONNX Session Module
+Explicit ONNX Runtime configuration for the rembg segmentation models.
+Thread counts, graph optimisation level and memory arena settings come from
+the environment instead of rembg's defaults, and the optimised graph is
+serialised to disk the first time a model is loaded so later worker starts
+skip graph optimisation entirely. Models load in fp32 (the rembg download)
+or int8 (a dynamically quantised copy made offline by quantize_model()).
+"""
+
+import os
+import platform
+import time
+
+import onnxruntime as ort
+from rembg.sessions import sessions_class
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    'sequential': ort.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': ort.ExecutionMode.ORT_PARALLEL,
+}
+
+# Optimised graphs and quantised copies are kept next to the models rembg downloads
+MODEL_HOME = os.environ.get('U2NET_HOME', os.path.join(os.path.expanduser('~'), '.u2net'))
+DEFAULT_OPTIMIZED_MODEL_DIR = os.path.join(MODEL_HOME, 'optimized')
+QUANTIZED_MODEL_DIR = os.environ.get('QUANTIZED_MODEL_DIR', os.path.join(MODEL_HOME, 'quantized'))
+
+MODEL_PRECISIONS = ('fp32', 'int8')
+# Operators quantised by default: the transformer backbone's MatMuls carry most
+# of BiRefNet's compute, while ConvInteger is often slower than fp32 Conv on CPU
+DEFAULT_QUANTIZE_OP_TYPES = ('MatMul',)
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() not in ('0', 'false', 'no', 'off', '')
+
+
+def session_settings(**overrides):
+    """
+    ONNX Runtime settings from the environment, with optional overrides.
+
+    Thread counts of 0 let ONNX Runtime choose (one intra-op thread per
+    physical core). With several job worker processes, set ORT_INTRA_OP_THREADS
+    so workers * threads does not oversubscribe the CPU.
+
+    Returns:
+        dict: intra_op_threads, inter_op_threads, execution_mode,
+            graph_optimization, cpu_mem_arena, mem_pattern, optimized_model_dir
+
+    Raises:
+        ValueError: If a setting is not recognised
+    """
+    settings = {
+        'intra_op_threads': int(os.environ.get('ORT_INTRA_OP_THREADS', 0)),
+        'inter_op_threads': int(os.environ.get('ORT_INTER_OP_THREADS', 0)),
+        'execution_mode': os.environ.get('ORT_EXECUTION_MODE', 'sequential').lower(),
+        'graph_optimization': os.environ.get('ORT_GRAPH_OPTIMIZATION', 'all').lower(),
+        'cpu_mem_arena': _env_flag('ORT_CPU_MEM_ARENA', '1'),
+        'mem_pattern': _env_flag('ORT_MEM_PATTERN', '1'),
+        'optimized_model_dir': os.environ.get('ORT_OPTIMIZED_MODEL_DIR', DEFAULT_OPTIMIZED_MODEL_DIR) or None,
+    }
+    settings.update(overrides)
+    if settings['graph_optimization'] not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown graph_optimization '{settings['graph_optimization']}'. "
+                         f"Supported: {', '.join(GRAPH_OPTIMIZATION_LEVELS)}")
+    if settings['execution_mode'] not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution_mode '{settings['execution_mode']}'. "
+                         f"Supported: {', '.join(EXECUTION_MODES)}")
+    if settings['intra_op_threads'] < 0 or settings['inter_op_threads'] < 0:
+        raise ValueError('Thread counts must be 0 (automatic) or positive')
+    return settings
+
+
+def build_session_options(settings, optimized_model_path=None, preoptimized=False):
+    """
+    ort.SessionOptions for the given settings.
+
+    Args:
+        settings (dict): From session_settings()
+        optimized_model_path (str): Where ONNX Runtime should write the optimised graph
+        preoptimized (bool): The model being loaded is an already optimised graph,
+            so graph optimisation is skipped
+
+    Returns:
+        ort.SessionOptions
+    """
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = settings['intra_op_threads']
+    options.inter_op_num_threads = settings['inter_op_threads']
+    options.execution_mode = EXECUTION_MODES[settings['execution_mode']]
+    options.enable_cpu_mem_arena = settings['cpu_mem_arena']
+    options.enable_mem_pattern = settings['mem_pattern']
+    if preoptimized:
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS['disable']
+    else:
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[settings['graph_optimization']]
+        if optimized_model_path:
+            options.optimized_model_filepath = optimized_model_path
+    return options
+
+
+def optimized_model_path(model_name, settings, precision='fp32'):
+    """
+    Path of the serialised optimised graph for a model, or None if disabled.
+
+    'extended' and 'all' optimisations are specific to the ONNX Runtime build,
+    device and CPU, so all of them are part of the file name.
+    """
+    if not settings['optimized_model_dir'] or settings['graph_optimization'] == 'disable':
+        return None
+    tag = '-'.join([model_name, precision, settings['graph_optimization'], f'ort{ort.__version__}',
+                    ort.get_device().lower(), platform.machine() or 'cpu'])
+    return os.path.join(settings['optimized_model_dir'], tag.replace(os.sep, '_') + '.onnx')
+
+
+def _rembg_session_class(model_name):
+    for session_class in sessions_class:
+        if session_class.name() == model_name:
+            return session_class
+    raise ValueError(f"Unknown rembg model '{model_name}'")
+
+
+def _reading(session_class, model_path):
+    """The same rembg class (pre/post-processing, name checks) reading another graph file."""
+    return type(session_class.__name__, (session_class,), {
+        'download_models': classmethod(lambda cls, *args, **kwargs: model_path),
+    })
+
+
+def quantized_model_path(model_name):
+    """Where quantize_model() writes, and load_session() reads, a model's int8 copy."""
+    return os.path.join(QUANTIZED_MODEL_DIR, f'{model_name}-int8.onnx')
+
+
+def quantized_model_available(model_name):
+    return os.path.exists(quantized_model_path(model_name))
+
+
+def quantize_model(model_name, output_path=None, op_types=DEFAULT_QUANTIZE_OP_TYPES, per_channel=False):
+    """
+    Write a dynamically quantised INT8 copy of a rembg model (offline step).
+
+    Weights are stored as int8 and activations are quantised on the fly, so
+    no calibration data is needed. Requires the 'onnx' package.
+
+    Args:
+        model_name (str): rembg model name; the fp32 model is downloaded if needed
+        output_path (str): Destination (defaults to quantized_model_path())
+        op_types (tuple): ONNX operator types to quantise
+        per_channel (bool): Per-channel weight scales (more accurate, larger)
+
+    Returns:
+        str: Path of the quantised model
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = _rembg_session_class(model_name).download_models()
+    output_path = output_path or quantized_model_path(model_name)
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    quantize_dynamic(source, tmp_path, op_types_to_quantize=list(op_types),
+                     per_channel=per_channel, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def load_session(model_name, settings=None, precision='fp32'):
+    """
+    Build a rembg session with explicit ONNX Runtime settings.
+
+    The first load optimises the graph and serialises it next to the other
+    cached graphs; later loads (e.g. each restarted gunicorn or job worker)
+    read that file with optimisation disabled.
+
+    Args:
+        model_name (str): rembg model name, e.g. 'birefnet-general'
+        settings (dict): From session_settings(); None reads the environment
+        precision (str): 'fp32' (rembg download) or 'int8' (quantize_model() output)
+
+    Returns:
+        tuple: (rembg session, info dict with model_name, precision, providers,
+            settings, optimized_model_path, loaded_optimized and load_ms)
+
+    Raises:
+        FileNotFoundError: If precision is 'int8' and no quantised copy exists
+    """
+    if precision not in MODEL_PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. Supported: {', '.join(MODEL_PRECISIONS)}")
+    settings = settings or session_settings()
+    session_class = _rembg_session_class(model_name)
+    if precision == 'int8':
+        if not quantized_model_available(model_name):
+            raise FileNotFoundError(f"No INT8 copy of '{model_name}' at {quantized_model_path(model_name)}; "
+                                    f"run python -m benchmarks.quantize_birefnet --model {model_name}")
+        session_class = _reading(session_class, quantized_model_path(model_name))
+    cache_path = optimized_model_path(model_name, settings, precision)
+    loaded_optimized = cache_path is not None and os.path.exists(cache_path)
+
+    started = time.perf_counter()
+    if loaded_optimized:
+        session_class = _reading(session_class, cache_path)
+        session = session_class(model_name, build_session_options(settings, preoptimized=True))
+    elif cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Written under a temporary name so concurrent worker starts never read a partial graph
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        session = session_class(model_name, build_session_options(settings, tmp_path))
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, cache_path)
+    else:
+        session = session_class(model_name, build_session_options(settings))
+    load_ms = (time.perf_counter() - started) * 1000
+
+    info = {
+        'model_name': model_name,
+        'precision': precision,
+        'providers': session.inner_session.get_providers(),
+        'settings': settings,
+        'optimized_model_path': cache_path,
+        'loaded_optimized': loaded_optimized,
+        'load_ms': round(load_ms, 1),
+    }
+    print(f"✅ ONNX session '{model_name}' ({precision}) ready in {load_ms:.0f} ms "
+          f"({'cached optimised graph' if loaded_optimized else settings['graph_optimization'] + ' optimisation'})")
+    return session, info
@@ -0,0 +1,185 @@
+"""
+Output Encoder Module
+Encodes processed Photogenix images. Routes pick WebP, AVIF, JPEG or PNG
+(with a quality knob or PNG compression level); 'auto' negotiates from the
+client's Accept header and falls back to PNG only when the image actually
+needs an alpha channel.
+"""
+
+import io
+import mimetypes
+import os
+import time
+
+from PIL import Image
+
+# format name: (PIL format, file extension, mimetype, supports alpha)
+OUTPUT_FORMATS = {
+    'png': ('PNG', '.png', 'image/png', True),
+    'webp': ('WEBP', '.webp', 'image/webp', True),
+    'avif': ('AVIF', '.avif', 'image/avif', True),
+    'jpeg': ('JPEG', '.jpg', 'image/jpeg', False),
+}
+FORMAT_ALIASES = {'jpg': 'jpeg'}
+
+try:
+    # Registers AVIF on Pillow releases before 11.2, which cannot write it themselves
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Formats this Pillow build cannot write are neither accepted nor negotiated from Accept
+Image.init()
+OUTPUT_FORMATS = {name: spec for name, spec in OUTPUT_FORMATS.items() if spec[0] in Image.SAVE}
+
+DEFAULT_OUTPUT_FORMAT = os.environ.get('OUTPUT_FORMAT', 'auto').lower()
+DEFAULT_QUALITY = int(os.environ.get('OUTPUT_QUALITY', 90))
+DEFAULT_PNG_COMPRESS_LEVEL = int(os.environ.get('PNG_COMPRESS_LEVEL', 6))
+
+# send_from_directory guesses the Content-Type from the extension
+for _name, (_, _extension, _mimetype, _) in OUTPUT_FORMATS.items():
+    mimetypes.add_type(_mimetype, _extension)
+
+
+def accepted_formats(accept_header):
+    """
+    Output formats the client lists explicitly in its Accept header.
+
+    Wildcards ('*/*', 'image/*') are ignored: they say nothing about which
+    modern formats the client can actually display.
+    """
+    by_mimetype = {mimetype: name for name, (_, _, mimetype, _) in OUTPUT_FORMATS.items()}
+    formats = []
+    for part in (accept_header or '').split(','):
+        fields = [field.strip() for field in part.split(';')]
+        name = by_mimetype.get(fields[0].lower())
+        if name is None:
+            continue
+        q = 1.0
+        for field in fields[1:]:
+            if field.startswith('q='):
+                try:
+                    q = float(field[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0 and name not in formats:
+            formats.append(name)
+    return formats
+
+
+def output_options(fmt=None, quality=None, png_compress_level=None, accept_header=''):
+    """
+    Validate per-request output settings.
+
+    Args:
+        fmt (str): 'auto' or a key of OUTPUT_FORMATS ('jpg' is accepted)
+        quality (int|str): 1-100, used by WebP, AVIF and JPEG
+        png_compress_level (int|str): 0 (fastest) to 9 (smallest)
+        accept_header (str): Request Accept header, used when fmt is 'auto'
+
+    Returns:
+        dict: Options for encode_image/save_output (picklable)
+
+    Raises:
+        ValueError: If any setting is out of range
+    """
+    fmt = (fmt or DEFAULT_OUTPUT_FORMAT).lower()
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    if fmt != 'auto' and fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Supported: auto, {', '.join(OUTPUT_FORMATS)}")
+    try:
+        quality = int(quality if quality not in (None, '') else DEFAULT_QUALITY)
+        level = int(png_compress_level if png_compress_level not in (None, '') else DEFAULT_PNG_COMPRESS_LEVEL)
+    except ValueError:
+        raise ValueError('quality and png_compression must be integers')
+    if not 1 <= quality <= 100:
+        raise ValueError('quality must be between 1 and 100')
+    if not 0 <= level <= 9:
+        raise ValueError('png_compression must be between 0 and 9')
+    return {'format': fmt, 'quality': quality, 'png_compress_level': level,
+            'accept': accepted_formats(accept_header)}
+
+
+def needs_alpha(img):
+    """Whether the image has any pixel that is not fully opaque."""
+    if img.mode in ('RGBA', 'LA', 'PA'):
+        return img.getchannel('A').getextrema()[0] < 255
+    return img.mode == 'P' and 'transparency' in img.info
+
+
+def resolve_format(img, options):
+    """Concrete output format for an image under the given options."""
+    fmt = options.get('format', 'auto')
+    if fmt != 'auto':
+        return fmt
+    for candidate in ('webp', 'avif'):
+        if candidate in OUTPUT_FORMATS and candidate in options.get('accept', ()):
+            return candidate
+    return 'png' if needs_alpha(img) else 'jpeg'
+
+
+def encode_image(img, options=None):
+    """
+    Encode an image with the requested output settings.
+
+    Args:
+        img (PIL.Image): Image to encode
+        options (dict): From output_options(); None means defaults
+
+    Returns:
+        dict: data (bytes), format, extension, mimetype, bytes and encode_ms
+    """
+    options = options or output_options()
+    fmt = resolve_format(img, options)
+    pil_format, extension, mimetype, supports_alpha = OUTPUT_FORMATS[fmt]
+    quality = options.get('quality', DEFAULT_QUALITY)
+
+    started = time.perf_counter()
+    if not supports_alpha and img.mode not in ('RGB', 'L'):
+        # JPEG: flatten any transparency onto white
+        rgba = img.convert('RGBA')
+        flat = Image.new('RGB', rgba.size, (255, 255, 255))
+        flat.paste(rgba, mask=rgba.getchannel('A'))
+        img = flat
+    elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        img = img.convert('RGBA')
+
+    if fmt == 'png':
+        save_args = {'compress_level': options.get('png_compress_level', DEFAULT_PNG_COMPRESS_LEVEL)}
+    elif fmt == 'jpeg':
+        save_args = {'quality': quality, 'optimize': True, 'progressive': True}
+    elif fmt == 'webp':
+        save_args = {'quality': quality, 'method': 4}
+    else:
+        save_args = {'quality': quality, 'speed': 8}
+
+    buf = io.BytesIO()
+    img.save(buf, pil_format, **save_args)
+    data = buf.getvalue()
+    return {
+        'data': data,
+        'format': fmt,
+        'extension': extension,
+        'mimetype': mimetype,
+        'bytes': len(data),
+        'encode_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def save_output(img, output_dir, base_name, options=None):
+    """
+    Encode an image and write it as base_name plus the format's extension.
+
+    Returns:
+        dict: filename, format, mimetype, bytes and encode_ms
+    """
+    encoded = encode_image(img, options)
+    filename = base_name + encoded.pop('extension')
+    path = os.path.join(output_dir, filename)
+    # Written under a temporary name so readers never see a partial file
+    tmp_path = f'{path}.{os.getpid()}.{time.monotonic_ns()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(encoded.pop('data'))
+    os.replace(tmp_path, path)
+    encoded['filename'] = filename
+    return encoded
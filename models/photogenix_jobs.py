@@ -0,0 +1,264 @@
+"""
+Photogenix Jobs Module
+Operation handlers behind the /process/* routes. Each handler is a plain
+function of (upload bytes, filename, params) so it can run inline, on a
+thread, or inside a job worker process that keeps its own warm BiRefNet
+session.
+"""
+
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from models.asset_store import AssetStore
+from models.background_library import get_background_library
+from models.birefnet_bg_removal import get_bg_remover, run_birefnet_array
+from models.mask_cache import get_mask_cache
+from models.photogenix_ops import (
+    apply_mask, apply_preset, composite_product, crop_to_platforms, enhance_image,
+    load_background, product_box,
+)
+from models.output_encoder import save_output
+from models.request_timing import recording, span
+from models.segmentation_cascade import cascade_mask
+from models.tiled_ops import composite_product_tiled, enhance_image_tiled, should_tile
+from models.upload_guard import open_image
+
+
+def _decode(data, mode):
+    with span('decode'):
+        return open_image(data).convert(mode)
+
+
+def _decode_product(data):
+    """
+    Decode an upload that will be segmented and composited. Large images stay
+    RGB (the mask supplies alpha anyway), saving a full-size RGBA conversion.
+    """
+    with span('decode'):
+        img = open_image(data)
+        return img.convert('RGB' if should_tile(img) else 'RGBA')
+
+
+def _composite(img, mask, bg_name, preset=None):
+    """composite_product (plus apply_preset), strip by strip for large images."""
+    with span('composite'):
+        if should_tile(img):
+            return composite_product_tiled(img, mask, bg_name, preset)
+        product = img if img.mode == 'RGBA' else img.convert('RGBA')
+        composite = composite_product(product, mask, load_background(bg_name, img.size))
+        return apply_preset(composite, preset) if preset else composite
+
+
+def _enhance(img):
+    with span('enhance'):
+        return enhance_image_tiled(img) if should_tile(img) else enhance_image(img)
+
+
+def _segment(img, params):
+    """
+    Product mask for an image, as an L-mode image at the same size. With
+    segmentation='cascade' the threshold tier is tried first; the tier that
+    served the request is stored in params['report'] when present.
+    """
+    birefnet_args = {'mask_mode': params.get('mask_mode', 'full'), 'precision': params.get('precision', 'fp32')}
+    if params.get('segmentation') == 'cascade':
+        with span('cascade'):
+            mask, info = cascade_mask(np.asarray(img), **birefnet_args)
+        if 'report' in params:
+            params['report']['segmentation'] = info
+    else:
+        with span('birefnet'):
+            mask = run_birefnet_array(np.asarray(img), **birefnet_args)
+    return Image.fromarray(mask, 'L')
+
+
+def _base_name(filename):
+    return filename.rsplit('.', 1)[0]
+
+
+def background_removal(data, filename, params):
+    img = _decode(data, 'RGBA')
+    mask = _segment(img, params)
+    with span('cutout'):
+        img = apply_mask(img, mask)
+    return img, 'bgremoved_' + _base_name(filename)
+
+
+def enhance(data, filename, params):
+    img = _enhance(_decode(data, 'RGB'))
+    return img, 'enhanced_' + _base_name(filename)
+
+
+def replace_background(data, filename, params):
+    img = _decode_product(data)
+    mask = _segment(img, params)
+    return _composite(img, mask, params.get('background', 'white.jpg')), 'bgreplace_' + _base_name(filename)
+
+
+def crop_resize(data, filename, params):
+    """
+    One decode for any number of platforms. The crops are centred on the
+    segmented product unless crop_focus is 'center', as on /process/crop_resize.
+    The platforms are listed in params['report'] so outputs can be labelled.
+    """
+    platforms = params.get('platforms') or [params.get('platform', 'meesho')]
+    img = _decode(data, 'RGB')
+    focus = product_box(_segment(img, params)) if params.get('crop_focus', 'product') == 'product' else None
+    if 'report' in params:
+        params['report']['platforms'] = platforms
+    base = _base_name(filename)
+    with span('crop'):
+        outputs = crop_to_platforms(img, platforms, focus)
+    return [(out, f'cropped_{platform}_{base}') for platform, out in outputs.items()]
+
+
+def make_professional(data, filename, params):
+    img = _decode_product(data)
+    mask = _segment(img, params)
+    with span('pick_background'):
+        background = get_background_library().pick_best(img)
+    composite = _composite(img, mask, background, params.get('preset', 'clean_studio'))
+    return composite, 'professional_' + _base_name(filename)
+
+
+RECIPE_STEPS = ('remove', 'replace', 'enhance', 'preset', 'crop')
+
+
+def _recipe_step(step, img, mask, params):
+    if step == 'remove':
+        with span('cutout'):
+            return apply_mask(img, mask)
+    if step == 'replace':
+        return _composite(img, mask, params.get('background', 'white.jpg'))
+    if step == 'enhance':
+        return _enhance(img)
+    if step == 'preset':
+        with span('preset'):
+            return apply_preset(img, params.get('preset', 'clean_studio'))
+    raise ValueError(f"Unknown recipe step '{step}'")
+
+
+def recipe(data, filename, params):
+    """
+    Fused chain of Photogenix steps on one decoded image.
+
+    The upload is decoded and segmented once; steps run in memory in order.
+    'crop' (at most once) forks one branch per platform in params['platforms'],
+    centred on the product unless crop_focus is 'center' as for crop_resize;
+    the mask is cropped alongside and later steps run on every branch. Only
+    the final images are returned for encoding.
+    """
+    steps = params['steps']
+    focus_on_product = 'crop' in steps and params.get('crop_focus', 'product') == 'product'
+    img = _decode_product(data)
+    mask = _segment(img, params) if 'remove' in steps or 'replace' in steps or focus_on_product else None
+    branches = [(None, img, mask)]
+    for step in steps:
+        if step == 'crop':
+            platforms = params.get('platforms') or ['meesho']
+            with span('crop'):
+                forked = []
+                for _, img, mask in branches:
+                    focus = product_box(mask) if focus_on_product else None
+                    crops = crop_to_platforms(img, platforms, focus)
+                    mask_crops = crop_to_platforms(mask, platforms, focus) if mask is not None else {}
+                    forked += [(platform, crops[platform], mask_crops.get(platform)) for platform in platforms]
+                branches = forked
+        else:
+            branches = [(platform, _recipe_step(step, img, mask, params), mask)
+                        for platform, img, mask in branches]
+
+    base = _base_name(filename)
+    return [(img, f'recipe_{platform}_{base}' if platform else f'recipe_{base}')
+            for platform, img, _ in branches]
+
+
+OPERATIONS = {
+    'background_removal': background_removal,
+    'enhance': enhance,
+    'replace_background': replace_background,
+    'crop_resize': crop_resize,
+    'make_professional': make_professional,
+    'recipe': recipe,
+}
+
+
+def run_operation(operation, data, filename, params, output_dir):
+    """
+    Run one Photogenix operation and encode its result(s).
+
+    Args:
+        operation (str): Key of OPERATIONS
+        data (bytes): Uploaded image bytes
+        filename (str): Sanitised upload filename
+        params (dict): Form parameters (background, platform, preset, mask_mode,
+            segmentation, steps/platforms for recipes, and 'output' encoder options)
+        output_dir (str): Folder the processed images are written to
+
+    Returns:
+        dict: processed_filename (first output), processed_filenames (all
+        outputs), encodings (format/bytes/encode_ms per output), the cascade
+        tier record under 'segmentation' when one ran, 'timings' (ms per
+        stage, for the Server-Timing header), plus started_at/run_time for
+        queue metrics
+    """
+    started_at = time.time()
+    report = {}
+    with recording() as timings:
+        outputs = OPERATIONS[operation](data, filename, dict(params, report=report))
+        if isinstance(outputs, tuple):
+            outputs = [outputs]
+        # Handlers name outputs without an extension; the encoder adds the format's
+        with span('encode'):
+            encodings = [save_output(image, output_dir, base_name, params.get('output'))
+                         for image, base_name in outputs]
+    return {
+        'processed_filename': encodings[0]['filename'],
+        'processed_filenames': [encoding['filename'] for encoding in encodings],
+        'encodings': encodings,
+        'started_at': started_at,
+        'run_time': time.time() - started_at,
+        'worker_pid': os.getpid(),
+        'timings': timings.rounded(),
+        **report,
+    }
+
+
+def run_stored_operation(operation, data, filename, params, store_root, key):
+    """
+    run_operation() writing into the asset store directory for key; the
+    manifest is committed once every output exists.
+
+    Returns:
+        dict: run_operation() result with filenames relative to store_root
+    """
+    store = AssetStore(store_root)
+    result = run_operation(operation, data, filename, params, store.prepare(key))
+    return store.commit(key, result)
+
+
+def init_worker(model_name='birefnet-general', mask_cache_dir=None, warmup=True):
+    """
+    Job worker process initializer: point at the shared on-disk mask cache and
+    load (and optionally warm up) this process's own BiRefNet session.
+    """
+    get_mask_cache(mask_cache_dir)
+    remover = get_bg_remover(model_name)
+    if warmup:
+        remover.warmup()
+        print(f"✅ Job worker {os.getpid()} warmed up BiRefNet in {remover.warmup_ms / 1000:.2f}s")
+
+
+def model_status(model_name='birefnet-general'):
+    """
+    Job that loads and warms this worker's BiRefNet session if it is not
+    already, and reports its ONNX Runtime settings and timings.
+    """
+    started_at = time.time()
+    remover = get_bg_remover(model_name)
+    if remover.warmup_ms is None:
+        remover.warmup()
+    return dict(remover.status(), started_at=started_at)
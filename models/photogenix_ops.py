@@ -0,0 +1,188 @@
+"""
+Photogenix Operations Module
+Image operations shared by the /process/* routes and the batch pipeline.
+Each function takes decoded PIL images and returns a new PIL image, so the
+same code path serves single requests and batched catalog uploads.
+"""
+
+import cv2
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+
+from models.background_library import DEFAULT_BACKGROUND, get_background_library
+from models.tone_pipeline import apply_tone
+
+# Output sizes for marketplace listings
+PLATFORM_SIZES = {
+    'meesho': (1024, 1365),
+    'meesho4x4': (1000, 1000),
+    'amazon': (1000, 1000),
+    'instagram': (1080, 1080),
+    'shopify': (2048, 2048),
+    'flipkart': (2000, 2000),
+}
+
+
+def apply_mask(img, mask):
+    """
+    Cut the product out by using the mask as alpha.
+
+    Args:
+        img (PIL.Image): Input image
+        mask (PIL.Image): L-mode mask at img size
+
+    Returns:
+        PIL.Image: RGBA cutout
+    """
+    cutout = img.convert('RGBA') if img.mode != 'RGBA' else img.copy()
+    cutout.putalpha(mask)
+    return cutout
+
+
+def load_background(bg_name, size):
+    """Background by name (or path) resized to the product size, from the background library cache."""
+    return get_background_library().get_resized(bg_name, size)
+
+
+def drop_shadow(arr):
+    """Soften the alpha channel of an RGBA array into a drop shadow, in place."""
+    shadow = cv2.GaussianBlur(arr[:, :, 3], (21, 21), 10)
+    arr[:, :, 3] = np.maximum(arr[:, :, 3], shadow)
+    return arr
+
+
+def composite_product(img, mask, bg):
+    """
+    Composite the masked product onto a background with a soft drop shadow
+    and a light colour/tone lift.
+
+    Args:
+        img (PIL.Image): RGBA product image
+        mask (PIL.Image): L-mode mask at img size
+        bg (PIL.Image): Background already resized to img size
+
+    Returns:
+        PIL.Image: RGBA composite
+    """
+    # Composite product onto background
+    product_rgba = apply_mask(img, mask)
+    composite = Image.alpha_composite(bg.convert('RGBA'), product_rgba)
+    # Add drop shadow (OpenCV)
+    composite = Image.fromarray(drop_shadow(np.array(composite)))
+    # Enhance color/tone
+    return apply_tone(composite, brightness=1.08, contrast=1.12, color=1.15)
+
+
+def apply_preset(img, preset):
+    """Apply a make_professional style preset ('clean_studio' is a no-op)."""
+    if preset == 'luxury_matte':
+        img = ImageOps.colorize(img.convert('L'), black='#222', white='#faf8ff')
+    elif preset == 'minimalist_white':
+        img = apply_tone(img, brightness=1.15, color=1.05)
+    return img
+
+
+def enhance_image(img):
+    """Strong auto-enhancement: brightness, contrast, colour and sharpness (alpha is kept)."""
+    alpha = img.getchannel('A') if img.mode == 'RGBA' else None
+    img = apply_tone(img.convert('RGB'), brightness=1.25, contrast=1.35, color=1.35)
+    img = ImageEnhance.Sharpness(img).enhance(2.0)
+    if alpha is not None:
+        img.putalpha(alpha)
+    return img
+
+
+# Where platform crops are centred: on the product's bounding box (from its mask) or the image centre
+CROP_FOCUSES = ('product', 'center')
+
+
+def product_box(mask):
+    """
+    Bounding box of the product in a mask.
+
+    Args:
+        mask (PIL.Image): L-mode mask
+
+    Returns:
+        tuple: (left, top, right, bottom), or None if the mask is empty
+    """
+    return mask.point(lambda v: 255 if v >= 128 else 0).getbbox()
+
+
+def crop_box(size, target_size, focus=None):
+    """
+    Largest window with the target aspect ratio inside an image.
+
+    Args:
+        size (tuple): (width, height) of the image
+        target_size (tuple): (width, height) whose aspect ratio the window takes
+        focus (tuple): (left, top, right, bottom) box to centre the window on;
+            the image centre when None. The window is shifted to stay inside the image.
+
+    Returns:
+        tuple: (left, top, right, bottom)
+    """
+    w, h = size
+    target_w, target_h = target_size
+    target_ratio = target_w / target_h
+    if w / h > target_ratio:
+        # Image is wider than target: crop width
+        new_w, new_h = int(h * target_ratio), h
+    else:
+        # Image is taller than target: crop height
+        new_w, new_h = w, int(w / target_ratio)
+    if focus is None:
+        left, top = (w - new_w) // 2, (h - new_h) // 2
+    else:
+        left = min(max(round((focus[0] + focus[2] - new_w) / 2), 0), w - new_w)
+        top = min(max(round((focus[1] + focus[3] - new_h) / 2), 0), h - new_h)
+    return left, top, left + new_w, top + new_h
+
+
+def crop_to_platform(img, platform):
+    """
+    Center crop to the platform aspect ratio, then resize.
+
+    Args:
+        img (PIL.Image): Input image
+        platform (str): Key of PLATFORM_SIZES (unknown platforms use meesho)
+
+    Returns:
+        PIL.Image: Cropped and resized image
+    """
+    size = PLATFORM_SIZES.get(platform, PLATFORM_SIZES['meesho'])
+    return img.crop(crop_box(img.size, size)).resize(size, Image.LANCZOS)
+
+
+def crop_to_platforms(img, platforms, focus=None):
+    """
+    Crop and resize one image for several platforms, sharing the downscaling.
+
+    The image is halved repeatedly (box filter) into a pyramid built only as
+    deep as needed; each platform resamples its crop window with LANCZOS from
+    the smallest level that is still at least its output size, so a
+    2048 px and a 1000 px output share one reduction instead of each
+    filtering the full-size image.
+
+    Args:
+        img (PIL.Image): Decoded image
+        platforms (list): Keys of PLATFORM_SIZES (unknown platforms use meesho)
+        focus (tuple): Box to centre the crops on (see crop_box), e.g. product_box(mask)
+
+    Returns:
+        dict: platform -> resized PIL.Image, in the order given
+    """
+    levels = [img]
+    outputs = {}
+    for platform in platforms:
+        size = PLATFORM_SIZES.get(platform, PLATFORM_SIZES['meesho'])
+        left, top, right, bottom = crop_box(img.size, size, focus)
+        level = 0
+        while (right - left) >> (level + 1) >= size[0] and (bottom - top) >> (level + 1) >= size[1]:
+            level += 1
+        while len(levels) <= level:
+            levels.append(levels[-1].reduce(2))
+        scale = 2 ** level
+        outputs[platform] = levels[level].resize(
+            size, Image.LANCZOS, box=(left / scale, top / scale, right / scale, bottom / scale))
+    return outputs
@@ -0,0 +1,112 @@
+"""
+Request Timing Module
+Lightweight span recorder behind the Server-Timing header. A recorder is
+made active for the current request (or job) through a context variable;
+span() blocks add their wall time to it under a name, and repeated names add
+up. With no active recorder span() returns one shared no-op context, so
+instrumented code costs a single context-variable lookup when timing is off.
+Per-request records can also be appended to a JSON-lines log.
+"""
+
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+# JSON-lines file for per-request timing records ('' disables logging)
+TIMING_LOG = os.environ.get('TIMING_LOG', '')
+
+_active = contextvars.ContextVar('span_recorder', default=None)
+_NO_SPAN = nullcontext()
+
+
+class SpanRecorder:
+    """Named wall-clock durations in milliseconds, kept in first-seen order."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+
+    def add(self, name, ms):
+        self.spans[name] = self.spans.get(name, 0.0) + ms
+
+    def update(self, spans):
+        """Add spans measured elsewhere, e.g. the timings a job worker returned."""
+        for name, ms in (spans or {}).items():
+            self.add(name, ms)
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def rounded(self):
+        """Spans rounded to 0.1 ms, for JSON."""
+        return {name: round(ms, 1) for name, ms in self.spans.items()}
+
+    def header(self):
+        """Server-Timing header value: every span, then the time since the recorder started as 'total'."""
+        parts = [f'{name};dur={ms:.1f}' for name, ms in self.spans.items()]
+        parts.append(f'total;dur={self.elapsed_ms():.1f}')
+        return ', '.join(parts)
+
+
+def span(name):
+    """
+    Time a block under name on the active recorder.
+
+    Args:
+        name (str): Span name (a Server-Timing metric name: no spaces or commas)
+
+    Returns:
+        Context manager; a shared no-op when nothing is recording
+    """
+    recorder = _active.get()
+    return _NO_SPAN if recorder is None else recorder.span(name)
+
+
+def add_spans(spans):
+    """Add already-measured spans (name -> ms) to the active recorder, if any."""
+    recorder = _active.get()
+    if recorder is not None:
+        recorder.update(spans)
+
+
+def start_recording():
+    """Make a new recorder active; returns (recorder, token) for stop_recording()."""
+    recorder = SpanRecorder()
+    return recorder, _active.set(recorder)
+
+
+def stop_recording(token):
+    _active.reset(token)
+
+
+@contextmanager
+def recording():
+    """Record the spans of a block (a job run) on a fresh recorder, which is yielded."""
+    recorder, token = start_recording()
+    try:
+        yield recorder
+    finally:
+        stop_recording(token)
+
+
+def record_timing(record, log_path=None):
+    """Append one request's timing record to the JSON-lines timing log (never raises)."""
+    log_path = log_path or TIMING_LOG
+    if not log_path:
+        return
+    try:
+        os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+        with open(log_path, 'a') as f:
+            f.write(json.dumps(dict(record, time=round(time.time(), 3), pid=os.getpid())) + '\n')
+    except OSError as e:
+        print(f"⚠️ Could not record request timing: {e}")
@@ -0,0 +1,108 @@
+"""
+Segmentation Cascade Module
+Cheap-first product segmentation. Catalogue shots on a plain light sweep are
+cut out by the SimpleBackgroundRemover smart threshold at a fraction of
+BiRefNet's cost; the threshold mask is scored for confidence (border
+uniformity, mask compactness, edge agreement) and only images where it looks
+unreliable are escalated to BiRefNet. Every decision is appended to a
+JSON-lines log so the confidence threshold can be tuned from production data.
+"""
+
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+from models.birefnet_bg_removal import run_birefnet_array
+from models.simple_bg_removal import get_simple_bg_remover, score_mask
+
+# 'birefnet' always runs the model; 'cascade' tries the threshold mask first
+SEGMENTATION_MODES = ('birefnet', 'cascade')
+CASCADE_MIN_CONFIDENCE = float(os.environ.get('CASCADE_MIN_CONFIDENCE', 0.6))
+# Fraction of confident requests that also run BiRefNet, only to log how well the cheap mask agreed
+CASCADE_AUDIT_RATE = float(os.environ.get('CASCADE_AUDIT_RATE', 0.0))
+SEGMENTATION_LOG = os.environ.get('SEGMENTATION_LOG', os.path.join('logs', 'segmentation_tiers.jsonl'))
+
+
+def threshold_tier(image_array, min_confidence=None):
+    """
+    First tier of the cascade: the threshold mask and its confidence.
+
+    Args:
+        image_array (np.ndarray): HxWx3/4 uint8 image
+        min_confidence (float): Escalate below this (defaults to CASCADE_MIN_CONFIDENCE)
+
+    Returns:
+        tuple: (HxW uint8 mask, info dict with the score_mask() scores,
+            'threshold_ms' and 'tier': 'threshold' if the mask can be used,
+            'birefnet' if the image must be escalated)
+    """
+    min_confidence = CASCADE_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    started = time.perf_counter()
+    mask = get_simple_bg_remover().smart_threshold_mask(image_array)
+    info = score_mask(image_array, mask)
+    info['threshold_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    info.update(tier='threshold' if info['confidence'] >= min_confidence else 'birefnet',
+                min_confidence=min_confidence, size=list(image_array.shape[1::-1]))
+    return mask, info
+
+
+def mask_iou(a, b):
+    fg_a, fg_b = a >= 128, b >= 128
+    union = np.logical_or(fg_a, fg_b).sum()
+    return float(np.logical_and(fg_a, fg_b).sum() / union) if union else 1.0
+
+
+def note_birefnet(info, threshold_mask, birefnet_mask, birefnet_ms):
+    """Add BiRefNet's time and its agreement with the threshold mask to a tier record."""
+    info['birefnet_ms'] = round(birefnet_ms, 1)
+    info['threshold_iou'] = round(mask_iou(threshold_mask, birefnet_mask), 4)
+    return info
+
+
+def record_tier(info, log_path=None):
+    """Append one segmentation decision to the JSON-lines tier log (never raises)."""
+    log_path = log_path or SEGMENTATION_LOG
+    if not log_path:
+        return
+    try:
+        os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+        with open(log_path, 'a') as f:
+            f.write(json.dumps(dict(info, time=round(time.time(), 3), pid=os.getpid())) + '\n')
+    except OSError as e:
+        print(f"⚠️ Could not record segmentation tier: {e}")
+
+
+def cascade_mask(image_array, min_confidence=None, audit_rate=None, log_path=None, **birefnet_kwargs):
+    """
+    Threshold mask when it is confident enough, otherwise BiRefNet.
+
+    Escalated (and audited) requests also log the IoU between the threshold
+    and BiRefNet masks, which labels the logged scores for threshold tuning.
+
+    Args:
+        image_array (np.ndarray): HxWx3/4 uint8 image
+        min_confidence (float): Escalate below this (defaults to CASCADE_MIN_CONFIDENCE)
+        audit_rate (float): Fraction of confident requests also run through BiRefNet
+        log_path (str): Tier log (defaults to SEGMENTATION_LOG)
+        **birefnet_kwargs: Passed to run_birefnet_array (mask_mode, precision, ...)
+
+    Returns:
+        tuple: (HxW uint8 mask, info dict with 'tier' ('threshold' or 'birefnet'),
+            the scores, timings and, when BiRefNet ran, 'threshold_iou')
+    """
+    audit_rate = CASCADE_AUDIT_RATE if audit_rate is None else audit_rate
+    mask, info = threshold_tier(image_array, min_confidence)
+    escalate = info['tier'] == 'birefnet'
+    if escalate or random.random() < audit_rate:
+        started = time.perf_counter()
+        refined = run_birefnet_array(image_array, **birefnet_kwargs)
+        note_birefnet(info, mask, refined, (time.perf_counter() - started) * 1000)
+        if escalate:
+            mask = refined
+        else:
+            info['audited'] = True
+    record_tier(info, log_path)
+    return mask, info
@@ -4,10 +4,88 @@ A lightweight alternative that works reliably on Windows without DLL issues.
 Uses cv2 and PIL for background removal with multiple algorithms.
 """
 
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 from PIL import Image, ImageFilter, ImageEnhance
 import io
+from models.mask_refine import bounded_size, guided_upsample
+
+# RGBA value written for background pixels by the fallback method
+TRANSPARENT_WHITE = np.array([255, 255, 255, 0], dtype=np.uint8)
+# method='auto' compares the methods on a copy bounded to this long side
+AUTO_MAX_SIDE = int(os.environ.get('SIMPLE_BG_AUTO_MAX_SIDE', 384))
+# Masks are scored on a copy bounded to this long side
+SCORE_MAX_SIDE = 512
+
+
+def score_mask(image_array, mask):
+    """
+    Confidence that a threshold mask is a clean product cutout.
+
+    border_uniformity: the frame is background and low-variance (a plain sweep)
+    compactness: the foreground is one solid object of plausible size (a
+        hollow outline, e.g. the seam of a white product on a white sweep,
+        is not solid)
+    edge_agreement: the mask outline runs along edges in the image
+
+    Args:
+        image_array (np.ndarray): HxWx3/4 uint8 RGB(A) image
+        mask (np.ndarray): HxW uint8 mask
+
+    Returns:
+        dict: The three scores, the foreground fraction and 'confidence'
+            (the weakest score), all in 0..1
+    """
+    height, width = mask.shape[:2]
+    size = bounded_size(width, height, SCORE_MAX_SIDE)
+    rgb = cv2.resize(np.ascontiguousarray(image_array[:, :, :3]), size, interpolation=cv2.INTER_AREA)
+    binary = (cv2.resize(mask, size, interpolation=cv2.INTER_AREA) >= 128).astype(np.uint8)
+    h, w = binary.shape
+
+    band = max(2, round(0.03 * min(h, w)))
+    frame = np.ones((h, w), dtype=bool)
+    frame[band:h - band, band:w - band] = False
+    border_background = 1.0 - float(binary[frame].mean())
+    border_spread = float(rgb[frame].astype(np.float32).std(axis=0).mean())
+    border_uniformity = border_background * float(np.clip(1.0 - border_spread / 40.0, 0.0, 1.0))
+
+    foreground = float(binary.mean())
+    compactness = 0.0
+    if 0.01 <= foreground <= 0.9:
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        areas = stats[1:count, cv2.CC_STAT_AREA]
+        largest_share = areas.max() / areas.sum()
+        # Solidity from the component's pixel area, so holes count against it
+        largest = (labels == 1 + int(areas.argmax())).astype(np.uint8)
+        contours, _ = cv2.findContours(largest, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        hull_area = cv2.contourArea(cv2.convexHull(np.concatenate(contours)))
+        solidity = min(areas.max() / max(hull_area, 1.0), 1.0)
+        compactness = float(largest_share * np.sqrt(solidity))
+
+    outline = cv2.morphologyEx(binary, cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8)).astype(bool)
+    edges = cv2.Canny(cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY), 50, 150)
+    edges = cv2.dilate(edges, np.ones((5, 5), np.uint8)).astype(bool)
+    edge_agreement = float(edges[outline].mean()) if outline.any() else 0.0
+
+    scores = {
+        'border_uniformity': round(border_uniformity, 3),
+        'compactness': round(compactness, 3),
+        'edge_agreement': round(edge_agreement, 3),
+        'foreground': round(foreground, 3),
+    }
+    scores['confidence'] = min(scores['border_uniformity'], scores['compactness'], scores['edge_agreement'])
+    return scores
+
+
+def _cutout(image_array, mask):
+    """RGBA cutout: pixels outside the mask zeroed, mask as alpha."""
+    result = Image.fromarray(cv2.bitwise_and(image_array, image_array, mask=mask))
+    result.putalpha(Image.fromarray(mask, 'L'))
+    return result
+
 
 class SimpleBackgroundRemover:
     """
@@ -15,8 +93,94 @@ class SimpleBackgroundRemover:
     Multiple algorithms for better results than U2Net.
     """
     
-    def __init__(self):
+    def __init__(self, white_threshold=200):
+        """
+        Args:
+            white_threshold (int): Pixels with R, G and B all above this are
+                treated as background by the fallback method
+        """
         self.methods = ['grabcut', 'watershed', 'threshold']
+        self.white_threshold = white_threshold
+        # One thread per method for auto selection; the work is in OpenCV calls, which release the GIL
+        self._executor = None
+    
+    def grabcut_mask(self, image_array, iterations=5):
+        """
+        GrabCut foreground mask, seeded with the centre 80% of the image.
+        
+        Args:
+            image_array (np.ndarray): HxWx3/4 uint8 RGB(A) image
+            iterations (int): GrabCut iterations
+            
+        Returns:
+            np.ndarray: HxW uint8 mask (255 = product)
+        """
+        img_cv = cv2.cvtColor(image_array, cv2.COLOR_RGBA2BGR if image_array.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+        height, width = img_cv.shape[:2]
+        
+        # Create mask
+        mask = np.zeros((height, width), np.uint8)
+        
+        # Define rectangle around the main object (center 80% of image)
+        margin_x = int(width * 0.1)
+        margin_y = int(height * 0.1)
+        rect = (margin_x, margin_y, width - 2*margin_x, height - 2*margin_y)
+        
+        # Initialize foreground and background models
+        bgd_model = np.zeros((1, 65), np.float64)
+        fgd_model = np.zeros((1, 65), np.float64)
+        
+        # Apply GrabCut
+        cv2.grabCut(img_cv, mask, rect, bgd_model, fgd_model, iterations, cv2.GC_INIT_WITH_RECT)
+        
+        # Definite and probable foreground
+        return np.where((mask == cv2.GC_BGD) | (mask == cv2.GC_PR_BGD), 0, 255).astype(np.uint8)
+    
+    def watershed_mask(self, image_array):
+        """
+        Watershed foreground mask from Otsu-thresholded markers.
+        
+        Args:
+            image_array (np.ndarray): HxWx3/4 uint8 RGB(A) image
+            
+        Returns:
+            np.ndarray: HxW uint8 mask (255 = product)
+        """
+        img_cv = cv2.cvtColor(image_array, cv2.COLOR_RGBA2BGR if image_array.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+        
+        # Convert to grayscale
+        gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+        
+        # Apply threshold to get binary image
+        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        
+        # Noise removal
+        kernel = np.ones((3, 3), np.uint8)
+        opening = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations=2)
+        
+        # Sure background area
+        sure_bg = cv2.dilate(opening, kernel, iterations=3)
+        
+        # Sure foreground area
+        dist_transform = cv2.distanceTransform(opening, cv2.DIST_L2, 5)
+        _, sure_fg = cv2.threshold(dist_transform, 0.7 * dist_transform.max(), 255, 0)
+        
+        # Unknown region
+        sure_fg = np.uint8(sure_fg)
+        unknown = cv2.subtract(sure_bg, sure_fg)
+        
+        # Marker labelling
+        _, markers = cv2.connectedComponents(sure_fg)
+        markers = markers + 1
+        markers[unknown == 255] = 0
+        
+        # Apply watershed
+        markers = cv2.watershed(img_cv, markers)
+        
+        # Create mask
+        mask = np.zeros(gray.shape, dtype=np.uint8)
+        mask[markers > 1] = 255
+        return mask
     
     def remove_background_grabcut(self, image):
         """
@@ -24,43 +188,8 @@ class SimpleBackgroundRemover:
         More accurate than simple thresholding.
         """
         try:
-            # Convert PIL to OpenCV
             img_array = np.array(image.convert('RGB'))
-            img_cv = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            
-            height, width = img_cv.shape[:2]
-            
-            # Create mask
-            mask = np.zeros((height, width), np.uint8)
-            
-            # Define rectangle around the main object (center 80% of image)
-            margin_x = int(width * 0.1)
-            margin_y = int(height * 0.1)
-            rect = (margin_x, margin_y, width - 2*margin_x, height - 2*margin_y)
-            
-            # Initialize foreground and background models
-            bgd_model = np.zeros((1, 65), np.float64)
-            fgd_model = np.zeros((1, 65), np.float64)
-            
-            # Apply GrabCut
-            cv2.grabCut(img_cv, mask, rect, bgd_model, fgd_model, 5, cv2.GC_INIT_WITH_RECT)
-            
-            # Create final mask
-            mask2 = np.where((mask == 2) | (mask == 0), 0, 1).astype('uint8')
-            
-            # Apply mask to image
-            result = img_cv * mask2[:, :, np.newaxis]
-            
-            # Convert back to PIL with alpha
-            result_rgb = cv2.cvtColor(result, cv2.COLOR_BGR2RGB)
-            result_pil = Image.fromarray(result_rgb)
-            
-            # Create alpha channel from mask
-            alpha = Image.fromarray((mask2 * 255).astype(np.uint8), 'L')
-            result_pil.putalpha(alpha)
-            
-            return result_pil
-            
+            return _cutout(img_array, self.grabcut_mask(img_array))
         except Exception as e:
             print(f"GrabCut failed: {e}")
             return self._fallback_removal(image)
@@ -71,56 +200,8 @@ class SimpleBackgroundRemover:
         Good for objects with clear boundaries.
         """
         try:
-            # Convert to OpenCV
             img_array = np.array(image.convert('RGB'))
-            img_cv = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            
-            # Convert to grayscale
-            gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-            
-            # Apply threshold to get binary image
-            _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-            
-            # Noise removal
-            kernel = np.ones((3, 3), np.uint8)
-            opening = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations=2)
-            
-            # Sure background area
-            sure_bg = cv2.dilate(opening, kernel, iterations=3)
-            
-            # Sure foreground area
-            dist_transform = cv2.distanceTransform(opening, cv2.DIST_L2, 5)
-            _, sure_fg = cv2.threshold(dist_transform, 0.7 * dist_transform.max(), 255, 0)
-            
-            # Unknown region
-            sure_fg = np.uint8(sure_fg)
-            unknown = cv2.subtract(sure_bg, sure_fg)
-            
-            # Marker labelling
-            _, markers = cv2.connectedComponents(sure_fg)
-            markers = markers + 1
-            markers[unknown == 255] = 0
-            
-            # Apply watershed
-            markers = cv2.watershed(img_cv, markers)
-            
-            # Create mask
-            mask = np.zeros(gray.shape, dtype=np.uint8)
-            mask[markers > 1] = 255
-            
-            # Apply mask
-            result = cv2.bitwise_and(img_cv, img_cv, mask=mask)
-            
-            # Convert back to PIL with alpha
-            result_rgb = cv2.cvtColor(result, cv2.COLOR_BGR2RGB)
-            result_pil = Image.fromarray(result_rgb)
-            
-            # Create alpha channel
-            alpha = Image.fromarray(mask, 'L')
-            result_pil.putalpha(alpha)
-            
-            return result_pil
-            
+            return _cutout(img_array, self.watershed_mask(img_array))
         except Exception as e:
             print(f"Watershed failed: {e}")
             return self._fallback_removal(image)
@@ -131,77 +212,159 @@ class SimpleBackgroundRemover:
         Enhanced version of simple thresholding.
         """
         try:
-            # Convert to OpenCV
             img_array = np.array(image.convert('RGB'))
-            img_cv = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-            
-            # Convert to HSV for better color separation
-            hsv = cv2.cvtColor(img_cv, cv2.COLOR_BGR2HSV)
-            
-            # Create mask for background (assuming lighter background)
-            # Adjust these values based on your typical images
-            lower_bg = np.array([0, 0, 200])  # Light background
-            upper_bg = np.array([180, 30, 255])
-            
-            bg_mask = cv2.inRange(hsv, lower_bg, upper_bg)
-            
-            # Invert mask to get foreground
-            fg_mask = cv2.bitwise_not(bg_mask)
-            
-            # Apply morphological operations to clean up
-            kernel = np.ones((5, 5), np.uint8)
-            fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, kernel)
-            fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, kernel)
-            
-            # Apply Gaussian blur for smoother edges
-            fg_mask = cv2.GaussianBlur(fg_mask, (5, 5), 0)
-            
-            # Apply mask
-            result = cv2.bitwise_and(img_cv, img_cv, mask=fg_mask)
-            
-            # Convert back to PIL with alpha
-            result_rgb = cv2.cvtColor(result, cv2.COLOR_BGR2RGB)
-            result_pil = Image.fromarray(result_rgb)
-            
-            # Create alpha channel
-            alpha = Image.fromarray(fg_mask, 'L')
-            result_pil.putalpha(alpha)
-            
-            return result_pil
-            
+            return _cutout(img_array, self.smart_threshold_mask(img_array))
         except Exception as e:
             print(f"Smart threshold failed: {e}")
             return self._fallback_removal(image)
     
-    def _fallback_removal(self, image):
+    def smart_threshold_mask(self, image_array):
         """
-        Simple fallback method using PIL only.
+        Foreground mask of the smart threshold method, straight from pixels.
+        
+        Args:
+            image_array (np.ndarray): HxWx3/4 uint8 RGB(A) image
+            
+        Returns:
+            np.ndarray: HxW uint8 mask (255 = product)
         """
-        try:
-            # Convert to RGBA
-            img = image.convert('RGBA')
+        # Convert to HSV for better color separation
+        code = cv2.COLOR_RGBA2RGB if image_array.shape[2] == 4 else None
+        rgb = cv2.cvtColor(image_array, code) if code is not None else image_array
+        hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+        
+        # Create mask for background (assuming lighter background)
+        # Adjust these values based on your typical images
+        lower_bg = np.array([0, 0, 200])  # Light background
+        upper_bg = np.array([180, 30, 255])
+        
+        bg_mask = cv2.inRange(hsv, lower_bg, upper_bg)
+        
+        # Invert mask to get foreground
+        fg_mask = cv2.bitwise_not(bg_mask)
+        
+        # Apply morphological operations to clean up
+        kernel = np.ones((5, 5), np.uint8)
+        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_CLOSE, kernel)
+        fg_mask = cv2.morphologyEx(fg_mask, cv2.MORPH_OPEN, kernel)
+        
+        # Apply Gaussian blur for smoother edges
+        return cv2.GaussianBlur(fg_mask, (5, 5), 0)
+    
+    def _fallback_removal(self, image, white_threshold=None):
+        """
+        Simple fallback method: make near-white pixels transparent.
+        
+        Args:
+            image (PIL.Image): Input image
+            white_threshold (int): Override for self.white_threshold
             
-            # Get image data
-            data = img.getdata()
+        Returns:
+            PIL.Image: RGBA image, near-white pixels set to (255, 255, 255, 0)
+        """
+        if white_threshold is None:
+            white_threshold = self.white_threshold
+        try:
+            # Convert to RGBA array
+            arr = np.array(image.convert('RGBA'))
             
-            # Create new data with transparency for white/light pixels
-            new_data = []
-            for item in data:
-                # If pixel is mostly white/light, make it transparent
-                if item[0] > 200 and item[1] > 200 and item[2] > 200:
-                    new_data.append((255, 255, 255, 0))  # Transparent
-                else:
-                    new_data.append(item)
+            # If pixel is mostly white/light (min of R, G, B above threshold), make it transparent
+            near_white = np.minimum(np.minimum(arr[:, :, 0], arr[:, :, 1]), arr[:, :, 2]) > white_threshold
+            # Write whole RGBA pixels at once through a uint32 view
+            pixels = arr.view(np.uint32)[:, :, 0]
+            np.copyto(pixels, TRANSPARENT_WHITE.view(np.uint32)[0], where=near_white)
             
-            # Update image data
-            img.putdata(new_data)
-            return img
+            return Image.fromarray(arr, 'RGBA')
             
         except Exception as e:
             print(f"Fallback removal failed: {e}")
             # Return original image with white background
             return image.convert('RGBA')
     
+    def _mask_for(self, method, image_array):
+        if method == 'grabcut':
+            return self.grabcut_mask(image_array)
+        if method == 'watershed':
+            return self.watershed_mask(image_array)
+        return self.smart_threshold_mask(image_array)
+    
+    def _timed_mask(self, method, image_array):
+        started = time.perf_counter()
+        mask = self._mask_for(method, image_array)
+        return mask, (time.perf_counter() - started) * 1000
+    
+    def auto_mask(self, image_array, max_side=None):
+        """
+        Best mask of the three methods, picked on a downscaled copy.
+        
+        GrabCut, watershed and smart threshold run concurrently on a copy
+        bounded to max_side; each mask is scored with score_mask() and only
+        the winner is brought back to full resolution, with a guided filter
+        that snaps its edges to the full-size image.
+        
+        Args:
+            image_array (np.ndarray): HxWx3/4 uint8 RGB(A) image
+            max_side (int): Long side of the comparison copy (defaults to AUTO_MAX_SIDE)
+            
+        Returns:
+            tuple: (HxW uint8 mask or None if every method failed, report dict
+                with 'method', per-method 'ms' and scores under 'methods',
+                'downscale_ms', 'refine_ms' and 'total_ms')
+        """
+        started = time.perf_counter()
+        height, width = image_array.shape[:2]
+        work_size = bounded_size(width, height, max_side or AUTO_MAX_SIDE)
+        if work_size != (width, height):
+            work = cv2.resize(image_array, work_size, interpolation=cv2.INTER_AREA)
+        else:
+            work = image_array
+        report = {'work_size': list(work_size),
+                  'downscale_ms': round((time.perf_counter() - started) * 1000, 1), 'methods': {}}
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.methods), thread_name_prefix='simple-bg')
+        futures = {name: self._executor.submit(self._timed_mask, name, work) for name in self.methods}
+        masks = {}
+        for name, future in futures.items():
+            try:
+                masks[name], ms = future.result()
+            except Exception as e:
+                print(f"Method {name} failed: {e}")
+                report['methods'][name] = {'error': str(e)}
+                continue
+            report['methods'][name] = dict(score_mask(work, masks[name]), ms=round(ms, 1))
+        
+        if not masks:
+            report.update(method=None, refine_ms=0.0, total_ms=round((time.perf_counter() - started) * 1000, 1))
+            return None, report
+        
+        # Weakest score first, the other scores break ties (e.g. all zero on cluttered photos)
+        def rank(name):
+            scores = report['methods'][name]
+            return scores['confidence'], scores['border_uniformity'] + scores['compactness'] + scores['edge_agreement']
+        winner = max(self.methods, key=lambda name: rank(name) if name in masks else (-1.0, -1.0))
+        
+        refine_started = time.perf_counter()
+        mask = masks[winner]
+        if work is not image_array:
+            mask = guided_upsample(mask, image_array, guide_low=work)
+        report.update(method=winner, refine_ms=round((time.perf_counter() - refine_started) * 1000, 1),
+                      total_ms=round((time.perf_counter() - started) * 1000, 1))
+        return mask, report
+    
+    def remove_background_auto(self, image):
+        """
+        Background removal with the method picked by auto_mask().
+        
+        Returns:
+            tuple: (PIL.Image RGBA cutout, auto_mask() report)
+        """
+        img_array = np.array(image.convert('RGB'))
+        mask, report = self.auto_mask(img_array)
+        if mask is None:
+            return self._fallback_removal(image), report
+        return _cutout(img_array, mask), report
+    
     def remove_background(self, image, method='auto'):
         """
         Remove background using specified method or auto-select best.
@@ -214,21 +377,8 @@ class SimpleBackgroundRemover:
             PIL.Image: Image with background removed
         """
         if method == 'auto':
-            # Try methods in order of quality
-            for method_name in ['grabcut', 'watershed', 'threshold']:
-                try:
-                    if method_name == 'grabcut':
-                        return self.remove_background_grabcut(image)
-                    elif method_name == 'watershed':
-                        return self.remove_background_watershed(image)
-                    elif method_name == 'threshold':
-                        return self.remove_background_smart_threshold(image)
-                except Exception as e:
-                    print(f"Method {method_name} failed: {e}")
-                    continue
-            
-            # If all methods fail, use fallback
-            return self._fallback_removal(image)
+            # All methods compete on a downscaled copy; falls back if every one fails
+            return self.remove_background_auto(image)[0]
         
         elif method == 'grabcut':
             return self.remove_background_grabcut(image)
@@ -246,7 +396,9 @@ def get_simple_bg_remover():
     """Get or create global background remover instance."""
     global _bg_remover
     if _bg_remover is None:
-        _bg_remover = SimpleBackgroundRemover()
+        _bg_remover = SimpleBackgroundRemover(
+            white_threshold=int(os.environ.get('SIMPLE_BG_WHITE_THRESHOLD', 200))
+        )
     return _bg_remover
 
 def remove_background_simple(image, method='auto'):
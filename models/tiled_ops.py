@@ -0,0 +1,166 @@
+"""
+Tiled Operations Module
+Strip-wise compositing, drop shadow and enhancement for very large photos.
+The whole-image versions in photogenix_ops hold several full-size RGBA copies
+at once (cutout, background, composite, shadow array, one per enhancement);
+here each step runs on horizontal strips with enough overlap for its filter,
+so the only full-size buffers are the decoded input, the mask and the output.
+Contrast pivots on a whole-image mean, which is summed strip by strip, so
+results match the whole-image functions exactly.
+"""
+
+import os
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageOps
+
+from models.background_library import get_background_library
+from models.photogenix_ops import apply_mask, drop_shadow
+from models.tone_pipeline import apply_tone, contrast_mean, luma_total
+
+# Images at or above this many pixels take the tiled path (0 tiles everything)
+TILED_MIN_PIXELS = int(float(os.environ.get('TILED_MIN_MEGAPIXELS', 16)) * 1_000_000)
+# Rows per strip; working memory is a few strips of width * STRIP_ROWS pixels
+STRIP_ROWS = int(os.environ.get('TILED_STRIP_ROWS', 256))
+
+# Overlap each strip needs: the 21x21 shadow blur and the 3x3 SMOOTH kernel behind Sharpness
+SHADOW_HALO = 10
+SHARPNESS_HALO = 1
+
+
+def should_tile(img):
+    """Whether an image is large enough for the tiled path."""
+    return img.width * img.height >= TILED_MIN_PIXELS
+
+
+def _strips(height, strip_rows):
+    for top in range(0, height, strip_rows):
+        yield top, min(top + strip_rows, height)
+
+
+def map_strips(img, func, halo=0, strip_rows=STRIP_ROWS):
+    """
+    Apply func to an image in place, one strip of rows at a time.
+
+    func receives a strip with up to halo extra rows of (unmodified) input
+    above and below, and must return an image of the same size; only the
+    rows of the strip itself are written back.
+
+    Args:
+        img (PIL.Image): Image to update in place
+        func (callable): PIL.Image -> PIL.Image of the same size and mode
+        halo (int): Rows of context the operation needs on each side
+        strip_rows (int): Rows per strip
+
+    Returns:
+        PIL.Image: img
+    """
+    width, height = img.size
+    strip_rows = max(strip_rows, halo, 1)
+    carry = None  # Original rows just above the current strip (already overwritten in img)
+    for top, bottom in _strips(height, strip_rows):
+        below = img.crop((0, top, width, min(height, bottom + halo)))
+        above = top - max(0, top - halo)
+        if above:
+            region = Image.new(img.mode, (width, above + below.height))
+            region.paste(carry.crop((0, carry.height - above, width, carry.height)), (0, 0))
+            region.paste(below, (0, above))
+        else:
+            region = below
+        if halo:
+            carry = below.crop((0, max(0, bottom - top - halo), width, bottom - top))
+        result = func(region)
+        img.paste(result.crop((0, above, width, above + bottom - top)), (0, top))
+    return img
+
+
+def _preset(strip, preset):
+    """apply_preset for one strip, keeping the strip's RGBA mode."""
+    if preset == 'luxury_matte':
+        colorized = ImageOps.colorize(strip.convert('L'), black='#222', white='#faf8ff')
+        # Strips are pasted back into the RGBA composite; the whole result is converted at the end
+        return colorized.convert('RGBA')
+    if preset == 'minimalist_white':
+        strip = apply_tone(strip, brightness=1.15, color=1.05)
+    return strip
+
+
+def composite_product_tiled(img, mask, bg_name, preset=None, strip_rows=STRIP_ROWS):
+    """
+    Strip-wise composite_product(img, mask, load_background(bg_name, img.size)),
+    optionally followed by apply_preset, without any full-size intermediate.
+
+    The background is resized strip by strip. The first pass composites,
+    adds the shadow and sums the luminance Contrast needs; the second
+    applies the tone pipeline and the preset in place.
+
+    Args:
+        img (PIL.Image): RGB or RGBA product image (its alpha is replaced by mask)
+        mask (PIL.Image): L-mode mask at img size
+        bg_name (str): Background name or path
+        preset (str): make_professional preset to apply, or None
+        strip_rows (int): Rows per strip
+
+    Returns:
+        PIL.Image: RGBA composite (RGB for 'luxury_matte', as apply_preset returns)
+    """
+    library = get_background_library()
+    width, height = img.size
+    strip_rows = max(strip_rows, SHADOW_HALO)
+    out = Image.new('RGBA', img.size)
+    luma = 0
+    for top, bottom in _strips(height, strip_rows):
+        t0, b0 = max(0, top - SHADOW_HALO), min(height, bottom + SHADOW_HALO)
+        box = (0, t0, width, b0)
+        bg = library.get_rows(bg_name, img.size, t0, b0)
+        composite = Image.alpha_composite(bg.convert('RGBA'), apply_mask(img.crop(box), mask.crop(box)))
+        arr = drop_shadow(np.array(composite))
+        strip = arr[top - t0:bottom - t0]
+        luma += luma_total(strip, 1.08)
+        out.paste(Image.fromarray(strip), (0, top))
+
+    mean = contrast_mean(luma, width * height)
+
+    def finish(strip):
+        strip = apply_tone(strip, brightness=1.08, contrast=1.12, color=1.15, mean=mean)
+        return _preset(strip, preset) if preset else strip
+
+    out = map_strips(out, finish, strip_rows=strip_rows)
+    # Same mode as the whole-image path, so the encoder's alpha and format choice do not depend on size
+    return out.convert('RGB') if preset == 'luxury_matte' else out
+
+
+def enhance_image_tiled(img, strip_rows=STRIP_ROWS):
+    """
+    Strip-wise enhance_image: the tone pipeline, then Sharpness, keeping alpha.
+
+    Args:
+        img (PIL.Image): Input image (not modified)
+        strip_rows (int): Rows per strip
+
+    Returns:
+        PIL.Image: Enhanced image (RGBA if img is RGBA, otherwise RGB)
+    """
+    width, height = img.size
+    has_alpha = img.mode == 'RGBA'
+    luma = 0
+    for top, bottom in _strips(height, strip_rows):
+        luma += luma_total(np.asarray(img.crop((0, top, width, bottom)).convert('RGB')), 1.25)
+    mean = contrast_mean(luma, width * height)
+
+    out = Image.new('RGBA' if has_alpha else 'RGB', img.size)
+    for top, bottom in _strips(height, strip_rows):
+        strip = img.crop((0, top, width, bottom))
+        rgb = apply_tone(strip.convert('RGB'), brightness=1.25, contrast=1.35, color=1.35, mean=mean)
+        if has_alpha:
+            rgb.putalpha(strip.getchannel('A'))
+        out.paste(rgb, (0, top))
+
+    def sharpen(strip):
+        alpha = strip.getchannel('A') if has_alpha else None
+        rgb = ImageEnhance.Sharpness(strip.convert('RGB')).enhance(2.0)
+        if alpha is not None:
+            rgb.putalpha(alpha)
+        return rgb
+
+    return map_strips(out, sharpen, halo=SHARPNESS_HALO, strip_rows=strip_rows)
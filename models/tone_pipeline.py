@@ -0,0 +1,127 @@
+"""
+Tone Pipeline Module
+Brightness, contrast and colour in two passes over the pixel buffer instead
+of one ImageEnhance pass (and one full-size image) per factor. Brightness and
+contrast act on each channel independently, so both compile into a single
+256-entry lookup table, clipping between the steps included (contrast needs
+the brightened image's mean first, so whole images take a second lookup). Colour mixes the
+channels with the pixel's luminance, which is a 3x3 matrix applied with one
+cv2.transform in place. Sharpness is a convolution and stays in ImageEnhance.
+Results are within one level of the chained ImageEnhance calls.
+"""
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Fixed-point weights PIL uses to convert RGB to L
+LUMA_WEIGHTS = np.array([19595, 38470, 7471], dtype=np.float64) / 65536
+
+
+def _blend_lut(values, base, factor):
+    """Image.blend(base, img, factor) for uint8 values: float32 maths, truncated and clipped."""
+    blended = np.float32(base) + np.float32(factor) * (values.astype(np.float32) - np.float32(base))
+    return np.clip(blended, 0, 255).astype(np.uint8)
+
+
+def brightness_lut(brightness):
+    """ImageEnhance.Brightness as a 256-entry table."""
+    return _blend_lut(np.arange(256), 0, brightness)
+
+
+def luma_total(pixels, brightness=1.0):
+    """
+    Sum of the luminance of an image after brightening, which is what
+    ImageEnhance.Contrast pivots on. Sums of strips add up to the whole-image
+    value, so tiled callers get it without a full-size pass.
+
+    Args:
+        pixels (np.ndarray): HxWx3/4 uint8 RGB(A) array
+        brightness (float): Brightness factor applied first
+
+    Returns:
+        int: Sum of the L values (OpenCV's conversion, within rounding of PIL's)
+    """
+    if brightness != 1.0:
+        pixels = cv2.LUT(pixels, brightness_lut(brightness))
+    code = cv2.COLOR_RGBA2GRAY if pixels.shape[2] == 4 else cv2.COLOR_RGB2GRAY
+    return int(cv2.sumElems(cv2.cvtColor(pixels, code))[0])
+
+
+def contrast_mean(total, pixel_count):
+    """Contrast pivot from a luma_total(), rounded like ImageStat-based ImageEnhance.Contrast."""
+    return int(total / pixel_count + 0.5)
+
+
+def tone_lut(brightness=1.0, contrast=1.0, mean=128):
+    """
+    Brightness followed by contrast as one 256-entry table.
+
+    Args:
+        brightness (float): ImageEnhance.Brightness factor
+        contrast (float): ImageEnhance.Contrast factor
+        mean (int): Grey level contrast pivots on (see contrast_mean)
+
+    Returns:
+        np.ndarray: uint8 table of 256 entries
+    """
+    lut = brightness_lut(brightness)
+    if contrast != 1.0:
+        lut = _blend_lut(lut, mean, contrast)
+    return lut
+
+
+def color_matrix(color):
+    """
+    ImageEnhance.Color as a 3x4 matrix for cv2.transform: each output channel
+    is luminance + color * (channel - luminance). The last column offsets the
+    rounding so the result truncates like Image.blend (just under 0.5, so
+    exact integers are not rounded down).
+    """
+    matrix = np.zeros((3, 4), dtype=np.float32)
+    matrix[:, :3] = (1.0 - color) * LUMA_WEIGHTS[np.newaxis, :] + color * np.eye(3)
+    matrix[:, 3] = -0.499
+    return matrix
+
+
+def apply_tone(img, brightness=1.0, contrast=1.0, color=1.0, mean=None):
+    """
+    ImageEnhance Brightness, Contrast and Color (in that order) on one buffer.
+
+    With mean given, brightness and contrast are one table lookup; without,
+    the brightened buffer is measured first and contrast is a second lookup
+    in place. Colour is one cv2.transform in place. RGBA images are toned as
+    a 3-channel buffer, where OpenCV's per-pixel paths are several times
+    faster, and get their alpha back at the end.
+
+    Args:
+        img (PIL.Image): RGB or RGBA image (other modes are converted to RGB); not modified
+        brightness (float): Brightness factor
+        contrast (float): Contrast factor
+        color (float): Colour saturation factor
+        mean (int): Contrast pivot (see contrast_mean); measured from img when not given
+
+    Returns:
+        PIL.Image: New image in img's mode (RGBA alpha is kept unchanged, as
+        ImageEnhance does)
+    """
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGB')
+    pixels = np.asarray(img)
+    has_alpha = img.mode == 'RGBA'
+    # cvtColor already makes a private copy; the RGB input is read-only and is copied by the first lookup
+    rgb = cv2.cvtColor(pixels, cv2.COLOR_RGBA2RGB) if has_alpha else None
+    if contrast != 1.0 and mean is None:
+        rgb = cv2.LUT(pixels if rgb is None else rgb, brightness_lut(brightness), dst=rgb)
+        mean = contrast_mean(luma_total(rgb), img.width * img.height)
+        lut = tone_lut(1.0, contrast, mean)
+    else:
+        lut = tone_lut(brightness, contrast, mean)
+    rgb = cv2.LUT(pixels if rgb is None else rgb, lut, dst=rgb)
+    if color != 1.0:
+        cv2.transform(rgb, color_matrix(color), dst=rgb)
+    if not has_alpha:
+        return Image.fromarray(rgb, 'RGB')
+    out = cv2.cvtColor(rgb, cv2.COLOR_RGB2RGBA)
+    out[:, :, 3] = pixels[:, :, 3]
+    return Image.fromarray(out, 'RGBA')
@@ -0,0 +1,159 @@
+"""
+Upload Guard Module
+Bounded in-memory handling of image uploads. Multipart file parts are
+spooled in memory up to a threshold (then to an anonymous temporary file),
+and image headers are checked against a pixel budget before anything is
+decoded, so decompression-bomb sized inputs never reach a full decode.
+Images the server already holds (samples, earlier results, saved uploads)
+can be named by URL path instead of being uploaded again.
+"""
+
+import io
+import os
+import tempfile
+from urllib.parse import unquote, urlsplit
+
+from flask import Request
+from PIL import Image, UnidentifiedImageError
+
+# Largest image (width * height) any route will decode; the default takes 48 MP phone
+# photos and stays under Pillow's own decompression-bomb warning (about 89 MP)
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 80_000_000))
+# This budget is the limit that applies: Pillow must not warn or refuse below it
+if Image.MAX_IMAGE_PIXELS and Image.MAX_IMAGE_PIXELS < MAX_IMAGE_PIXELS:
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+# Upload parts up to this size stay in memory
+UPLOAD_SPOOL_BYTES = int(float(os.environ.get('UPLOAD_SPOOL_MB', 16)) * 1024 * 1024)
+
+
+class UploadRejected(ValueError):
+    """An upload that cannot be processed; status_code is the HTTP status to answer with."""
+    status_code = 400
+
+
+class ImageTooLargeError(UploadRejected):
+    """The image header declares more pixels than allowed."""
+    status_code = 413
+
+
+class AssetNotFound(UploadRejected):
+    """An asset reference that does not name an image the server holds."""
+    status_code = 404
+
+
+class SpooledUploadRequest(Request):
+    """Flask request whose file parts are spooled in memory up to spool_max_size bytes."""
+    spool_max_size = UPLOAD_SPOOL_BYTES
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=self.spool_max_size, mode='rb+')
+
+
+def open_image(source, max_pixels=None):
+    """
+    Open an image lazily and enforce the pixel budget from its header.
+
+    Only the header is parsed here; pixels are decoded later by load() or
+    convert(), after the size check has passed.
+
+    Args:
+        source: Path, bytes or binary file object
+        max_pixels (int): Pixel budget (defaults to MAX_IMAGE_PIXELS)
+
+    Returns:
+        PIL.Image: Lazily opened image
+
+    Raises:
+        ImageTooLargeError: If width * height exceeds the budget
+        UploadRejected: If the data is not a readable image
+    """
+    max_pixels = max_pixels or MAX_IMAGE_PIXELS
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    try:
+        img = Image.open(source)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    except (UnidentifiedImageError, OSError):
+        raise UploadRejected('Upload is not a readable image')
+    width, height = img.size
+    if width * height > max_pixels:
+        img.close()
+        raise ImageTooLargeError(
+            f'Image is {width}x{height} ({width * height / 1e6:.1f} MP); the limit is {max_pixels / 1e6:.1f} MP')
+    return img
+
+
+def read_image_upload(file, max_pixels=None):
+    """
+    Read an uploaded image straight from its request stream after checking its header.
+
+    Args:
+        file (FileStorage): Uploaded file from request.files
+        max_pixels (int): Pixel budget (defaults to MAX_IMAGE_PIXELS)
+
+    Returns:
+        bytes: The encoded upload, ready to decode or hand to a job worker
+
+    Raises:
+        UploadRejected: If the upload is not an image or is over the pixel budget
+    """
+    stream = file.stream
+    stream.seek(0)
+    open_image(stream, max_pixels)
+    stream.seek(0)
+    return stream.read()
+
+
+def asset_path(ref, roots):
+    """
+    Local file behind an asset reference.
+
+    Args:
+        ref (str): URL of the asset as the client sees it, e.g.
+            '/processed/<key>/<name>', '/static/img/<name>' or '/uploads/<name>'
+            (a full URL is accepted; only its path is used)
+        roots (dict): URL prefix -> folder it is served from
+
+    Returns:
+        str: Path of an existing file inside one of the folders
+
+    Raises:
+        AssetNotFound: If no folder serves the path, the file does not exist
+            or the path escapes its folder
+    """
+    path = unquote(urlsplit(ref or '').path)
+    for prefix, root in roots.items():
+        prefix = prefix.rstrip('/') + '/'
+        if not path.startswith(prefix):
+            continue
+        root = os.path.realpath(root)
+        full_path = os.path.realpath(os.path.join(root, path[len(prefix):]))
+        if full_path.startswith(root + os.sep) and os.path.isfile(full_path):
+            return full_path
+        break
+    raise AssetNotFound(f"Unknown asset '{ref}'")
+
+
+def read_asset(ref, roots, max_pixels=None):
+    """
+    Read an image the server already holds, named by an asset reference
+    instead of being uploaded again, after checking its header.
+
+    Args:
+        ref (str): Asset reference (see asset_path)
+        roots (dict): URL prefix -> folder it is served from
+        max_pixels (int): Pixel budget (defaults to MAX_IMAGE_PIXELS)
+
+    Returns:
+        tuple: (file name, encoded bytes)
+
+    Raises:
+        UploadRejected: If the reference is unknown (AssetNotFound) or not an
+            image within the pixel budget
+    """
+    path = asset_path(ref, roots)
+    with open(path, 'rb') as f:
+        data = f.read()
+    open_image(data, max_pixels)
+    return os.path.basename(path), data
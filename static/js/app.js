@@ -332,6 +332,12 @@ function displayResults(result) {
   // Display sales strategies from Gemini
   displaySalesStrategies(result.sales_strategies);
 
+  // The local discount model answers first; Gemini's reasoning and strategies follow
+  if (result.discount_recommendations.reasoning_url) {
+    document.getElementById('discountStrategy').textContent = 'Gemini is writing the discount strategy...';
+    loadDiscountReasoning(result.discount_recommendations.reasoning_url);
+  }
+
 
   // Display festival recommendations
   displayFestivalRecommendations(result.festival_recommendations);
@@ -345,6 +351,30 @@ function displayResults(result) {
   });
 }
 
+// Poll for Gemini's reasoning on a discount from the local model
+async function loadDiscountReasoning(url) {
+  const strategyText = document.getElementById('discountStrategy');
+  try {
+    for (let attempt = 0; attempt < 6; attempt++) {
+      const response = await fetch(`${url}?wait=5`);
+      const reasoning = await response.json();
+      if (!response.ok || reasoning.status === 'failed') {
+        break;
+      }
+      if (reasoning.status === 'done') {
+        strategyText.textContent = reasoning.reasoning && reasoning.reasoning.length > 0
+          ? reasoning.reasoning[0]
+          : 'No specific discount strategy reasoning provided by Gemini.';
+        displaySalesStrategies(reasoning.sales_strategies);
+        return;
+      }
+    }
+  } catch (error) {
+    console.error('Error loading discount reasoning:', error);
+  }
+  strategyText.textContent = 'Discount strategy reasoning is not available right now.';
+}
+
 // NEW FUNCTION: Display sales strategies generated by Gemini
 function displaySalesStrategies(strategies) {
     // IMPORTANT: Make sure your HTML has an element with id="salesStrategiesContainer"
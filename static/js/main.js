@@ -1,3 +1,35 @@
+// Heavy Photogenix operations may outlive the inline wait and come back as a
+// 202 with a job id; poll the job until it finishes, then resolve like a normal response.
+function waitForJob(data, intervalMs = 1000) {
+    if (!data || data.processed_url || !data.status_url || data.status === 'failed') {
+        return Promise.resolve(data);
+    }
+    return new Promise(resolve => setTimeout(resolve, intervalMs))
+        .then(() => fetch(data.status_url))
+        .then(res => res.json())
+        .then(job => waitForJob(job, intervalMs));
+}
+
+// Images the server already has (samples, earlier results) are sent as an asset
+// reference instead of being downloaded as a blob and uploaded again.
+function selectAsset(input, url) {
+    input.value = '';
+    input.dataset.asset = url;
+}
+
+function hasImage(input) {
+    return input.files.length > 0 || Boolean(input.dataset.asset);
+}
+
+// The chosen file as 'image', or the selected asset reference as 'asset'
+function appendImage(formData, input) {
+    if (input.files.length) {
+        formData.append('image', input.files[0]);
+    } else {
+        formData.append('asset', input.dataset.asset);
+    }
+}
+
 document.addEventListener('DOMContentLoaded', function() {
     // Main upload section logic
     const chooseImageBtn = document.getElementById('chooseImage');
@@ -21,6 +53,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Handle file input change
     if (imageInput) imageInput.addEventListener('change', function(event) {
+        delete imageInput.dataset.asset;
         const files = event.target.files;
         preview.innerHTML = '';
         for (let i = 0; i < files.length; i++) {
@@ -46,13 +79,8 @@ document.addEventListener('DOMContentLoaded', function() {
             img.addEventListener('mouseenter',()=>{img.style.border='2px solid #8f5fff';img.style.boxShadow='0 2px 12px rgba(143,95,255,0.18)';});
             img.addEventListener('mouseleave',()=>{img.style.border='2px solid #eee';img.style.boxShadow='0 2px 8px rgba(143,95,255,0.10)';});
             img.addEventListener('click', async () => {
-                // Set the sample image as the selected file
-                const response = await fetch(img.src);
-                const blob = await response.blob();
-                const file = new File([blob], name, {type: blob.type});
-                const dataTransfer = new DataTransfer();
-                dataTransfer.items.add(file);
-                imageInput.files = dataTransfer.files;
+                // Select the sample image on the server
+                selectAsset(imageInput, `/static/img/${encodeURIComponent(name)}`);
                 
                 // Show preview
                 preview.innerHTML = '';
@@ -138,9 +166,9 @@ document.addEventListener('DOMContentLoaded', function() {
 
     bgRemoveForm.addEventListener('submit', function(e) {
         e.preventDefault();
-        if (!bgRemoveInput.files.length) return ;
+        if (!hasImage(bgRemoveInput)) return ;
         const formData = new FormData();
-        formData.append('image', bgRemoveInput.files[0]);
+        appendImage(formData, bgRemoveInput);
         // Show loader, hide preview and download
         bgRemoveLoader.style.display = 'flex';
         bgRemovePreview.style.display = 'none';
@@ -150,6 +178,7 @@ document.addEventListener('DOMContentLoaded', function() {
             body: formData
         })
         .then(res => res.json())
+        .then(waitForJob)
         .then(data => {
             bgRemoveLoader.style.display = 'none';
             bgRemovePreview.style.display = 'flex';
@@ -176,9 +205,9 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('makeProfessional').addEventListener('click', function(e) {
             e.preventDefault();
             const input = document.getElementById('imageInput');
-            if (!input.files.length) return alert('Please select an image.');
+            if (!hasImage(input)) return alert('Please select an image.');
             const formData = new FormData();
-            formData.append('image', input.files[0]);
+            appendImage(formData, input);
             // Show loader, hide button and result card
             document.getElementById('makeProfessionalLoader').style.display = 'flex';
             document.getElementById('makeProfessional').style.display = 'none';
@@ -188,6 +217,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: formData
             })
             .then(res => res.json())
+            .then(waitForJob)
             .then(data => {
                 document.getElementById('makeProfessionalLoader').style.display = 'none';
                 document.getElementById('makeProfessional').style.display = 'inline-block';
@@ -216,9 +246,9 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('autoEnhanceBtn').addEventListener('click', function(e) {
             e.preventDefault();
             const input = document.getElementById('imageInput');
-            if (!input.files.length) return;
+            if (!hasImage(input)) return;
             const formData = new FormData();
-            formData.append('image', input.files[0]);
+            appendImage(formData, input);
             // Show loader, hide button and result card
             document.getElementById('autoEnhanceLoader').style.display = 'flex';
             document.getElementById('autoEnhanceBtn').style.display = 'none';
@@ -228,6 +258,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 body: formData
             })
             .then(res => res.json())
+            .then(waitForJob)
             .then(data => {
                 document.getElementById('autoEnhanceLoader').style.display = 'none';
                 document.getElementById('autoEnhanceBtn').style.display = 'inline-block';
@@ -281,6 +312,7 @@ document.addEventListener('DOMContentLoaded', function() {
     if (closeAutoEnhanceModalBtn) closeAutoEnhanceModalBtn.addEventListener('click', closeAutoEnhanceModal);
     if (chooseAutoEnhanceModalBtn) chooseAutoEnhanceModalBtn.addEventListener('click', () => autoEnhanceModalInput.click());
     if (autoEnhanceModalInput) autoEnhanceModalInput.addEventListener('change', function(event) {
+        delete autoEnhanceModalInput.dataset.asset;
         const file = event.target.files[0];
         if (!file) return;
         const reader = new FileReader();
@@ -301,33 +333,25 @@ document.addEventListener('DOMContentLoaded', function() {
             img.addEventListener('mouseenter',()=>{img.style.border='2px solid #8f5fff';img.style.boxShadow='0 2px 12px rgba(143,95,255,0.18)';});
             img.addEventListener('mouseleave',()=>{img.style.border='2px solid #eee';img.style.boxShadow='0 2px 8px rgba(143,95,255,0.10)';});
             img.addEventListener('click', async () => {
-                const response = await fetch(img.src);
-                const blob = await response.blob();
-                const file = new File([blob], name, {type: blob.type});
-                const dataTransfer = new DataTransfer();
-                dataTransfer.items.add(file);
-                autoEnhanceModalInput.files = dataTransfer.files;
+                selectAsset(autoEnhanceModalInput, `/static/img/${encodeURIComponent(name)}`);
                 // Show preview
-                const reader = new FileReader();
-                reader.onload = function(e) {
-                    autoEnhanceModalPreview.innerHTML = `<img src='${e.target.result}' style='max-width:180px;max-height:180px;border-radius:0.6rem;margin-top:0.7rem;'/>`;
-                };
-                reader.readAsDataURL(file);
+                autoEnhanceModalPreview.innerHTML = `<img src='${img.src}' style='max-width:180px;max-height:180px;border-radius:0.6rem;margin-top:0.7rem;'/>`;
             });
             suggestedEnhanceModalImagesDiv.appendChild(img);
         });
     }
     if (autoEnhanceModalForm) autoEnhanceModalForm.addEventListener('submit', function(e) {
         e.preventDefault();
-        if (!autoEnhanceModalInput.files.length) return; // Silently do nothing if no image
+        if (!hasImage(autoEnhanceModalInput)) return; // Silently do nothing if no image
         const formData = new FormData();
-        formData.append('image', autoEnhanceModalInput.files[0]);
+        appendImage(formData, autoEnhanceModalInput);
         autoEnhanceModalPreview.innerHTML = '<div class="spinner"></div><div style="margin-top:8px;color:#8f5fff;font-weight:600;">Enhancing...</div>';
         fetch('/process/enhance', {
             method: 'POST',
             body: formData
         })
         .then(res => res.json())
+        .then(waitForJob)
         .then(data => {
             if (data.processed_url) {
                 autoEnhanceModalPreview.innerHTML = '';
@@ -372,6 +396,7 @@ document.addEventListener('DOMContentLoaded', function() {
     if (closeCreativeContentModalBtn) closeCreativeContentModalBtn.addEventListener('click', closeCreativeContentModal);
     if (chooseCreativeContentModalBtn) chooseCreativeContentModalBtn.addEventListener('click', () => creativeContentModalInput.click());
     if (creativeContentModalInput) creativeContentModalInput.addEventListener('change', function(event) {
+        delete creativeContentModalInput.dataset.asset;
         // Optionally show preview
     });
     if (suggestedCreativeModalImagesDiv) {
@@ -391,22 +416,16 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Remove highlight from all
                 Array.from(suggestedCreativeModalImagesDiv.children).forEach(child => child.classList.remove('selected-sample-img'));
                 img.classList.add('selected-sample-img');
-                // Set file input
-                const response = await fetch(img.src);
-                const blob = await response.blob();
-                const file = new File([blob], name, {type: blob.type});
-                const dataTransfer = new DataTransfer();
-                dataTransfer.items.add(file);
-                creativeContentModalInput.files = dataTransfer.files;
+                selectAsset(creativeContentModalInput, `/static/img/${encodeURIComponent(name)}`);
             });
             suggestedCreativeModalImagesDiv.appendChild(img);
         });
     }
     if (creativeContentModalForm) creativeContentModalForm.addEventListener('submit', function(e) {
         e.preventDefault();
-        if (!creativeContentModalInput.files.length) return; // Silently do nothing if no image
+        if (!hasImage(creativeContentModalInput)) return; // Silently do nothing if no image
         const formData = new FormData();
-        formData.append('image', creativeContentModalInput.files[0]);
+        appendImage(formData, creativeContentModalInput);
         creativeContentModalLoader.style.display = 'flex';
         creativeContentModalResult.style.display = 'none';
         fetch('/process/creative_content', {
@@ -469,6 +488,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const cropResizeImg = document.getElementById('cropResizeImg');
     const cropResizeDownload = document.getElementById('cropResizeDownload');
     const cropResizePlatform = document.getElementById('cropResizePlatform');
+    const cropResizeLinks = document.getElementById('cropResizeLinks');
     const suggestedCropResizeImagesDiv = document.getElementById('suggestedCropResizeImages');
 
     function openCropResizeModal() {
@@ -486,6 +506,7 @@ document.addEventListener('DOMContentLoaded', function() {
     if (chooseCropResize) chooseCropResize.addEventListener('click', () => cropResizeInput.click());
 
     if (cropResizeInput) cropResizeInput.addEventListener('change', function(event) {
+        delete cropResizeInput.dataset.asset;
         const file = event.target.files[0];
         if (!file) return;
         const reader = new FileReader();
@@ -508,18 +529,9 @@ document.addEventListener('DOMContentLoaded', function() {
             img.addEventListener('mouseenter',()=>{img.style.border='2px solid #8f5fff';img.style.boxShadow='0 2px 12px rgba(143,95,255,0.18)';});
             img.addEventListener('mouseleave',()=>{img.style.border='2px solid #eee';img.style.boxShadow='0 2px 8px rgba(143,95,255,0.10)';});
             img.addEventListener('click', async () => {
-                const response = await fetch(img.src);
-                const blob = await response.blob();
-                const file = new File([blob], name, {type: blob.type});
-                const dataTransfer = new DataTransfer();
-                dataTransfer.items.add(file);
-                cropResizeInput.files = dataTransfer.files;
+                selectAsset(cropResizeInput, `/static/img/${encodeURIComponent(name)}`);
                 // Show preview
-                const reader = new FileReader();
-                reader.onload = function(e) {
-                    cropResizePreview.innerHTML = `<img src='${e.target.result}' style='max-width:180px;max-height:180px;border-radius:0.6rem;margin-top:0.7rem;'/>`;
-                };
-                reader.readAsDataURL(file);
+                cropResizePreview.innerHTML = `<img src='${img.src}' style='max-width:180px;max-height:180px;border-radius:0.6rem;margin-top:0.7rem;'/>`;
             });
             suggestedCropResizeImagesDiv.appendChild(img);
         });
@@ -527,17 +539,21 @@ document.addEventListener('DOMContentLoaded', function() {
 
     if (cropResizeForm) cropResizeForm.addEventListener('submit', function(e) {
         e.preventDefault();
-        if (!cropResizeInput.files.length) return;
+        if (!hasImage(cropResizeInput)) return;
+        // Every selected marketplace in one request: the image is uploaded and decoded once
+        const platforms = Array.from(cropResizePlatform.selectedOptions).map(option => option.value);
         const formData = new FormData();
-        formData.append('image', cropResizeInput.files[0]);
-        formData.append('platform', cropResizePlatform.value);
+        appendImage(formData, cropResizeInput);
+        formData.append('platforms', (platforms.length ? platforms : ['meesho']).join(','));
         cropResizeLoader.style.display = 'flex';
         cropResizeResult.style.display = 'none';
+        cropResizeLinks.innerHTML = '';
         fetch('/process/crop_resize', {
             method: 'POST',
             body: formData
         })
         .then(res => res.json())
+        .then(waitForJob)
         .then(data => {
             cropResizeLoader.style.display = 'none';
             if (data.processed_url) {
@@ -545,6 +561,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 cropResizeDownload.href = data.processed_url;
                 cropResizeDownload.style.display = 'inline-block';
                 cropResizeResult.style.display = 'block';
+                Object.entries(data.platform_urls || {}).forEach(([platform, url]) => {
+                    const link = document.createElement('a');
+                    link.href = url;
+                    link.download = '';
+                    link.textContent = platform;
+                    link.className = 'modal-btn';
+                    cropResizeLinks.appendChild(link);
+                });
             } else {
                 cropResizeResult.style.display = 'block';
                 cropResizeImg.src = '';
@@ -568,17 +592,15 @@ document.addEventListener('DOMContentLoaded', function() {
     let cropper = null;
 
     if (manualCropBtn) manualCropBtn.addEventListener('click', function() {
-        if (!cropResizeInput.files.length) return;
+        if (!hasImage(cropResizeInput)) return;
         // Show manual crop modal, hide main modal content
         cropResizeForm.style.display = 'none';
         cropResizeLoader.style.display = 'none';
         cropResizeResult.style.display = 'none';
         manualCropModal.style.display = 'flex';
         // Load image into cropper
-        const file = cropResizeInput.files[0];
-        const reader = new FileReader();
-        reader.onload = function(e) {
-            manualCropImage.src = e.target.result;
+        const startCropper = function(src) {
+            manualCropImage.src = src;
             if (cropper) cropper.destroy();
             cropper = new Cropper(manualCropImage, {
                 aspectRatio: 1024/1365,
@@ -592,7 +614,16 @@ document.addEventListener('DOMContentLoaded', function() {
                 background: false
             });
         };
-        reader.readAsDataURL(file);
+        if (!cropResizeInput.files.length) {
+            // A selected sample is already served by the app
+            startCropper(cropResizeInput.dataset.asset);
+            return;
+        }
+        const reader = new FileReader();
+        reader.onload = function(e) {
+            startCropper(e.target.result);
+        };
+        reader.readAsDataURL(cropResizeInput.files[0]);
     });
     if (cancelManualCrop) cancelManualCrop.addEventListener('click', function() {
         manualCropModal.style.display = 'none';
@@ -603,15 +634,19 @@ document.addEventListener('DOMContentLoaded', function() {
         if (!cropper) return;
         cropResizeLoader.style.display = 'flex';
         manualCropModal.style.display = 'none';
+        cropResizeLinks.innerHTML = '';
         cropper.getCroppedCanvas({width:1024, height:1365, imageSmoothingQuality:'high'}).toBlob(function(blob) {
             const formData = new FormData();
             formData.append('image', blob, 'cropped.png');
             formData.append('platform', 'meesho');
+            // The seller already framed the product
+            formData.append('crop_focus', 'center');
             fetch('/process/crop_resize', {
                 method: 'POST',
                 body: formData
             })
             .then(res => res.json())
+            .then(waitForJob)
             .then(data => {
                 cropResizeLoader.style.display = 'none';
                 if (data.processed_url) {
@@ -703,6 +738,7 @@ document.addEventListener('DOMContentLoaded', function() {
     if (chooseBgReplace) chooseBgReplace.addEventListener('click', () => bgReplaceInput.click());
 
     if (bgReplaceInput) bgReplaceInput.addEventListener('change', function(event) {
+        delete bgReplaceInput.dataset.asset;
         const file = event.target.files[0];
         if (!file) return;
         const reader = new FileReader();
@@ -729,22 +765,13 @@ document.addEventListener('DOMContentLoaded', function() {
             img.addEventListener('mouseenter',()=>{img.style.border='2px solid #8f5fff';img.style.boxShadow='0 2px 12px rgba(143,95,255,0.18)';});
             img.addEventListener('mouseleave',()=>{img.style.border='2px solid #eee';img.style.boxShadow='0 2px 8px rgba(143,95,255,0.10)';});
             img.addEventListener('click', async () => {
-                const response = await fetch(img.src);
-                const blob = await response.blob();
-                const file = new File([blob], name, {type: blob.type});
-                const dataTransfer = new DataTransfer();
-                dataTransfer.items.add(file);
-                bgReplaceInput.files = dataTransfer.files;
+                selectAsset(bgReplaceInput, `/static/img/${encodeURIComponent(name)}`);
                 // Show preview
-                const reader = new FileReader();
-                reader.onload = function(e) {
-                    bgReplacePreview.innerHTML = `<img src='${e.target.result}' style='max-width:180px;max-height:180px;border-radius:0.6rem;margin-top:0.7rem;'/>`;
-                    
-                    // Show the submit button when sample image is selected
-                    const bgReplaceSubmit = document.getElementById('bgReplaceSubmit');
-                    if (bgReplaceSubmit) bgReplaceSubmit.style.display = 'inline-block';
-                };
-                reader.readAsDataURL(file);
+                bgReplacePreview.innerHTML = `<img src='${img.src}' style='max-width:180px;max-height:180px;border-radius:0.6rem;margin-top:0.7rem;'/>`;
+
+                // Show the submit button when sample image is selected
+                const bgReplaceSubmit = document.getElementById('bgReplaceSubmit');
+                if (bgReplaceSubmit) bgReplaceSubmit.style.display = 'inline-block';
             });
             suggestedBgReplaceImagesDiv.appendChild(img);
         });
@@ -752,11 +779,11 @@ document.addEventListener('DOMContentLoaded', function() {
 
     if (bgReplaceForm) bgReplaceForm.addEventListener('submit', function(e) {
         e.preventDefault();
-        if (!bgReplaceInput.files.length) return;
+        if (!hasImage(bgReplaceInput)) return;
         console.log('Background replacement form submitted');
         console.log('Selected background:', selectedBg);
         const formData = new FormData();
-        formData.append('image', bgReplaceInput.files[0]);
+        appendImage(formData, bgReplaceInput);
         formData.append('background', selectedBg);
         bgReplaceLoader.style.display = 'flex';
         bgReplaceResult.style.display = 'none';
@@ -765,6 +792,7 @@ document.addEventListener('DOMContentLoaded', function() {
             body: formData
         })
         .then(res => res.json())
+        .then(waitForJob)
         .then(data => {
             console.log('Background replacement response:', data);
             bgReplaceLoader.style.display = 'none';
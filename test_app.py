@@ -114,9 +114,15 @@ def test_discount_calculator():
     print("\nTesting Discount Calculator...")
     
     try:
+        import os
+        import tempfile
+        from models.discount_cache import DiscountCache
         from models.discount_calculator import SmartDiscountCalculator
         
         calculator = SmartDiscountCalculator()
+        # A fresh recommendation cache, so earlier runs cannot answer for Gemini
+        cache_dir = tempfile.TemporaryDirectory()
+        calculator.cache = DiscountCache(os.path.join(cache_dir.name, 'discounts.db'))
         
         # Test discount calculation
         product_data = {
@@ -173,6 +179,1455 @@ def test_location_service():
         print(f"❌ Location service test failed: {e}")
         return False
 
+def test_mask_cache():
+    """Test the two-tier BiRefNet mask cache"""
+    print("\nTesting Mask Cache...")
+    
+    try:
+        import tempfile
+        from PIL import Image
+        from models.mask_cache import MaskCache
+        
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = MaskCache(cache_dir=cache_dir, max_memory_bytes=64 * 64 * 2)
+        
+            image = Image.new('RGBA', (64, 64), (200, 30, 30, 255))
+            key = cache.make_key(image, 'birefnet-general')
+            assert key != cache.make_key(image, 'birefnet-portrait'), "Key must include model name"
+            assert key == cache.make_key(image.convert('RGB'), 'birefnet-general'), "RGB and RGBA decodes share a key"
+            assert key != cache.make_key(Image.new('RGB', (64, 64), (200, 30, 31)), 'birefnet-general')
+            assert key != cache.make_key(Image.new('RGB', (32, 128), (200, 30, 30)), 'birefnet-general')
+            assert cache.get(key) is None
+        
+            mask = Image.new('L', (64, 64), 128)
+            cache.put(key, mask)
+            assert cache.get(key)[0, 0] == 128
+        
+            # Disk tier survives a cleared memory tier
+            cache.clear(memory_only=True)
+            assert cache.get(key)[0, 0] == 128
+        
+            # Memory tier is bounded in bytes
+            for value in range(3):
+                cache.put(f"extra{value}", Image.new('L', (64, 64), value))
+        
+            stats = cache.stats()
+            assert stats['memory_hits'] == 1 and stats['disk_hits'] == 1 and stats['misses'] == 1
+            assert stats['memory_entries'] == 2
+            print(f"✅ Mask cache stats: {stats}")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Mask Cache test failed: {e}")
+        return False
+
+def test_birefnet_array_path():
+    """Test the array-native BiRefNet mask path against the PNG round-trip"""
+    print("\nTesting BiRefNet array path...")
+    
+    try:
+        import numpy as np
+        from benchmarks.synthetic import make_product_image
+        from benchmarks.stub_session import make_stub_remover
+        
+        remover = make_stub_remover()
+        img = make_product_image(320, 240).convert('RGBA')
+        
+        mask = remover.predict_mask(np.asarray(img))
+        legacy = np.asarray(remover.remove_background_advanced(img).split()[-1])
+        
+        assert mask.shape == (240, 320) and mask.dtype == np.uint8
+        diff = np.abs(mask.astype(np.int16) - legacy.astype(np.int16)).mean()
+        assert diff < 8, f"Array mask drifted from PNG path (mean abs diff {diff:.2f})"
+        print(f"✅ Array mask matches PNG path (mean abs diff {diff:.2f})")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ BiRefNet array path test failed: {e}")
+        return False
+
+def test_batch_processor():
+    """Test batched BiRefNet inference in the catalog batch pipeline"""
+    print("\nTesting Batch Processor...")
+    
+    try:
+        import io
+        import tempfile
+        import models.birefnet_bg_removal as birefnet
+        import models.mask_cache as mask_cache
+        from benchmarks.synthetic import make_product_image
+        from benchmarks.stub_session import make_stub_remover
+        from models.batch_processor import BatchProcessor, parse_operations
+        
+        birefnet._bg_remover = make_stub_remover()
+        mask_cache._mask_cache = mask_cache.MaskCache(cache_dir=None)
+        
+        def encoded(seed):
+            buf = io.BytesIO()
+            make_product_image(160, 120, seed=seed).save(buf, 'JPEG')
+            return buf.getvalue()
+        
+        with tempfile.TemporaryDirectory() as output_dir:
+            processor = BatchProcessor(output_dir, batch_size=4, workers=2)
+            items = [(f'p{i}.jpg', encoded(i)) for i in range(10)]
+            results = list(processor.process(items, parse_operations('remove,crop')))
+        
+            summary = results[-1]
+            assert summary['done'] and summary['succeeded'] == 10, summary
+            assert sorted(r['index'] for r in results[:-1]) == list(range(10))
+            # 10 images in batches of 4 -> 3 ONNX calls instead of 10
+            assert birefnet._bg_remover.session.inner_session.calls == 3
+            print(f"✅ Batch summary: {summary}")
+        
+        birefnet._bg_remover = None
+        mask_cache._mask_cache = None
+        return True
+        
+    except Exception as e:
+        print(f"❌ Batch Processor test failed: {e}")
+        return False
+
+def test_background_library():
+    """Test the precomputed background colour index"""
+    print("\nTesting Background Library...")
+    
+    try:
+        import os
+        import tempfile
+        from PIL import Image
+        from models.background_library import BackgroundLibrary
+        
+        with tempfile.TemporaryDirectory() as backgrounds_dir:
+            Image.new('RGB', (40, 30), (245, 245, 245)).save(os.path.join(backgrounds_dir, 'white.jpg'))
+            Image.new('RGB', (40, 30), (20, 20, 120)).save(os.path.join(backgrounds_dir, 'navy.jpg'))
+            library = BackgroundLibrary(backgrounds_dir, refresh_interval=0)
+        
+            # A pale yellow product contrasts most with navy
+            product = Image.new('RGB', (50, 50), (230, 220, 120))
+            assert library.pick_best(product).endswith('navy.jpg')
+        
+            first = library.get_resized('navy.jpg', (80, 60))
+            assert first.size == (80, 60) and library.get_resized('navy.jpg', (80, 60)) is first
+            assert library.path_for('missing.jpg').endswith('white.jpg')
+        
+            # Adding a file rebuilds the index on the next lookup
+            Image.new('RGB', (40, 30), (10, 10, 10)).save(os.path.join(backgrounds_dir, 'black.png'))
+            assert library.pick_best(product).endswith('black.png')
+            print(f"✅ Background library stats: {library.stats()}")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Background Library test failed: {e}")
+        return False
+
+def test_fallback_removal():
+    """Test the vectorised fallback removal against the original pixel loop"""
+    print("\nTesting vectorised fallback removal...")
+    
+    try:
+        import numpy as np
+        from PIL import Image
+        from benchmarks.bench_fallback_removal import fallback_removal_loop
+        from models.simple_bg_removal import SimpleBackgroundRemover
+        
+        rng = np.random.default_rng(7)
+        # Values clustered around the thresholds so both sides of each comparison are hit
+        pixels = rng.integers(180, 256, size=(48, 64, 4), dtype=np.uint8)
+        image = Image.fromarray(pixels, 'RGBA')
+        
+        for threshold in (200, 230):
+            remover = SimpleBackgroundRemover(white_threshold=threshold)
+            expected = np.asarray(fallback_removal_loop(image, threshold))
+            actual = np.asarray(remover._fallback_removal(image))
+            assert np.array_equal(expected, actual), f"Mismatch at threshold {threshold}"
+        
+        # RGB input gets an opaque alpha channel, like the original
+        rgb = SimpleBackgroundRemover()._fallback_removal(image.convert('RGB'))
+        assert rgb.mode == 'RGBA'
+        print("✅ Vectorised fallback matches the pixel loop")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Vectorised fallback removal test failed: {e}")
+        return False
+
+def test_job_queue():
+    """Test Photogenix jobs on the bounded job queue"""
+    print("\nTesting Job Queue...")
+    
+    try:
+        import io
+        import os
+        import tempfile
+        import threading
+        import time
+        import models.birefnet_bg_removal as birefnet
+        import models.mask_cache as mask_cache
+        from benchmarks.synthetic import make_product_image
+        from benchmarks.stub_session import make_stub_remover
+        from models.job_queue import JobQueue, QueueFullError
+        from models.photogenix_jobs import run_operation
+        
+        birefnet._bg_remover = make_stub_remover()
+        mask_cache._mask_cache = mask_cache.MaskCache(cache_dir=None)
+        
+        buf = io.BytesIO()
+        make_product_image(160, 120, seed=3).save(buf, 'JPEG')
+        
+        with tempfile.TemporaryDirectory() as output_dir:
+            queue = JobQueue(workers=1, max_pending=2, mode='thread')
+            job_id = queue.submit(run_operation, 'make_professional', buf.getvalue(), 'p.jpg',
+                                  {'preset': 'clean_studio'}, output_dir, operation='make_professional')
+            job = queue.wait(job_id, timeout=30)
+            assert job['status'] == 'done', job
+            assert os.path.exists(os.path.join(output_dir, job['result']['processed_filename']))
+        
+            # A blocked worker fills the queue; the next submit is rejected
+            release = threading.Event()
+            blocked = [queue.submit(release.wait, 30) for _ in range(2)]
+            try:
+                queue.submit(release.wait, 30)
+                assert False, "Expected QueueFullError"
+            except QueueFullError:
+                pass
+            for _ in range(200):
+                if queue.get(blocked[0])['status'] == 'running':
+                    break
+                time.sleep(0.01)
+            assert queue.get(blocked[0])['status'] == 'running'
+            assert queue.get(blocked[1])['status'] == 'queued'
+            release.set()
+            assert queue.wait(blocked[1], timeout=5)['status'] == 'done'
+        
+            stats = queue.stats()
+            assert stats['completed'] == 3 and stats['rejected'] == 1, stats
+            assert stats['run_time']['p95'] is not None
+            queue.shutdown()
+            print(f"✅ Job queue stats: {stats}")
+        
+            # Expired jobs are purged even behind an older job that is still running
+            gate = threading.Event()
+            queue = JobQueue(workers=2, mode='thread', retention_seconds=0)
+            slow = queue.submit(gate.wait, 30)
+            quick = queue.submit(time.sleep, 0)
+            assert queue.wait(quick, timeout=5)['status'] == 'done'
+            time.sleep(0.01)
+            queue.submit(time.sleep, 0)
+            assert queue.get(quick) is None and queue.get(slow) is not None
+            gate.set()
+            queue.shutdown()
+        
+        birefnet._bg_remover = None
+        mask_cache._mask_cache = None
+        return True
+        
+    except Exception as e:
+        print(f"❌ Job Queue test failed: {e}")
+        return False
+
+def test_guided_mask_upsampling():
+    """Test bounded-resolution segmentation with guided-filter mask upsampling"""
+    print("\nTesting guided mask upsampling...")
+    
+    try:
+        import numpy as np
+        from benchmarks.synthetic import make_product_image
+        from benchmarks.stub_session import make_stub_remover
+        from benchmarks.bench_mask_upsampling import bilinear_mask, mask_quality, stub_reference_mask
+        
+        remover = make_stub_remover(input_size=(128, 128))
+        pixels = np.asarray(make_product_image(640, 480, seed=5).convert('RGB'))
+        reference = stub_reference_mask(remover, pixels)
+        
+        guided = remover.predict_mask(pixels, mask_mode='guided', max_side=160)
+        assert guided.shape == pixels.shape[:2] and guided.dtype == np.uint8
+        _, guided_edge_mae = mask_quality(guided, reference)
+        _, bilinear_edge_mae = mask_quality(bilinear_mask(remover, pixels, 160), reference)
+        assert guided_edge_mae < bilinear_edge_mae, (guided_edge_mae, bilinear_edge_mae)
+        
+        try:
+            remover.predict_mask(pixels, mask_mode='nearest')
+            assert False, "Expected ValueError for unknown mask_mode"
+        except ValueError:
+            pass
+        print(f"✅ Edge error vs exact mask: guided {guided_edge_mae:.1f}, bilinear {bilinear_edge_mae:.1f}")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Guided mask upsampling test failed: {e}")
+        return False
+
+def test_recipe():
+    """Test fused Photogenix recipes (one decode, one segmentation, final outputs only)"""
+    print("\nTesting Photogenix recipe...")
+    
+    try:
+        import io
+        import os
+        import tempfile
+        import numpy as np
+        from PIL import Image
+        import models.birefnet_bg_removal as birefnet
+        import models.mask_cache as mask_cache
+        from benchmarks.synthetic import make_product_image
+        from benchmarks.stub_session import make_stub_remover
+        from PIL import ImageDraw
+        from models.photogenix_jobs import crop_resize, recipe, replace_background, run_operation
+        
+        birefnet._bg_remover = make_stub_remover()
+        mask_cache._mask_cache = mask_cache.MaskCache(cache_dir=None)
+        
+        buf = io.BytesIO()
+        make_product_image(300, 200, seed=9).save(buf, 'PNG')
+        data = buf.getvalue()
+        
+        with tempfile.TemporaryDirectory() as output_dir:
+            params = {'steps': ['replace', 'enhance', 'preset', 'crop'], 'platforms': ['amazon', 'meesho'],
+                      'background': 'white.jpg', 'preset': 'minimalist_white'}
+            result = run_operation('recipe', data, 'p.png', params, output_dir)
+            # Opaque composites are encoded as JPEG under the default 'auto' format
+            assert result['processed_filenames'] == ['recipe_amazon_p.jpg', 'recipe_meesho_p.jpg']
+            sizes = [Image.open(os.path.join(output_dir, name)).size for name in result['processed_filenames']]
+            assert sizes == [(1000, 1000), (1024, 1365)], sizes
+            # Segmented once for both platforms
+            assert birefnet._bg_remover.session.inner_session.calls == 1
+        
+        # A one-step recipe matches the standalone route's output
+        fused, _ = recipe(data, 'p.png', {'steps': ['replace']})[0]
+        single, _ = replace_background(data, 'p.png', {})
+        assert np.array_equal(np.asarray(fused), np.asarray(single))
+        # ...and its crop is crop_resize's product-centred crop
+        wide = Image.new('RGB', (800, 450), (240, 240, 240))
+        ImageDraw.Draw(wide).ellipse((620, 150, 780, 350), fill=(30, 60, 140))
+        buf = io.BytesIO()
+        wide.save(buf, 'PNG')
+        platforms = ['amazon', 'instagram']
+        fused = recipe(buf.getvalue(), 'w.png', {'steps': ['crop'], 'platforms': platforms})
+        single = crop_resize(buf.getvalue(), 'w.png', {'platforms': platforms})
+        assert [name for _, name in fused] == ['recipe_amazon_w', 'recipe_instagram_w']
+        for (fused_img, _), (single_img, _) in zip(fused, single):
+            diff = np.abs(np.asarray(fused_img.convert('RGB'), dtype=np.int16) - np.asarray(single_img))
+            assert diff.max() <= 1, diff.max()
+        assert np.asarray(fused[0][0])[555, 780, 2] == 140, "the amazon crop follows the product"
+        print("✅ Recipe produced per-platform outputs from one decode")
+        
+        birefnet._bg_remover = None
+        mask_cache._mask_cache = None
+        return True
+        
+    except Exception as e:
+        print(f"❌ Photogenix recipe test failed: {e}")
+        return False
+
+def test_upload_guard():
+    """Test in-memory upload reading and the max-pixel guard"""
+    print("\nTesting upload guard...")
+    
+    try:
+        import io
+        import struct
+        import zlib
+        from PIL import Image
+        from werkzeug.datastructures import FileStorage
+        from models.upload_guard import ImageTooLargeError, UploadRejected, open_image, read_image_upload
+        
+        buf = io.BytesIO()
+        Image.new('RGB', (64, 48), (200, 30, 30)).save(buf, 'PNG')
+        png = buf.getvalue()
+        
+        upload = FileStorage(stream=io.BytesIO(png), filename='red.png')
+        assert read_image_upload(upload, max_pixels=64 * 48) == png
+        
+        # Rewrite the IHDR to claim 100000x100000: rejected from the header alone
+        def claimed_size(width, height):
+            new_ihdr = struct.pack('>II', width, height) + png[24:29]
+            return png[:16] + new_ihdr + struct.pack('>I', zlib.crc32(b'IHDR' + new_ihdr)) + png[33:]
+        bomb = claimed_size(100000, 100000)
+        
+        # A 48 MP phone photo (8000x6000) fits the default budget
+        assert open_image(claimed_size(8000, 6000)).size == (8000, 6000)
+        try:
+            read_image_upload(FileStorage(stream=io.BytesIO(bomb), filename='bomb.png'))
+            assert False, "Expected ImageTooLargeError"
+        except ImageTooLargeError as e:
+            assert e.status_code == 413
+        
+        try:
+            open_image(b'not an image')
+            assert False, "Expected UploadRejected"
+        except UploadRejected as e:
+            assert e.status_code == 400
+        print("✅ Oversized and unreadable uploads rejected before decode")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Upload guard test failed: {e}")
+        return False
+
+def test_output_encoder():
+    """Test output format negotiation and encoding"""
+    print("\nTesting output encoder...")
+    
+    try:
+        import io
+        from PIL import Image
+        from benchmarks.synthetic import make_product_image
+        from models.output_encoder import OUTPUT_FORMATS, accepted_formats, encode_image, output_options
+        
+        # Only formats this Pillow build can write are offered (AVIF needs Pillow 11.2+)
+        assert all(spec[0] in Image.SAVE for spec in OUTPUT_FORMATS.values())
+        writable = [name for name in ('avif', 'webp') if name in OUTPUT_FORMATS]
+        assert accepted_formats('image/avif,image/webp;q=0.9,image/png;q=0,*/*;q=0.8') == writable
+        assert accepted_formats('*/*') == []
+        
+        opaque = make_product_image(400, 300, seed=2).convert('RGBA')
+        cutout = opaque.copy()
+        cutout.putalpha(0)
+        
+        # auto: JPEG unless alpha is needed, modern formats only when the client asks for them
+        assert encode_image(opaque, output_options('auto'))['format'] == 'jpeg'
+        assert encode_image(cutout, output_options('auto'))['format'] == 'png'
+        assert encode_image(cutout, output_options('auto', accept_header='image/webp,*/*'))['format'] == 'webp'
+        
+        png = encode_image(opaque, output_options('png', png_compress_level=9))
+        webp = encode_image(opaque, output_options('webp', quality=80))
+        assert webp['bytes'] < png['bytes'] and webp['mimetype'] == 'image/webp'
+        
+        # JPEG of a transparent image is flattened onto white
+        jpeg = encode_image(cutout, output_options('jpg'))
+        assert Image.open(io.BytesIO(jpeg['data'])).getpixel((0, 0)) == (255, 255, 255)
+        
+        for bad in ({'fmt': 'gif'}, {'quality': 0}, {'png_compress_level': 10}):
+            try:
+                output_options(**bad)
+                assert False, f"Expected ValueError for {bad}"
+            except ValueError:
+                pass
+        print(f"✅ PNG {png['bytes']} bytes vs WebP {webp['bytes']} bytes ({webp['encode_ms']} ms)")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Output encoder test failed: {e}")
+        return False
+
+def test_asset_store():
+    """Test content-addressed outputs and batch reuse"""
+    print("\nTesting asset store...")
+    
+    try:
+        import io
+        import os
+        import tempfile
+        import models.birefnet_bg_removal as birefnet
+        import models.mask_cache as mask_cache
+        from benchmarks.synthetic import make_product_image
+        from benchmarks.stub_session import make_stub_remover
+        from models.asset_store import AssetStore
+        from models.batch_processor import BatchProcessor, parse_operations
+        from models.output_encoder import output_options
+        from models.photogenix_jobs import run_stored_operation
+        
+        birefnet._bg_remover = make_stub_remover()
+        mask_cache._mask_cache = mask_cache.MaskCache(cache_dir=None)
+        
+        buf = io.BytesIO()
+        make_product_image(160, 120, seed=4).save(buf, 'JPEG')
+        data = buf.getvalue()
+        
+        with tempfile.TemporaryDirectory() as output_dir:
+            store = AssetStore(output_dir)
+            params = {'output': output_options('webp', accept_header='image/avif')}
+            key = store.make_key(data, 'enhance', params)
+            assert store.is_key(key)
+            # Accept only matters for format=auto; any parameter change is a new asset
+            assert key == store.make_key(data, 'enhance', {'output': output_options('webp')})
+            assert key != store.make_key(data, 'enhance', {'output': output_options('webp', quality=80)})
+            assert key != store.make_key(data + b'\0', 'enhance', params)
+        
+            assert store.lookup(key) is None
+            result = run_stored_operation('enhance', data, 'shoe.jpg', params, output_dir, key)
+            assert result['processed_filename'] == f'{key}/enhanced_shoe.webp'
+            assert os.path.exists(os.path.join(output_dir, result['processed_filename']))
+            assert store.lookup(key)['processed_filenames'] == result['processed_filenames']
+        
+            # A repeated batch item is answered from the store without segmentation
+            processor = BatchProcessor(output_dir, batch_size=4, workers=2, asset_store=store)
+            items = [('a.jpg', data)]
+            first = list(processor.process(items, parse_operations('remove')))
+            calls = birefnet._bg_remover.session.inner_session.calls
+            second = list(processor.process(items, parse_operations('remove')))
+            assert second[-1]['asset_hits'] == 1 and first[-1]['asset_hits'] == 0
+            assert second[0]['processed_filename'] == first[0]['processed_filename'] and second[0]['cached']
+            assert birefnet._bg_remover.session.inner_session.calls == calls
+            print(f"✅ Stored {result['processed_filename']}")
+        
+        birefnet._bg_remover = None
+        mask_cache._mask_cache = None
+        return True
+        
+    except Exception as e:
+        print(f"❌ Asset store test failed: {e}")
+        return False
+
+def test_onnx_session():
+    """Test explicit ONNX Runtime settings, optimised graph caching and warm-up"""
+    print("\nTesting ONNX session setup...")
+    
+    try:
+        import os
+        import tempfile
+        import onnxruntime
+        from onnxruntime.datasets import get_example
+        from rembg.sessions.birefnet_general import BiRefNetSessionGeneral
+        from benchmarks.stub_session import make_stub_remover
+        from models.onnx_session import load_session, session_settings
+        
+        original = BiRefNetSessionGeneral.__dict__['download_models']
+        # A tiny bundled graph stands in for the BiRefNet download
+        BiRefNetSessionGeneral.download_models = classmethod(lambda cls, *a, **k: get_example('sigmoid.onnx'))
+        try:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                settings = session_settings(intra_op_threads=1, inter_op_threads=1, optimized_model_dir=cache_dir)
+                session, info = load_session('birefnet-general', settings)
+                assert not info['loaded_optimized'] and os.path.exists(info['optimized_model_path'])
+                assert session.inner_session.get_session_options().intra_op_num_threads == 1
+        
+                # The next worker start reads the serialised optimised graph
+                session, info = load_session('birefnet-general', settings)
+                assert info['loaded_optimized']
+                assert session.__class__.__name__ == 'BiRefNetSessionGeneral'
+                assert session.inner_session.get_session_options().graph_optimization_level == \
+                    onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+                print(f"✅ Cached optimised graph loaded in {info['load_ms']} ms")
+        finally:
+            BiRefNetSessionGeneral.download_models = original
+        
+        try:
+            session_settings(graph_optimization='maximum')
+            assert False, "Expected ValueError for an unknown optimisation level"
+        except ValueError:
+            pass
+        
+        remover = make_stub_remover()
+        assert remover.status()['warmup_ms'] is None
+        remover.warmup()
+        assert remover.session.inner_session.calls == 1 and remover.status()['warmup_ms'] >= 0
+        print(f"✅ Warm-up took {remover.warmup_ms} ms")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ ONNX session setup test failed: {e}")
+        return False
+
+def test_quantized_model():
+    """Test INT8 model selection and the precision comparison harness"""
+    print("\nTesting INT8 model selection...")
+    
+    try:
+        import shutil
+        import tempfile
+        from onnxruntime.datasets import get_example
+        import models.onnx_session as onnx_session
+        from benchmarks.bench_int8_birefnet import compare_precisions
+        from benchmarks.bench_mask_upsampling import load_samples
+        from benchmarks.stub_session import make_stub_remover
+        from models.birefnet_bg_removal import mask_cache_tag
+        
+        original_dir = onnx_session.QUANTIZED_MODEL_DIR
+        with tempfile.TemporaryDirectory() as model_dir:
+            onnx_session.QUANTIZED_MODEL_DIR = model_dir
+            settings = onnx_session.session_settings(optimized_model_dir=None)
+            try:
+                try:
+                    onnx_session.load_session('birefnet-general', settings, precision='int8')
+                    assert False, "Expected FileNotFoundError without a quantised copy"
+                except FileNotFoundError:
+                    pass
+                # Any graph at the quantised path is what the int8 remover loads
+                shutil.copy(get_example('sigmoid.onnx'), onnx_session.quantized_model_path('birefnet-general'))
+                assert onnx_session.quantized_model_available('birefnet-general')
+                session, info = onnx_session.load_session('birefnet-general', settings, precision='int8')
+                assert info['precision'] == 'int8'
+                assert session.inner_session.get_inputs()[0].name == 'x'
+            finally:
+                onnx_session.QUANTIZED_MODEL_DIR = original_dir
+        
+        # INT8 masks never share mask cache entries with fp32 ones
+        assert mask_cache_tag('birefnet-general', 'full', 'int8') != mask_cache_tag('birefnet-general')
+        
+        # A lower-resolution stub stands in for the cheaper model
+        results = compare_precisions(make_stub_remover(), make_stub_remover(input_size=(512, 512)),
+                                     load_samples(limit=2), repeat=1)
+        summary = results['summary']
+        assert summary['images'] == 2 and summary['mean_iou'] > 0.9, summary
+        print(f"✅ Harness: IoU {summary['mean_iou']}, speedup {summary['speedup']}x")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ INT8 model selection test failed: {e}")
+        return False
+
+def test_tiled_processing():
+    """Test strip-wise compositing and enhancement: same pixels, bounded peak memory"""
+    print("\nTesting tiled processing...")
+    
+    try:
+        import numpy as np
+        from PIL import Image, ImageDraw
+        from models.photogenix_ops import apply_preset, composite_product, enhance_image, load_background
+        from models.tiled_ops import composite_product_tiled, enhance_image_tiled
+        
+        def product(width, height):
+            img = Image.new('RGB', (width, height), (205, 190, 170))
+            mask = Image.new('L', (width, height), 0)
+            box = (width // 6, height // 6, width * 5 // 6, height * 5 // 6)
+            ImageDraw.Draw(img).ellipse(box, fill=(40, 70, 120))
+            ImageDraw.Draw(mask).ellipse(box, fill=255)
+            return img, mask
+        
+        img, mask = product(900, 700)
+        reference = apply_preset(composite_product(img.convert('RGBA'), mask, load_background('white.jpg', img.size)),
+                                 'minimalist_white')
+        tiled = composite_product_tiled(img, mask, 'white.jpg', preset='minimalist_white', strip_rows=64)
+        assert np.array_equal(np.asarray(reference), np.asarray(tiled))
+        # Every preset gives the same image mode whether or not the image is tiled
+        for preset in (None, 'clean_studio', 'minimalist_white', 'luxury_matte'):
+            whole = composite_product(img.convert('RGBA'), mask, load_background('white.jpg', img.size))
+            whole = apply_preset(whole, preset) if preset else whole
+            strips = composite_product_tiled(img, mask, 'white.jpg', preset=preset, strip_rows=64)
+            assert strips.mode == whole.mode, (preset, strips.mode, whole.mode)
+            if preset == 'luxury_matte':
+                assert np.array_equal(np.asarray(whole), np.asarray(strips))
+        rgba = img.convert('RGBA')
+        assert np.array_equal(np.asarray(enhance_image(rgba)), np.asarray(enhance_image_tiled(rgba, strip_rows=64)))
+        
+        # Remove-then-replace on a tiled photo segments once, although the two decodes
+        # differ (RGBA for the cutout, RGB for the tiled composite)
+        import io
+        import models.birefnet_bg_removal as birefnet
+        import models.mask_cache as mask_cache
+        import models.tiled_ops as tiled_ops
+        from benchmarks.stub_session import make_stub_remover
+        from models.photogenix_jobs import background_removal, replace_background
+        
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG')
+        birefnet._bg_remover = make_stub_remover()
+        mask_cache._mask_cache = mask_cache.MaskCache(cache_dir=None)
+        original_min_pixels = tiled_ops.TILED_MIN_PIXELS
+        tiled_ops.TILED_MIN_PIXELS = 0
+        try:
+            background_removal(buf.getvalue(), 'p.jpg', {})
+            replace_background(buf.getvalue(), 'p.jpg', {})
+            assert birefnet._bg_remover.session.inner_session.calls == 1
+            assert mask_cache._mask_cache.stats()['misses'] == 1
+        finally:
+            tiled_ops.TILED_MIN_PIXELS = original_min_pixels
+            birefnet._bg_remover = None
+            mask_cache._mask_cache = None
+        
+        def vm(field):
+            with open('/proc/self/status') as f:
+                for line in f:
+                    if line.startswith(field):
+                        return int(line.split()[1]) * 1024
+        
+        def peak_extra(func):
+            """Peak resident memory above the current level while func runs."""
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')  # Reset the peak (VmHWM) to the current RSS
+            base = vm('VmRSS:')
+            result = func()
+            del result
+            return vm('VmHWM:') - base
+        
+        try:
+            peak_extra(lambda: None)
+        except (OSError, TypeError):
+            print("⚠️ Peak RSS cannot be reset on this platform; skipping the memory ceiling")
+            return True
+        
+        # 12 MP: the only full-size allocation allowed is the output itself
+        img, mask = product(3000, 4000)
+        ceiling = 64 * 1024 * 1024
+        composite_peak = peak_extra(lambda: composite_product_tiled(img, mask, 'white.jpg', preset='minimalist_white'))
+        enhance_peak = peak_extra(lambda: enhance_image_tiled(img))
+        whole_peak = peak_extra(lambda: composite_product(img.convert('RGBA'), mask,
+                                                          load_background('white.jpg', img.size)))
+        assert composite_peak <= img.width * img.height * 4 + ceiling, composite_peak
+        assert enhance_peak <= img.width * img.height * 3 + ceiling, enhance_peak
+        assert whole_peak > img.width * img.height * 4 + ceiling, whole_peak
+        print(f"✅ 12 MP composite peak {composite_peak / 1e6:.0f} MB tiled vs {whole_peak / 1e6:.0f} MB whole-image; "
+              f"enhance {enhance_peak / 1e6:.0f} MB")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Tiled processing test failed: {e}")
+        return False
+
+def test_segmentation_cascade():
+    """Test the threshold-first segmentation cascade and its tier log"""
+    print("\nTesting segmentation cascade...")
+    
+    try:
+        import io
+        import json
+        import os
+        import tempfile
+        import numpy as np
+        from PIL import Image, ImageDraw
+        import models.birefnet_bg_removal as birefnet
+        import models.mask_cache as mask_cache
+        import models.segmentation_cascade as cascade
+        from models.simple_bg_removal import score_mask
+        from benchmarks.synthetic import make_product_image
+        from benchmarks.stub_session import make_stub_remover
+        from models.batch_processor import BatchProcessor, parse_operations
+        
+        birefnet._bg_remover = make_stub_remover()
+        mask_cache._mask_cache = mask_cache.MaskCache(cache_dir=None)
+        sweep = make_product_image(320, 240, seed=1)
+        cluttered = Image.open(os.path.join('static', 'img', 'c.jpg')).convert('RGB')
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            log_path = os.path.join(tmp, 'tiers.jsonl')
+            mask, info = cascade.cascade_mask(np.asarray(sweep), log_path=log_path)
+            assert info['tier'] == 'threshold' and 'birefnet_ms' not in info, info
+            assert mask.shape == (240, 320)
+            assert birefnet._bg_remover.session.inner_session.calls == 0
+        
+            mask, info = cascade.cascade_mask(np.asarray(cluttered), log_path=log_path)
+            assert info['tier'] == 'birefnet' and 'threshold_iou' in info, info
+            assert mask.shape == (cluttered.height, cluttered.width)
+            assert birefnet._bg_remover.session.inner_session.calls == 1
+        
+            with open(log_path) as f:
+                logged = [json.loads(line) for line in f]
+            assert [entry['tier'] for entry in logged] == ['threshold', 'birefnet']
+            assert all('confidence' in entry and 'threshold_ms' in entry for entry in logged)
+        
+            # White product on a white sweep: only its grey seam is thresholded, and the
+            # hollow outline must not pass for a solid cutout
+            white = Image.new('RGB', (320, 240), (250, 250, 250))
+            ImageDraw.Draw(white).ellipse((100, 50, 220, 190), fill=(252, 252, 252), outline=(150, 150, 150), width=8)
+            ring, info = cascade.threshold_tier(np.asarray(white))
+            assert info['tier'] == 'birefnet' and info['compactness'] < 0.6, info
+            solid = np.zeros_like(ring)
+            solid[50:190, 100:220] = 255
+            assert score_mask(np.asarray(white), solid)['compactness'] > 0.95
+        
+            # Batch pipeline: confident images skip the batched BiRefNet call entirely
+            cascade.SEGMENTATION_LOG = log_path
+            def encoded(img):
+                buf = io.BytesIO()
+                img.save(buf, 'PNG')
+                return buf.getvalue()
+            items = [('a.png', encoded(sweep)), ('b.png', encoded(make_product_image(320, 240, seed=2))),
+                     ('c.png', encoded(cluttered.resize((320, 426))))]
+            processor = BatchProcessor(tmp, batch_size=4, workers=2)
+            results = list(processor.process(items, parse_operations('remove'), segmentation='cascade'))
+            summary = results[-1]
+            assert summary['succeeded'] == 3, summary
+            assert summary['segmentation_tiers'] == {'threshold': 2, 'birefnet': 1}, summary
+            assert {r['index']: r['segmentation_tier'] for r in results[:-1]}[2] == 'birefnet'
+            assert birefnet._bg_remover.session.inner_session.calls == 2
+            print(f"✅ Cascade tiers: {summary['segmentation_tiers']}")
+        
+        cascade.SEGMENTATION_LOG = os.path.join('logs', 'segmentation_tiers.jsonl')
+        birefnet._bg_remover = None
+        mask_cache._mask_cache = None
+        return True
+        
+    except Exception as e:
+        print(f"❌ Segmentation cascade test failed: {e}")
+        return False
+
+def test_simple_auto_selection():
+    """Test parallel downscaled method selection in SimpleBackgroundRemover"""
+    print("\nTesting simple remover auto selection...")
+    
+    try:
+        import numpy as np
+        from benchmarks.synthetic import make_product_image
+        from models.simple_bg_removal import SimpleBackgroundRemover
+        
+        remover = SimpleBackgroundRemover()
+        image = make_product_image(480, 360, seed=3)
+        pixels = np.asarray(image)
+        mask, report = remover.auto_mask(pixels, max_side=160)
+        assert mask.shape == (360, 480) and report['work_size'] == [160, 120]
+        assert set(report['methods']) == {'grabcut', 'watershed', 'threshold'}
+        assert all('ms' in scores and 'confidence' in scores for scores in report['methods'].values())
+        assert report['method'] in report['methods']
+        # Plain backdrop: the refined winner matches the full-resolution threshold mask
+        reference = remover.smart_threshold_mask(pixels) >= 128
+        iou = np.logical_and(mask >= 128, reference).sum() / np.logical_or(mask >= 128, reference).sum()
+        assert iou > 0.95, iou
+        
+        # A failing method is skipped; when all fail the near-white fallback is used
+        def broken(image_array):
+            raise RuntimeError("broken")
+        remover.watershed_mask = broken
+        _, report = remover.auto_mask(pixels, max_side=160)
+        assert 'error' in report['methods']['watershed'] and report['method'] != 'watershed'
+        remover.grabcut_mask = remover.smart_threshold_mask = broken
+        result = remover.remove_background(image, method='auto')
+        assert result.mode == 'RGBA' and result.size == image.size
+        timings = ', '.join(f"{name} {scores.get('ms')} ms" for name, scores in report['methods'].items())
+        print(f"✅ Auto picked {report['method']} in {report['total_ms']} ms ({timings})")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Simple remover auto selection test failed: {e}")
+        return False
+
+def test_tone_pipeline():
+    """Test the fused brightness/contrast/colour pipeline against chained ImageEnhance"""
+    print("\nTesting tone pipeline...")
+    
+    try:
+        import numpy as np
+        from PIL import Image, ImageEnhance
+        from benchmarks.synthetic import make_product_image
+        from models.tone_pipeline import apply_tone, contrast_mean, luma_total
+        
+        def chained(img, brightness, contrast, color):
+            img = ImageEnhance.Brightness(img).enhance(brightness)
+            img = ImageEnhance.Contrast(img).enhance(contrast)
+            return ImageEnhance.Color(img).enhance(color)
+        
+        rng = np.random.default_rng(5)
+        noisy = Image.fromarray(rng.integers(0, 256, size=(90, 120, 3), dtype=np.uint8))
+        samples = [make_product_image(320, 240, seed=4), noisy, Image.open('static/img/c.jpg').convert('RGB')]
+        # A cutout with soft, semi-transparent edges: alpha must come through untouched
+        cutout = samples[0].convert('RGBA')
+        cutout.putalpha(Image.fromarray(rng.integers(0, 256, size=(240, 320), dtype=np.uint8)))
+        # enhance_image, composite_product and the minimalist_white preset
+        for factors in [(1.25, 1.35, 1.35), (1.08, 1.12, 1.15), (1.15, 1.0, 1.05)]:
+            toned = apply_tone(cutout, *factors)
+            assert np.array_equal(np.asarray(toned)[:, :, 3], np.asarray(cutout)[:, :, 3]), factors
+            assert np.abs(np.asarray(chained(cutout, *factors), dtype=np.int16) - np.asarray(toned)).max() <= 1
+            for img in samples:
+                for mode in ('RGB', 'RGBA'):
+                    source = img.convert(mode)
+                    expected = np.asarray(chained(source, *factors), dtype=np.int16)
+                    actual = np.asarray(apply_tone(source, *factors), dtype=np.int16)
+                    assert actual.shape == expected.shape
+                    diff = np.abs(expected - actual)
+                    assert diff.max() <= 1, (factors, mode, diff.max())
+                    assert diff.mean() < 0.5, (factors, mode, diff.mean())
+        
+        # Strip sums give the same contrast pivot as the whole image
+        pixels = np.asarray(samples[2])
+        strips = sum(luma_total(pixels[top:top + 100], 1.25) for top in range(0, pixels.shape[0], 100))
+        assert strips == luma_total(pixels, 1.25)
+        assert contrast_mean(strips, pixels.shape[0] * pixels.shape[1]) == int(
+            np.asarray(ImageEnhance.Brightness(samples[2]).enhance(1.25).convert('L'), dtype=np.float64).mean() + 0.5)
+        print("✅ Tone pipeline within one level of chained ImageEnhance")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Tone pipeline test failed: {e}")
+        return False
+
+def test_multi_platform_crop():
+    """Test one-decode multi-platform crop_resize centred on the product"""
+    print("\nTesting multi-platform crop...")
+    
+    try:
+        import io
+        import tempfile
+        import numpy as np
+        from PIL import Image, ImageDraw
+        import models.birefnet_bg_removal as birefnet
+        import models.mask_cache as mask_cache
+        from benchmarks.stub_session import make_stub_remover
+        from models.photogenix_jobs import background_removal, crop_resize, run_operation
+        from models.photogenix_ops import (
+            PLATFORM_SIZES, crop_box, crop_to_platform, crop_to_platforms, product_box,
+        )
+        
+        # Wide shot with the product near the right edge
+        img = Image.new('RGB', (1600, 900), (240, 240, 240))
+        mask = Image.new('L', img.size, 0)
+        ImageDraw.Draw(img).ellipse((1250, 300, 1550, 700), fill=(30, 60, 140))
+        ImageDraw.Draw(mask).ellipse((1250, 300, 1550, 700), fill=255)
+        focus = product_box(mask)
+        assert focus == (1250, 300, 1551, 701), focus
+        
+        left, top, right, bottom = crop_box(img.size, PLATFORM_SIZES['amazon'], focus)
+        assert (right - left, bottom - top) == (900, 900) and right == 1600  # Shifted to the product, kept inside
+        assert crop_box(img.size, PLATFORM_SIZES['amazon']) == (350, 0, 1250, 900)
+        
+        platforms = ['meesho', 'amazon', 'shopify', 'instagram']
+        outputs = crop_to_platforms(img, platforms)
+        assert list(outputs) == platforms
+        for platform, out in outputs.items():
+            assert out.size == PLATFORM_SIZES[platform]
+            # The shared pyramid resamples like a direct crop and resize
+            diff = np.abs(np.asarray(out, dtype=np.int16) - np.asarray(crop_to_platform(img, platform)))
+            assert diff.mean() < 1.5, (platform, diff.mean())
+        centred = crop_to_platforms(img, ['amazon'], focus)['amazon']
+        assert np.asarray(centred)[500, 700, 2] == 140  # Product in the middle of the crop
+        
+        # Through the job runner: one decode, one segmentation, every platform labelled
+        birefnet._bg_remover = make_stub_remover()
+        mask_cache._mask_cache = mask_cache.MaskCache(cache_dir=None)
+        buf = io.BytesIO()
+        img.save(buf, 'PNG')
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = run_operation('crop_resize', buf.getvalue(), 'wide.png',
+                                   {'platforms': platforms, 'crop_focus': 'product', 'output': None}, output_dir)
+            assert result['platforms'] == platforms
+            assert [name.split('_')[1] for name in result['processed_filenames']] == ['meesho', 'amazon', 'shopify',
+                                                                                       'instagram']
+            assert birefnet._bg_remover.session.inner_session.calls == 1
+        
+            # Remove then crop on one JPEG: the RGBA cutout and the RGB crop share the cached mask
+            jpeg = io.BytesIO()
+            img.save(jpeg, 'JPEG')
+            background_removal(jpeg.getvalue(), 'wide.jpg', {})
+            crop_resize(jpeg.getvalue(), 'wide.jpg', {'platforms': ['amazon'], 'crop_focus': 'product'})
+            assert birefnet._bg_remover.session.inner_session.calls == 2
+        print(f"✅ {len(platforms)} platform crops from one decode")
+        
+        birefnet._bg_remover = None
+        mask_cache._mask_cache = None
+        return True
+        
+    except Exception as e:
+        print(f"❌ Multi-platform crop test failed: {e}")
+        return False
+
+def test_pipeline_benchmark():
+    """Test the per-stage /process/* benchmark with the offline stub model"""
+    print("\nTesting pipeline benchmark...")
+    
+    try:
+        import json
+        import tempfile
+        import models.birefnet_bg_removal as birefnet
+        import models.mask_cache as mask_cache
+        import models.photogenix_ops as ops
+        from benchmarks.bench_pipeline import compare, load_app, run_benchmark
+        
+        composite_product = ops.composite_product
+        with tempfile.TemporaryDirectory() as workdir:
+            app_module = load_app(workdir, stub=True)
+            try:
+                results = run_benchmark(app_module, [0.1], ['replace_background', 'batch'], repeat=2, warmup=0,
+                                        batch_images=2)
+            finally:
+                app_module.job_queue.shutdown()
+        
+        # The originals are back once the run is over
+        assert ops.composite_product is composite_product
+        single, batch = results
+        for stage in ('upload', 'decode', 'preprocess', 'birefnet', 'mask_resize', 'composite', 'shadow_blur',
+                      'encode', 'other'):
+            assert stage in single['stages'], stage
+            assert 0 <= single['stages'][stage]['p50'] <= single['stages'][stage]['p95']
+        assert single['stages']['shadow_blur']['calls'] == 1 and 'enhance' not in single['stages']
+        assert single['latency_ms']['p50'] >= sum(stats['p50'] for stats in single['stages'].values()) * 0.5
+        assert batch['stages']['birefnet']['calls'] == 1 and batch['stages']['encode']['calls'] == 2
+        cache_stats = mask_cache.get_mask_cache().stats()
+        assert cache_stats['memory_hits'] + cache_stats['disk_hits'] == 0  # Every upload was new
+        
+        baseline = json.loads(json.dumps({'meta': {}, 'results': results}))
+        assert [row[:2] for row in compare(results, baseline)] == [('replace_background', 0.1), ('batch', 0.1)]
+        print(f"✅ replace_background p50 {single['latency_ms']['p50']} ms over {len(single['stages'])} stages")
+        
+        birefnet._bg_remover = None
+        mask_cache._mask_cache = None
+        return True
+        
+    except Exception as e:
+        print(f"❌ Pipeline benchmark test failed: {e}")
+        return False
+
+def test_request_timing():
+    """Test the span recorder behind the Server-Timing header"""
+    print("\nTesting request timing...")
+    
+    try:
+        import io
+        import json
+        import os
+        import tempfile
+        import models.birefnet_bg_removal as birefnet
+        import models.mask_cache as mask_cache
+        from benchmarks.synthetic import make_product_image
+        from benchmarks.stub_session import make_stub_remover
+        from models.photogenix_jobs import run_operation
+        from models.request_timing import add_spans, record_timing, recording, span
+        
+        # Nothing recording: span() is a shared no-op
+        assert span('decode') is span('encode')
+        with span('decode'):
+            pass
+        
+        with recording() as recorder:
+            for _ in range(2):
+                with span('crop'):
+                    pass
+            add_spans({'queue': 12.5})
+            with recording() as inner:
+                with span('encode'):
+                    pass
+        assert list(recorder.spans) == ['crop', 'queue'] and list(inner.spans) == ['encode']
+        assert recorder.spans['queue'] == 12.5
+        header = recorder.header()
+        assert header.startswith('crop;dur=') and ', queue;dur=12.5, total;dur=' in header, header
+        
+        # Job results carry their stage timings back to the request
+        birefnet._bg_remover = make_stub_remover()
+        mask_cache._mask_cache = mask_cache.MaskCache(cache_dir=None)
+        buf = io.BytesIO()
+        make_product_image(320, 240).save(buf, 'PNG')
+        with tempfile.TemporaryDirectory() as tmp:
+            result = run_operation('make_professional', buf.getvalue(), 'shot.png', {'output': None}, tmp)
+            assert list(result['timings']) == ['decode', 'birefnet', 'pick_background', 'composite', 'encode']
+            assert all(ms >= 0 for ms in result['timings'].values())
+        
+            log_path = os.path.join(tmp, 'logs', 'timing.jsonl')
+            record_timing({'path': '/process/make_professional', 'spans': result['timings']}, log_path)
+            with open(log_path) as f:
+                assert json.loads(f.readline())['spans'] == result['timings']
+        print(f"✅ Job stages timed: {result['timings']}")
+        
+        birefnet._bg_remover = None
+        mask_cache._mask_cache = None
+        return True
+        
+    except Exception as e:
+        print(f"❌ Request timing test failed: {e}")
+        return False
+
+def test_asset_references():
+    """Test reading server-side assets named by URL instead of re-uploaded"""
+    print("\nTesting asset references...")
+    
+    try:
+        import io
+        import os
+        import tempfile
+        from PIL import Image
+        from models.upload_guard import AssetNotFound, ImageTooLargeError, asset_path, read_asset
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            processed = os.path.join(tmp, 'processed')
+            samples = os.path.join(tmp, 'samples')
+            os.makedirs(os.path.join(processed, 'ab' * 16))
+            os.makedirs(samples)
+            Image.new('RGB', (64, 48), (200, 30, 30)).save(os.path.join(processed, 'ab' * 16, 'enhanced_shot.png'))
+            Image.new('RGB', (640, 480)).save(os.path.join(samples, 'sample one.jpg'))
+            with open(os.path.join(tmp, 'secret.txt'), 'w') as f:
+                f.write('not served')
+            roots = {'/processed': processed, '/static/img': samples}
+        
+            filename, data = read_asset(f"/processed/{'ab' * 16}/enhanced_shot.png", roots)
+            assert filename == 'enhanced_shot.png' and Image.open(io.BytesIO(data)).size == (64, 48)
+            # The URL the browser already shows, full or percent-encoded
+            assert asset_path('http://localhost:5000/static/img/sample%20one.jpg', roots) == os.path.realpath(
+                os.path.join(samples, 'sample one.jpg'))
+        
+            for ref in ('/static/img/missing.jpg', '/static/img/../secret.txt', '/processed/../secret.txt',
+                        '/elsewhere/secret.txt', '', f'/processed/{"ab" * 16}'):
+                try:
+                    asset_path(ref, roots)
+                    assert False, f'{ref!r} should not resolve'
+                except AssetNotFound as e:
+                    assert e.status_code == 404
+            try:
+                read_asset('/static/img/sample%20one.jpg', roots, max_pixels=1000)
+                assert False, 'pixel budget should apply to assets'
+            except ImageTooLargeError:
+                pass
+        print("✅ Asset references resolve inside their folders only")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Asset references test failed: {e}")
+        return False
+
+def test_creative_cache():
+    """Test the photo-signature cache and image bounding for creative content"""
+    print("\nTesting creative content cache...")
+    
+    try:
+        import io
+        import numpy as np
+        from PIL import Image, ImageDraw
+        from benchmarks.synthetic import make_product_image
+        from models.creative_cache import CreativeCache, colour_distance, hash_distance, image_signature, model_image
+        
+        def product(seed):
+            rng = np.random.default_rng(seed)
+            img = Image.new('RGB', (1600, 1200), tuple(int(c) for c in rng.integers(150, 255, 3)))
+            draw = ImageDraw.Draw(img)
+            for _ in range(6):
+                x, y = rng.integers(0, 1400), rng.integers(0, 1000)
+                draw.ellipse([x, y, x + 200, y + 200], fill=tuple(int(c) for c in rng.integers(0, 150, 3)))
+            return img
+        
+        def recompressed(img, size, quality):
+            buf = io.BytesIO()
+            img.resize(size, Image.LANCZOS).save(buf, 'JPEG', quality=quality)
+            return Image.open(io.BytesIO(buf.getvalue()))
+        
+        def shirt(colour):
+            img = Image.new('RGB', (1200, 1600), (250, 250, 250))
+            ImageDraw.Draw(img).polygon([(300, 300), (900, 300), (1050, 600), (900, 650), (900, 1400),
+                                         (300, 1400), (300, 650), (150, 600)], fill=colour)
+            return img
+        
+        shot, other = product(1), product(2)
+        signature = image_signature(shot)
+        copy = image_signature(recompressed(shot, shot.size, 75))
+        assert hash_distance(signature[0], copy[0]) <= 1 and colour_distance(signature[1], copy[1]) <= 8
+        
+        now = [0.0]
+        cache = CreativeCache(max_entries=2, ttl_seconds=60, clock=lambda: now[0])
+        answer = {'title': 'Shot'}
+        assert cache.get(signature, 1) is None
+        cache.put(signature, 1, answer)
+        assert cache.get(signature, 1) == answer
+        assert cache.get(copy, 1) == answer, "a recompressed copy shares the answer"
+        assert cache.get((signature[0] ^ 0b1, signature[1]), 1) == answer
+        assert cache.get((signature[0] ^ 0b101, signature[1]), 1) is None
+        assert cache.get(image_signature(other), 1) is None
+        assert cache.get(signature, 2) is None, "a new prompt version must not reuse old answers"
+        
+        # Same layout in another colour: the hash alone cannot tell them apart, the colours can
+        red, blue = image_signature(shirt((200, 30, 30))), image_signature(shirt((30, 40, 200)))
+        cache.put(red, 1, {'title': 'Red Shirt'})
+        assert hash_distance(red[0], blue[0]) <= 1 and cache.get(blue, 1) is None
+        
+        # Least recently used goes first, and answers expire after the TTL
+        cache.put(blue, 1, {'title': 'Blue Shirt'})
+        assert cache.get(signature, 1) is None and cache.stats()['evictions'] == 1
+        now[0] = 61
+        assert cache.get(red, 1) is None and cache.stats()['entries'] == 0
+        
+        stats = cache.stats()
+        assert stats['hits'] == 3 and stats['near_hits'] == 2 and stats['misses'] == 7
+        assert stats['expirations'] == 2
+        
+        photo = make_product_image(1600, 1200, seed=3).convert('RGB')
+        buf = io.BytesIO()
+        photo.save(buf, 'JPEG', quality=95)
+        data = model_image(photo)
+        sent = Image.open(io.BytesIO(data))
+        assert sent.format == 'JPEG' and max(sent.size) == 768 and sent.size == (768, 576)
+        assert len(data) < len(buf.getvalue())
+        cache.note_sent(len(data), len(buf.getvalue()))
+        assert cache.stats()['bytes_per_request'] == len(data)
+        print(f"✅ Near-duplicate photos share an answer; Gemini gets {len(data) // 1024} KB instead of {len(buf.getvalue()) // 1024} KB")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Creative content cache test failed: {e}")
+        return False
+
+def test_llm_gateway():
+    """Test deadlines, concurrency limit, coalescing and circuit breaker of the LLM gateway"""
+    print("\nTesting LLM gateway...")
+    
+    try:
+        import threading
+        import time
+        from models.discount_calculator import SmartDiscountCalculator
+        from models.llm_gateway import LLMGateway, LLMTimeout, LLMUnavailable, StubBackend
+        
+        # Identical concurrent prompts share one call
+        backend = StubBackend(lambda model, parts: 'answer', latency=0.2)
+        gateway = LLMGateway(backend, concurrency=2, timeout=2)
+        answers = []
+        threads = [threading.Thread(target=lambda: answers.append(gateway.generate('same prompt'))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert answers == ['answer'] * 5 and len(backend.calls) == 1 and gateway.stats()['coalesced'] == 4
+        
+        # At most `concurrency` calls are in flight
+        active, peak, lock = [0], [0], threading.Lock()
+        def counting(model, parts):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return parts
+        gateway = LLMGateway(StubBackend(counting), concurrency=2, timeout=2)
+        futures = [gateway.submit(f'prompt {i}') for i in range(6)]
+        assert [f.result() for f in futures] == [f'prompt {i}' for i in range(6)] and peak[0] == 2
+        
+        # The caller gets control back at its deadline
+        gateway = LLMGateway(StubBackend(latency=0.5), timeout=0.1)
+        start = time.perf_counter()
+        try:
+            gateway.generate('slow')
+            assert False, 'slow call should time out'
+        except LLMTimeout:
+            pass
+        assert time.perf_counter() - start < 0.4
+        
+        # Three callers giving up on one shared slow call are one failure, not three
+        gateway = LLMGateway(StubBackend(lambda model, parts: 'late', latency=0.3), timeout=0.1, failure_threshold=3)
+        def give_up():
+            try:
+                gateway.generate('shared slow prompt')
+            except LLMTimeout:
+                pass
+        threads = [threading.Thread(target=give_up) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert gateway.stats()['timeouts'] == 1 and gateway.breaker.failures == 1
+        assert gateway.stats()['circuit'] == 'closed'
+        
+        # A call that times out and later succeeds does not close the circuit its timeout opened
+        gateway = LLMGateway(StubBackend(lambda model, parts: 'late', latency=0.2), timeout=0.05, failure_threshold=1)
+        give_up()
+        time.sleep(0.3)
+        assert gateway.stats()['in_flight'] == 0 and gateway.stats()['circuit'] == 'open'
+        
+        # Repeated failures open the circuit; after the reset period one trial call closes it again
+        now = [0.0]
+        failing = [True]
+        backend = StubBackend(lambda model, parts: RuntimeError('503') if failing[0] else 'ok')
+        gateway = LLMGateway(backend, timeout=1, failure_threshold=3, reset_seconds=30, clock=lambda: now[0])
+        for i in range(3):
+            try:
+                gateway.generate(f'p{i}')
+            except RuntimeError:
+                pass
+        try:
+            gateway.generate('p3')
+            assert False, 'open circuit should reject'
+        except LLMUnavailable:
+            pass
+        assert len(backend.calls) == 3 and gateway.stats()['circuit'] == 'open'
+        now[0] = 31
+        failing[0] = False
+        assert gateway.generate('p4') == 'ok' and gateway.stats()['circuit'] == 'closed'
+        print("✅ Calls are bounded, shared, deadline-limited and cut off by the breaker")
+        
+        # The discount calculator falls back when the gateway fails fast
+        calculator = SmartDiscountCalculator()
+        calculator.cache = None
+        calculator.llm = LLMGateway(StubBackend(lambda model, parts: RuntimeError('down')), timeout=1)
+        product = {'name': 'Shawl', 'category': 'clothing', 'price': 1000, 'stock_quantity': 20,
+                   'days_in_stock': 200, 'sales_velocity': 0.1}
+        result = calculator.calculate_discount(product, 0.2, {'recommended_festivals': []})
+        assert result['recommended_discount'] == 40 and len(result['sales_strategies']) == 4
+        calculator.llm = LLMGateway(StubBackend(lambda model, parts: '{"recommended_discount": 25, "reasoning_text": "r"}'))
+        result = calculator.calculate_discount(product, 0.2, {'recommended_festivals': []})
+        assert result['recommended_discount'] == 25 and result['reasoning'] == ['r']
+        print("✅ Discount calculator uses the gateway and keeps its fallback")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ LLM gateway test failed: {e}")
+        return False
+
+def test_discount_cache():
+    """Test the quantised-signature discount recommendation cache"""
+    print("\nTesting discount recommendation cache...")
+    
+    try:
+        import os
+        import tempfile
+        from models.discount_cache import DiscountCache, feature_signature
+        from models.discount_calculator import SmartDiscountCalculator
+        from models.llm_gateway import LLMGateway, StubBackend
+        
+        shawl = {'name': 'Pashmina Shawl', 'category': 'Clothing', 'price': 1000, 'stock_quantity': 20,
+                 'days_in_stock': 200, 'sales_velocity': 0.1}
+        scarf = {'name': 'Wool Scarf', 'category': 'clothing ', 'price': 950, 'stock_quantity': 5,
+                 'days_in_stock': 150, 'sales_velocity': 0.3}
+        festivals = {'recommended_festivals': [{'name': 'Diwali'}, {'name': 'Holi'}]}
+        
+        signature = feature_signature(shawl, 0.22, ['Holi', 'Diwali'])
+        assert signature == feature_signature(scarf, 0.27, ['diwali', 'Holi'])
+        assert signature != feature_signature(dict(shawl, price=2000), 0.22, ['Holi', 'Diwali'])
+        assert signature != feature_signature(shawl, 0.35, ['Holi', 'Diwali'])
+        assert signature != feature_signature(shawl, 0.22, ['Diwali'])
+        assert signature != feature_signature(dict(shawl, category='electronics'), 0.22, ['Holi', 'Diwali'])
+        assert feature_signature(dict(shawl, price=1200), 0.22, []) != feature_signature(shawl, 0.22, [])
+        assert feature_signature(dict(shawl, price=1200), 0.22, [], price_band=1.5) == \
+            feature_signature(shawl, 0.22, [], price_band=1.5), "bucket width is configurable"
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'discounts.db')
+            now = [1000.0]
+            backend = StubBackend(lambda model, parts: '{"recommended_discount": 35, "reasoning_text": "Clear it", '
+                                                       '"sales_strategies": [{"name": "Flash Sale", "description": "d"}]}')
+            calculator = SmartDiscountCalculator()
+            calculator.llm = LLMGateway(backend)
+            calculator.cache = DiscountCache(db_path, ttl_seconds=3600, clock=lambda: now[0])
+        
+            first = calculator.calculate_discount(shawl, 0.22, festivals)
+            second = calculator.calculate_discount(scarf, 0.27, festivals)
+            assert len(backend.calls) == 1 and not first['cached'] and second['cached']
+            assert first['recommended_discount'] == second['recommended_discount'] == 35
+            assert second['reasoning'] == ['Clear it'] and len(second['sales_strategies']) == 4
+            # A shared answer is written for the signature, not for the product that missed
+            prompt = backend.calls[0][1]
+            assert 'Pashmina' not in prompt and 'Days in Stock' not in prompt and 'Current Stock' not in prompt
+            assert 'clothing' in prompt.lower() and 'Price Range' in prompt and 'Diwali' in prompt
+            # Product-specific figures come from the product, not the cached answer
+            assert abs(second['new_price'] - 950 * 0.65) < 1e-9 and abs(second['expected_revenue'] - 950 * 0.65 * 5) < 1e-9
+        
+            # Survives a restart: a new cache on the same file still serves the answer
+            restarted = DiscountCache(db_path, ttl_seconds=3600, clock=lambda: now[0])
+            assert restarted.get(signature)['recommended_discount'] == 35
+        
+            now[0] += 3601
+            third = calculator.calculate_discount(scarf, 0.27, festivals)
+            assert not third['cached'] and len(backend.calls) == 2, "expired answers must be refreshed"
+        
+            # Fallback answers are not cached
+            calculator.llm = LLMGateway(StubBackend(lambda model, parts: RuntimeError('down')))
+            calculator.calculate_discount(dict(shawl, category='toys'), 0.22, festivals)
+            assert calculator.cache.get(feature_signature(dict(shawl, category='toys'), 0.22, ['Diwali', 'Holi'])) is None
+            stats = calculator.cache.stats()
+            assert stats['hits'] == 1 and stats['misses'] == 4 and stats['entries'] == 1
+        
+            # Without the cache the answer is the product's own, so the prompt names it
+            backend = StubBackend()
+            calculator.llm, calculator.cache = LLMGateway(backend), None
+            calculator.calculate_discount(shawl, 0.22, festivals)
+            assert 'Pashmina Shawl' in backend.calls[0][1] and 'Days in Stock: 200' in backend.calls[0][1]
+        print("✅ Similar products share a cached recommendation with their own prices")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Discount recommendation cache test failed: {e}")
+        return False
+
+def test_local_discount_model():
+    """Test the local discount model, its calibration and the quick discount path"""
+    print("\nTesting local discount model...")
+    
+    try:
+        import json
+        import os
+        import random
+        import tempfile
+        import time
+        import models.discount_model as discount_model
+        from models.discount_cache import DiscountCache
+        from models.discount_calculator import SmartDiscountCalculator
+        from models.discount_model import LocalDiscountModel, discount_features, read_discount_log, record_gemini_discount
+        from models.llm_gateway import LLMGateway, StubBackend
+        
+        model = LocalDiscountModel()
+        shawl = {'name': 'Shawl', 'category': 'clothing', 'price': 1000, 'stock_quantity': 20,
+                 'days_in_stock': 200, 'sales_velocity': 0.1}
+        discounts = [model.predict(shawl, health, []) for health in (0.1, 0.3, 0.5, 0.7, 0.9)]
+        assert discounts == sorted(discounts, reverse=True) and all(0 <= d <= 70 for d in discounts)
+        assert model.predict(shawl, 0.2, []) == model.predict(dict(shawl), 0.2, [])
+        assert model.predict(dict(shawl, stock_quantity=10 ** 9, days_in_stock=10 ** 6), 0.0, ['Diwali']) <= 70
+        assert model.predict({}, 1.0, []) >= 0
+        start = time.perf_counter()
+        for _ in range(1000):
+            model.predict(shawl, 0.2, ['Diwali'])
+        per_call_ms = (time.perf_counter() - start)
+        assert per_call_ms < 1.0, "a prediction should take well under a millisecond"
+        
+        # The synchronous answer: local discount with exact product figures, no Gemini call
+        backend = StubBackend()
+        calculator = SmartDiscountCalculator()
+        calculator.llm = LLMGateway(backend)
+        calculator.local_model = model
+        quick = calculator.quick_discount(shawl, 0.2, {'recommended_festivals': [{'name': 'Diwali'}]})
+        expected = model.predict(shawl, 0.2, ['Diwali'])
+        assert quick['recommended_discount'] == expected and not backend.calls
+        assert abs(quick['new_price'] - 1000 * (1 - expected / 100)) < 1e-9
+        assert abs(quick['expected_revenue'] - 20 * 1000 * (1 - expected / 100)) < 1e-9
+        assert quick['reasoning'] == [] and quick['sales_strategies'] == [] and quick['health_status'] == 'Dead Stock'
+        
+        # The background reasoning argues for that discount rather than choosing its own
+        backend = StubBackend(lambda model, parts: '{"reasoning_text": "Why this discount", '
+                                                   '"sales_strategies": [{"name": "Flash Sale", "description": "d"}]}')
+        calculator.llm = LLMGateway(backend)
+        explained = calculator.explain_discount(shawl, 0.2, {'recommended_festivals': [{'name': 'Diwali'}]}, expected)
+        assert len(backend.calls) == 1 and f'a {expected}% discount' in backend.calls[0][1]
+        assert explained['recommended_discount'] == expected and explained['reasoning'] == ['Why this discount']
+        assert len(explained['sales_strategies']) == 4
+        calculator.llm = LLMGateway(StubBackend(lambda model, parts: RuntimeError('down')))
+        explained = calculator.explain_discount(shawl, 0.2, {'recommended_festivals': []}, expected)
+        assert f'a {expected}% discount is recommended' in explained['reasoning'][0], "the fallback keeps the number too"
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            # Gemini's decisions are logged with their inputs...
+            log_path = os.path.join(tmp, 'discounts.jsonl')
+            original_log = discount_model.DISCOUNT_LOG
+            discount_model.DISCOUNT_LOG = log_path
+            try:
+                backend = StubBackend(lambda model, parts: '{"recommended_discount": 33}')
+                calculator.llm = LLMGateway(backend)
+                calculator.cache = DiscountCache(os.path.join(tmp, 'discounts.db'))
+                # A cached answer was chosen from the signature alone, so it is not a label...
+                calculator.calculate_discount(shawl, 0.2, {'recommended_festivals': [{'name': 'Diwali'}]})
+                assert not os.path.exists(log_path) and calculator.cache.stats()['entries'] == 1
+                # ...but a calibration call sees the product's own figures and skips the cache
+                calculator.cache = DiscountCache(os.path.join(tmp, 'calibration.db'))
+                calculator.calculate_discount(shawl, 0.2, {'recommended_festivals': [{'name': 'Diwali'}]}, False)
+                assert 'Days in Stock: 200' in backend.calls[-1][1]
+                assert calculator.cache.stats() == dict(calculator.cache.stats(), hits=0, misses=0, entries=0)
+            finally:
+                discount_model.DISCOUNT_LOG = original_log
+            logged = read_discount_log(log_path)
+            assert len(logged) == 1 and logged[0]['discount'] == 33 and logged[0]['festivals'] == ['Diwali']
+        
+            # ...and calibration fits the weights to them
+            rng = random.Random(0)
+            for _ in range(300):
+                product = {'price': rng.uniform(100, 5000), 'stock_quantity': rng.randint(1, 200),
+                           'days_in_stock': rng.randint(0, 600), 'sales_velocity': rng.uniform(0, 5)}
+                health, festivals = rng.random(), ['Holi'] if rng.random() < 0.5 else []
+                x = discount_features(product, health, festivals)
+                record_gemini_discount(product, health, festivals,
+                                       round(5 + 50 * x['risk'] + 3 * x['age'] + 4 * x['cover'] + 5 * x['festival']), log_path)
+            records = read_discount_log(log_path)[1:]
+            fitted = LocalDiscountModel.calibrate(records)
+            errors = [abs(fitted.predict(r['product'], r['health_score'], r['festivals']) - r['discount']) for r in records]
+            assert max(errors) <= 2, "calibration should recover the logged decision rule"
+            assert abs(fitted.weights['risk'] - 50) < 2 and fitted.calibrated_on == 300
+        
+            path = fitted.save(os.path.join(tmp, 'discount_model.json'))
+            loaded = LocalDiscountModel.load(path)
+            assert loaded.weights == json.load(open(path))['weights'] and loaded.calibrated_on == 300
+            assert LocalDiscountModel.load(os.path.join(tmp, 'missing.json')).weights == model.weights
+        print(f"✅ Local discount in {per_call_ms * 1000:.1f} µs; calibration recovers Gemini's logged rule")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Local discount model test failed: {e}")
+        return False
+
 def main():
     """Run all tests"""
     print("🧪 Dead Stock Intelligence - System Test")
@@ -183,7 +1638,32 @@ def main():
         test_product_health,
         test_festival_engine,
         test_discount_calculator,
-        test_location_service
+        test_location_service,
+        test_mask_cache,
+        test_birefnet_array_path,
+        test_batch_processor,
+        test_background_library,
+        test_fallback_removal,
+        test_job_queue,
+        test_guided_mask_upsampling,
+        test_recipe,
+        test_upload_guard,
+        test_output_encoder,
+        test_asset_store,
+        test_onnx_session,
+        test_quantized_model,
+        test_tiled_processing,
+        test_segmentation_cascade,
+        test_simple_auto_selection,
+        test_tone_pipeline,
+        test_multi_platform_crop,
+        test_pipeline_benchmark,
+        test_request_timing,
+        test_asset_references,
+        test_creative_cache,
+        test_llm_gateway,
+        test_discount_cache,
+        test_local_discount_model
     ]
     
     passed = 0